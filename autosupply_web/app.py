@@ -1,10 +1,10 @@
 from flask import Blueprint, render_template, request, jsonify
 from common.db_connection import get_connection
 from .services.config_util import get_arsjy04_table
-from datetime import datetime
-from .services.autosupply_service import chk_jyno, load_odflg
+from .services.autosupply_service import chk_jyno, load_odflg, bulk_apply_arsjy04
 from common.db_master_access import chk_cucd
 from common.cucd_logic import get_cucd_list, check_cucd
+from common.store_master import get_store_directory
 
 # Blueprint を定義
 autosupply_bp = Blueprint(
@@ -216,20 +216,9 @@ def api_check_cucd_bulk():
     if not items:
         return jsonify(invalid=[], valid=[])
 
-    # IN 句を動的に組み立て
-    placeholders = ",".join(["?"] * len(items))
-    sql = f"""
-        SELECT DISTINCT cucd
-        FROM Cusmf04
-        WHERE cukb = '0' 
-        AND cucd NOT IN (
-            SELECT cucd FROM DBA.closemf04 GROUP BY cucd)
-        AND cucd IN ({placeholders})
-    """
-    with get_connection("master") as conn:
-        cur = conn.cursor()
-        cur.execute(sql, items)
-        valid = { (row[0] or "").strip() for row in cur.fetchall() }
+    # 店舗マスタのキャッシュで判定 (閉店店舗は不正扱い)
+    stores = get_store_directory()
+    valid = {x for x in items if stores.lookup(x)}
 
     invalid = [x for x in items if x not in valid]
     return jsonify(invalid=invalid, valid=list(valid))
@@ -280,53 +269,10 @@ def api_bulk_apply_arsjy04():
     if not isinstance(items, list) or len(items) == 0:
         return jsonify(ok=False, error="items が空です"), 400
 
-    table = get_arsjy04_table()
-    inserted = 0
-    updated = 0
-    deleted = 0
-
+    # 1件ずつ問い合わせず、まとめて反映する (autosupply_service.bulk_apply_arsjy04)
     try:
         with get_connection("master") as conn:
-            cur = conn.cursor()
-            for it in items:
-                cucd = str(it.get("cucd", "")).strip()
-                jyno = str(it.get("jyno", "")).strip()
-                del_f = str(it.get("del", "")).strip()
-
-                def v1(x): return 'o' if str(x or '').strip() == '1' else ''
-                sun = v1(it.get("sun")); mon = v1(it.get("mon")); tue = v1(it.get("tue"))
-                wed = v1(it.get("wed")); thu = v1(it.get("thu")); fri = v1(it.get("fri")); sat = v1(it.get("sat"))
-
-                if del_f == "1":
-                    cur.execute(f"DELETE FROM {table} WHERE TRIM(cucd)=? AND TRIM(jyno)=?", (cucd, jyno))
-                    # rowcount が-1の環境向けの保険
-                    if getattr(cur, "rowcount", -1) > 0:
-                        deleted += 1
-                    else:
-                        cur.execute(f"SELECT 1 FROM {table} WHERE TRIM(cucd)=? AND TRIM(jyno)=?", (cucd, jyno))
-                        if cur.fetchone():
-                            # 存在していたのに消せなかったケースは異常だがスルー
-                            pass
-                else:
-                    cur.execute(f"SELECT COUNT(*) FROM {table} WHERE TRIM(cucd)=? AND TRIM(jyno)=?", (cucd, jyno))
-                    cnt = cur.fetchone()[0]
-                    now = datetime.now()
-                    ti = now.strftime("%H:%M:%S")
-                    dt = now.strftime("%Y-%m-%d")
-                    #print("jyno:", jyno, "cnt:", cnt, " ", sun, mon, tue, wed, thu, fri, sat)
-                    if cnt and int(cnt) > 0:
-                        cur.execute(
-                            f"UPDATE {table} SET sun=?, mon=?, tue=?, wed=?, thu=?, fri=?, sat=?, upti=?, updt=? WHERE TRIM(cucd)=? AND TRIM(jyno)=?",
-                            (sun, mon, tue, wed, thu, fri, sat, ti, dt, cucd, jyno)
-                        )
-                        updated += 1
-                    else:
-                        type_val = "004"
-                        cur.execute(
-                            f"INSERT INTO {table} (type, cucd, jyno, sun, mon, tue, wed, thu, fri, sat, upti, updt, rgdt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                            (type_val, cucd, jyno, sun, mon, tue, wed, thu, fri, sat, ti, dt, dt)
-                        )
-                        inserted += 1
+            counts = bulk_apply_arsjy04(items, conn)
             conn.commit()
     except Exception as e:
         try:
@@ -335,7 +281,7 @@ def api_bulk_apply_arsjy04():
             pass
         return jsonify(ok=False, error=str(e))
 
-    return jsonify(ok=True, inserted=inserted, updated=updated, deleted=deleted)
+    return jsonify(ok=True, inserted=counts["inserted"], updated=counts["updated"], deleted=counts["deleted"])
     
 
 # -------------------------
@@ -3,6 +3,7 @@
 #######################
 import pyodbc
 from common.db_connection import get_connection
+from common.db_bulk import code_key
 from .config_util import get_arsjy04_table
 from datetime import datetime
 
@@ -134,4 +135,121 @@ def insert_record(cucd: str, jyno: str, days: dict, conn=None):
     finally:
         if not outer_conn and conn:
             try: conn.close()
-            except Exception: pass
\ No newline at end of file
+            except Exception: pass
+
+# --- 一括登録 (アップロード画面の「登録しますか？⇒OK」) ---
+# (cucd=? AND jyno=?) を OR でつなぐ1回あたりの組数
+ARSJY04_PAIR_CHUNK = 250
+
+WEEK_COLS = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+
+
+def _pair_key(cucd, jyno):
+    return (code_key(cucd), code_key(jyno))
+
+
+def _pair_chunks(pairs):
+    for i in range(0, len(pairs), ARSJY04_PAIR_CHUNK):
+        chunk = pairs[i:i + ARSJY04_PAIR_CHUNK]
+        where = " OR ".join(["(cucd=? AND jyno=?)"] * len(chunk))
+        yield where, [v for pair in chunk for v in pair]
+
+
+def plan_bulk_apply(items, existing_keys):
+    """
+    明細 (items) を上から順に適用した結果を、DBへ問い合わせずにメモリ上で求める。
+    件数の数え方は従来の1件ずつの処理と同じ:
+      ・削除フラグ = '1' : その時点で存在すれば deleted +1
+      ・それ以外         : その時点で存在すれば updated +1、無ければ inserted +1
+    (同じ什器が2回出てくれば、1回目の登録を2回目が更新する、という具合)
+
+    戻り値: (deletes [(cucd, jyno)], updates [(曜日の値, cucd, jyno)], inserts [(曜日の値, cucd, jyno)], 件数 dict)
+    """
+    def v1(x): return 'o' if str(x or '').strip() == '1' else ''
+
+    present = {}          # {key: 今存在するか}
+    final = {}            # {key: (曜日の値 or None=削除, cucd, jyno)}
+    removed = set()       # 一度でも削除したもの (元の行を消してから登録し直す)
+    counts = {"inserted": 0, "updated": 0, "deleted": 0}
+
+    for it in items:
+        cucd = str(it.get("cucd", "")).strip()
+        jyno = str(it.get("jyno", "")).strip()
+        key = _pair_key(cucd, jyno)
+        exists = present.get(key, key in existing_keys)
+
+        if str(it.get("del", "")).strip() == "1":
+            if exists:
+                counts["deleted"] += 1
+                removed.add(key)
+            present[key] = False
+            final[key] = (None, cucd, jyno)
+        else:
+            week = tuple(v1(it.get(c)) for c in WEEK_COLS)
+            counts["updated" if exists else "inserted"] += 1
+            present[key] = True
+            final[key] = (week, cucd, jyno)
+
+    deletes, updates, inserts = [], [], []
+    for key, (week, cucd, jyno) in final.items():
+        existed = key in existing_keys
+        if existed and (week is None or key in removed):
+            deletes.append((cucd, jyno))
+        if week is None:
+            continue
+        if existed and key not in removed:
+            updates.append((week, cucd, jyno))
+        else:
+            inserts.append((week, cucd, jyno))
+    return deletes, updates, inserts, counts
+
+
+def bulk_apply_arsjy04(items, conn):
+    """
+    一括登録。1件ずつ「COUNT → UPDATE or INSERT (または DELETE)」していた処理を、
+      1. 対象の什器が既にあるかを (cucd=? AND jyno=?) OR ... でまとめて取得
+      2. 明細を順に適用した結果をメモリ上で求める (plan_bulk_apply)
+      3. 削除 → 更新 (同じ曜日パターンごとにまとめて) → 登録 (executemany) の順に反映
+    に置き換える。commit / rollback は呼び出し側で行う。
+    戻り値: {"inserted": n, "updated": n, "deleted": n}
+    """
+    from common.db_bulk import bulk_insert
+
+    tbl = get_arsjy04_table()
+    cur = conn.cursor()
+
+    pairs = list(dict.fromkeys(
+        (str(it.get("cucd", "")).strip(), str(it.get("jyno", "")).strip()) for it in items
+    ))
+    existing_keys = set()
+    for where, params in _pair_chunks(pairs):
+        cur.execute(f"SELECT cucd, jyno FROM {tbl} WHERE {where}", params)
+        existing_keys.update(_pair_key(r[0], r[1]) for r in cur.fetchall())
+
+    deletes, updates, inserts, counts = plan_bulk_apply(items, existing_keys)
+
+    now = datetime.now()
+    ti = now.strftime("%H:%M:%S")
+    dt = now.strftime("%Y-%m-%d")
+
+    for where, params in _pair_chunks(deletes):
+        cur.execute(f"DELETE FROM {tbl} WHERE {where}", params)
+
+    by_week = {}
+    for week, cucd, jyno in updates:
+        by_week.setdefault(week, []).append((cucd, jyno))
+    for week, week_pairs in by_week.items():
+        for where, params in _pair_chunks(week_pairs):
+            cur.execute(
+                f"UPDATE {tbl} SET sun=?, mon=?, tue=?, wed=?, thu=?, fri=?, sat=?, upti=?, updt=? WHERE {where}",
+                [*week, ti, dt, *params]
+            )
+
+    type_val = "004"
+    bulk_insert(
+        cur,
+        f"INSERT INTO {tbl} (type, cucd, jyno, sun, mon, tue, wed, thu, fri, sat, upti, updt, rgdt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(type_val, cucd, jyno, *week, ti, dt, dt) for week, cucd, jyno in inserts],
+        db_key="master",
+    )
+    return counts
@@ -0,0 +1,77 @@
+"""
+bench/_cart_result_data.py
+--------------------------
+cart_result のベンチマーク用データ (SQLite 上に作る)。
+
+・DBA.weekno2     : 2月末〜3月初の月曜日から始まる年度の週番号
+・CartStayCount   : 店舗 × 日 × 区分(1〜4) の台数
+・CartCategory    : 区分名
+・DBA.cusmf04 / DBA.closemf04 : 店舗マスタ (common.store_master が読む)
+"""
+
+import random
+from datetime import date, timedelta
+
+
+def fiscal_start(year):
+    """その年度の第1週の月曜日 (2月25日以降で最初の月曜日)"""
+    d = date(year, 2, 25)
+    return d + timedelta(days=(7 - d.weekday()) % 7)
+
+
+def week_rows(first_year, last_year):
+    rows = []
+    for year in range(first_year, last_year + 1):
+        start = fiscal_start(year)
+        end = fiscal_start(year + 1)
+        weekno = 1
+        d = start
+        while d < end:
+            rows.append((weekno, d, d + timedelta(days=6)))
+            weekno += 1
+            d += timedelta(days=7)
+    return rows
+
+
+def shop_codes(count):
+    codes = [f"B{i:02d}" for i in range(1, 11)]
+    codes += [str(100 + i) for i in range(count - len(codes))]
+    return codes
+
+
+def setup_cart_result(fake, year, shops=150, seed=1, fill_ratio=0.95):
+    """
+    year 年度 (と前年度末の1週間分) のデータを作る。戻り値: (店舗CDのリスト, 日数)
+    """
+    rnd = random.Random(seed)
+    weeks = week_rows(year - 1, year + 1)
+    codes = shop_codes(shops)
+
+    start = fiscal_start(year) - timedelta(days=7)
+    end = fiscal_start(year + 1) - timedelta(days=1)
+    counts = []
+    d = start
+    while d <= end:
+        for cucd in codes:
+            if rnd.random() > fill_ratio:
+                continue
+            for catcd in range(1, 5):
+                counts.append((cucd, d, catcd, rnd.randint(0, 30)))
+        d += timedelta(days=1)
+
+    fake.setup([
+        ("CREATE TABLE DBA.weekno2 (weekno INTEGER, date_s DATE, date_e DATE)",
+         "INSERT INTO DBA.weekno2 VALUES (?, ?, ?)", weeks),
+        ("CREATE TABLE DBA.CartStayCount (cucd TEXT, idleDate DATE, catcd INTEGER, count INTEGER, rgtm TIMESTAMP)",
+         "INSERT INTO DBA.CartStayCount (cucd, idleDate, catcd, count) VALUES (?, ?, ?, ?)", counts),
+        ("CREATE INDEX DBA.ix_cartstay ON CartStayCount (idleDate, catcd)", None, None),
+        ("CREATE INDEX DBA.ix_CartStayCount_rgtm ON CartStayCount (rgtm)", None, None),
+        ("CREATE TABLE DBA.CartCategory (catcd INTEGER, catname TEXT)",
+         "INSERT INTO DBA.CartCategory VALUES (?, ?)",
+         [(1, "青カゴ"), (2, "赤カゴ"), (3, "ドーリー"), (4, "その他")]),
+        ("CREATE TABLE DBA.cusmf04 (cucd TEXT, nmkj TEXT, cukb TEXT)",
+         "INSERT INTO DBA.cusmf04 VALUES (?, ?, ?)",
+         [(c, f"ジェーソン店舗{c}", "0") for c in codes + ["B78"]]),
+        ("CREATE TABLE DBA.closemf04 (cucd TEXT)", None, None),
+    ])
+    return codes, (end - start).days + 1
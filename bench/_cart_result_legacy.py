@@ -0,0 +1,701 @@
+"""
+bench/_cart_result_legacy.py
+----------------------------
+cart_result の Excel 出力の旧方式 (比較の基準として bench から使う)。
+
+・build_excel_workbook / create_excel_two_weeks
+    通常モードのブックに区分1シートを作り、copy_worksheet で4枚複製して
+    セルごとに値・書式を付ける (cart_result.app にあった実装)
+・build_sheet_values / summary_rows
+    {"店舗CD_YYYY-MM-DD": {...}} の辞書をセルごとに引いて値・合計・前週比を求める
+    (cart_result.excel_writer にあった実装)
+
+cart_result は write_cart_stay_excel (書き込み専用モード) と pivot (NumPy 配列) に切り替え済み。
+見た目・値が変わっていないかは bench_cart_result_excel.py / bench_cart_result_pivot.py で比較する。
+"""
+
+from datetime import date, timedelta
+
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Border, Side, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from common import cart_stay_summary
+from common.cucd_logic import get_cucd_master_tuple
+from common.db_connection import get_connection
+from cart_result.db import fetch_cart_stay_period, get_category_titles, get_period_calendar, get_week_calendar
+from cart_result.format_common import (
+    apply_common_format,
+    apply_borders,
+    apply_header_color,
+    apply_font_style,
+    apply_sunday_red
+)
+
+
+# ============================================================
+# 前週比の第1週分（7日前の合計）
+# ============================================================
+def fetch_daily_totals(start_date: date, end_date: date):
+    """
+    期間内の日別・区分別の合計を1回の SQL で取得し、
+    {date: {catcd: 合計}} の辞書で返す（catcd 1〜4 のみ）。
+    集計テーブル（common.cart_stay_summary）が有効ならそちらから読む。
+    """
+    with get_connection("SQLS08-14") as conn:
+        rows = cart_stay_summary.fetch_daily_totals(conn.cursor(), start_date, end_date)
+
+    daily_totals = {}
+    for d, catcd, total in rows:
+        if catcd in (1, 2, 3, 4):
+            daily_totals.setdefault(d, {})[catcd] = total
+
+    return daily_totals
+
+
+def fetch_prev_week_totals(days):
+    """
+    days（[(weekno, date), ...]）の先頭7日について、前週比に使う「7日前」の合計をまとめて取得する。
+    シート内に前週の列が無いのは先頭7日だけなので、その7日前の期間だけを1回で引く。
+    区分1〜4・合計の5シートで共有して使う（total_for_date_and_kbn で参照）。
+    """
+    if not days:
+        return {}
+    first = days[0][1] - timedelta(days=7)
+    last = days[min(6, len(days) - 1)][1] - timedelta(days=7)
+    return fetch_daily_totals(first, last)
+
+
+def total_for_date_and_kbn(daily_totals, target_date: date, kbn_no):
+    """
+    fetch_daily_totals / fetch_prev_week_totals の結果から、
+    指定日・区分の合計を返す（kbn_no: 1〜4 / "total"）。
+    """
+    cats = daily_totals.get(target_date, {})
+    if kbn_no == "total":
+        return sum(cats.get(cd, 0) for cd in (1, 2, 3, 4))
+    return cats.get(int(kbn_no), 0)
+
+
+# ============================================================
+# 辞書版の値・合計・前週比
+# ============================================================
+def build_sheet_values(days, shops, data_dict, kbn_no):
+    """
+    1シート分の値を [店舗][日] の2次元リストで返す (fill_values と同じ値)。
+    辞書版。cart_result は pivot.PivotSelection.rendered で求める。
+    kbn_no: 1〜4 → cat1〜cat4、"total" → cat1〜cat4 の合計。データが無い日は ""。
+    """
+    ymds = [date_obj.strftime("%Y-%m-%d") for weekno, date_obj in days]
+    values = []
+    for cucd, name in shops:
+        row = []
+        for ymd in ymds:
+            rec = data_dict.get(f"{cucd}_{ymd}")
+            if rec is None:
+                row.append("")
+            elif kbn_no == "total":
+                row.append(
+                    (rec.get("cat1") or 0) +
+                    (rec.get("cat2") or 0) +
+                    (rec.get("cat3") or 0) +
+                    (rec.get("cat4") or 0)
+                )
+            else:
+                raw = rec.get(f"cat{kbn_no}")
+                row.append(raw if raw is not None else "")
+        values.append(row)
+    return values
+
+
+def summary_rows(days, values, prev_total):
+    """
+    合計値行と前週比行を計算する (append_summary_rows と同じ値)。
+    辞書版。cart_result は pivot.PivotSelection.summary で求める。
+    前週の列がシート内に無い最初の7日分は、prev_total(日付-7日) で前週の合計を求める。
+    """
+    totals = [0] * len(days)
+    for row in values:
+        for i, v in enumerate(row):
+            if isinstance(v, (int, float)):
+                totals[i] += v
+
+    diffs = []
+    for i, (weekno, date_obj) in enumerate(days):
+        if i >= 7:
+            diffs.append(totals[i] - totals[i - 7])
+        else:
+            diffs.append(totals[i] - prev_total(date_obj - timedelta(days=7)))
+    return totals, diffs
+
+
+# ============================================================
+# ① レイアウト生成（値なし）
+# ============================================================
+def build_base_layout(ws, year, shop_master):
+    """
+    区分共通のレイアウト（値なし）を作成する
+    ・週番号（3行）
+    ・日付（4行）
+    ・曜日（5行・日曜赤）
+    ・店舗CD・店舗名（6行～）
+    """
+
+    # --- カレンダー情報取得 ---
+    days = get_week_calendar(year)
+
+    # --- 列開始位置 ---
+    col_start = 4
+    col_idx = col_start
+    prev_weekno = None
+    week_start_col = col_start
+
+    # --- 3〜5行目：週番号・日付・曜日 ---
+    for weekno, date_obj in days:
+        # 週番号セル結合
+        if weekno != prev_weekno:
+            if prev_weekno is not None:
+                ws.merge_cells(start_row=3, start_column=week_start_col,
+                               end_row=3, end_column=col_idx - 1)
+                ws.cell(row=3, column=week_start_col).value = f"第{prev_weekno}週"
+                ws.cell(row=3, column=week_start_col).alignment = Alignment(horizontal="center")
+            week_start_col = col_idx
+            prev_weekno = weekno
+
+        # 日付
+        c_date = ws.cell(row=4, column=col_idx)
+        c_date.value = date_obj                 # ← 年付き日付を入れる
+        c_date.number_format = "mm/dd"          # ← 表示形式で月日だけにする
+        c_date.alignment = Alignment(horizontal="center")
+
+        # 曜日
+        weekday = ["月", "火", "水", "木", "金", "土", "日"][date_obj.weekday()]
+        c = ws.cell(row=5, column=col_idx)
+        c.value = weekday
+        c.alignment = Alignment(horizontal="center")
+
+        col_idx += 1
+
+    # 最後の週番号セル結合
+    ws.merge_cells(start_row=3, start_column=week_start_col,
+                   end_row=3, end_column=col_idx - 1)
+    ws.cell(row=3, column=week_start_col).value = f"第{prev_weekno}週"
+    ws.cell(row=3, column=week_start_col).alignment = Alignment(horizontal="center")
+
+    # --- 列幅設定 ---
+    for c in range(col_start, col_idx):
+        ws.column_dimensions[get_column_letter(c)].width = 6
+
+    # --- 見出し行 ---
+    ws["B5"] = "店舗CD"
+    ws["C5"] = "店舗名"
+    ws.freeze_panes = "D6"
+
+    # --- 店舗CD・店舗名の枠だけ作る（値はのちほど fill_values で入れる） ---
+    row = 6
+    for cucd, name in shop_master:
+        if cucd == "B78":    # ★ 追加：B78 は出力しない
+            continue
+        ws.cell(row=row, column=2).value = cucd
+        ws.cell(row=row, column=3).value = name
+        row += 1
+
+    # --- 共通フォーマット ---
+    apply_common_format(ws, col_start, col_idx - 1)
+    apply_borders(ws, col_start, col_idx - 1)
+    apply_header_color(ws, col_start, col_idx - 1)
+    apply_font_style(ws)
+    apply_sunday_red(ws, col_start, col_idx - 1, days)
+
+    return days, col_start, col_idx
+
+
+# ============================================================
+# ② シートコピー
+# ============================================================
+def duplicate_sheet(wb, base_ws, title):
+    """区分1レイアウトシートをコピーして新規シートにする"""
+    new_ws = wb.copy_worksheet(base_ws)
+    new_ws.title = title
+    new_ws.freeze_panes = "D6"
+    return new_ws
+
+
+# ============================================================
+# ③ 値埋め込み（cat1〜4、合計）
+# ============================================================
+def fill_values(ws, days, shop_master, data_dict, kbn_no):
+    """
+    kbn_no:
+      1 → cat1
+      2 → cat2
+      3 → cat3
+      4 → cat4
+      "total" → cat1+cat2+cat3+cat4
+    """
+    col_start = 4
+    row_idx = 6
+
+    for cucd, name in shop_master:
+        if cucd == "B78":    # ★B78のデータは飛ばす
+            continue
+
+        for i, (weekno, date_obj) in enumerate(days):
+
+            col = col_start + i
+            ymd = date_obj.strftime("%Y-%m-%d")
+            key = f"{cucd}_{ymd}"
+
+            if key not in data_dict:
+                value = ""
+            else:
+                rec = data_dict[key]
+
+                if kbn_no == "total":
+                    value = (
+                        (rec.get("cat1") or 0) +
+                        (rec.get("cat2") or 0) +
+                        (rec.get("cat3") or 0) +
+                        (rec.get("cat4") or 0)
+                    )
+                else:
+                    raw = rec.get(f"cat{kbn_no}")
+                    value = raw if raw is not None else ""
+
+            ws.cell(row=row_idx, column=col).value = value
+
+        row_idx += 1
+
+# ============================================================
+# ④ 合計行、前週比行の設定
+# ============================================================
+def append_summary_rows(ws, days, col_start, col_end, year, kbn_no, prev_totals=None):
+    """
+    最下行の下に「合計値」「前週比」を追加する（前週が無い場合は SQL により取得）
+      prev_totals: fetch_prev_week_totals(days) の結果。全シートで共有する場合に渡す
+                   （省略時はこのシート用に1回だけ取得する）
+    """
+    if prev_totals is None:
+        prev_totals = fetch_prev_week_totals(days)
+
+    max_row = ws.max_row
+    sum_row = max_row + 1
+    diff_row = max_row + 2
+
+    # --- ラベル（B空欄、Cに名前） ---
+    ws.cell(row=sum_row, column=3).value = "合計値"
+    ws.cell(row=diff_row, column=3).value = "前週比"
+
+    ws.cell(row=sum_row, column=3).alignment = Alignment(horizontal="center")
+    ws.cell(row=diff_row, column=3).alignment = Alignment(horizontal="center")
+
+    # --------------------
+    # （1）合計値行
+    # --------------------
+    for i, (weekno, date_obj) in enumerate(days):
+        col = col_start + i
+        total = 0
+
+        for r in range(6, max_row + 1):
+            v = ws.cell(row=r, column=col).value
+            if isinstance(v, (int, float)):
+                total += v
+
+        ws.cell(row=sum_row, column=col).value = total
+        ws.cell(row=sum_row, column=col).alignment = Alignment(horizontal="right")
+
+    # -------------------- 
+    # （2）前週比行
+    # -------------------- 
+    for i, (weekno, date_obj) in enumerate(days):
+        col = col_start + i
+
+        cur_total = ws.cell(row=sum_row, column=col).value or 0
+
+        # 前週の列が存在する場合（同じ年度内で 7 列前にある）
+        prev_col = col - 7
+        if prev_col >= col_start:
+            prev_total = ws.cell(row=sum_row, column=prev_col).value or 0
+            diff = cur_total - prev_total
+
+            cell = ws.cell(row=diff_row, column=col)
+            cell.value = diff
+
+            if diff < 0:
+                cell.font = Font(color="FF0000")
+
+            cell.alignment = Alignment(horizontal="right")
+            continue
+
+        # --------------------------
+        # 前週が無い場合（第1週）
+        # → 日付-7日 の合計（prev_totals にまとめて取得済み）
+        # --------------------------
+        prev_date = date_obj - timedelta(days=7)
+        prev_total = total_for_date_and_kbn(prev_totals, prev_date, kbn_no)
+
+        diff = cur_total - prev_total
+
+        cell = ws.cell(row=diff_row, column=col)
+        cell.value = diff
+
+        if diff < 0:
+            cell.font = Font(color="FF0000")
+
+        cell.alignment = Alignment(horizontal="right")
+
+
+    # ============================================================
+    # (3) 見た目整形（罫線・色）
+    # ============================================================
+
+    # カラー
+    fill = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
+
+    # 最終列
+    last_col = col_end
+
+    # ------------------------------------------
+    # （A）合計行 ＆ 差分行 に色付け（B～最終列）
+    # ------------------------------------------
+    for col in range(2, last_col + 1):
+        ws.cell(row=sum_row,  column=col).fill = fill
+        ws.cell(row=diff_row, column=col).fill = fill
+
+    # ------------------------------------------
+    # （B）合計行の上を「二重罫線」にする
+    # ------------------------------------------
+    double = Side(style="double", color="000000")
+
+    for col in range(2, last_col + 1):
+        cell = ws.cell(row=sum_row, column=col)
+        cell.border = Border(
+            top=double,
+            left=cell.border.left,
+            right=cell.border.right,
+            bottom=cell.border.bottom
+        )
+
+    # ------------------------------------------
+    # （C）太枠を差分行まで伸ばす
+    # ------------------------------------------
+    thick = Side(style="thick", color="000000")
+
+    # 左枠(B列)
+    for row in range(3, diff_row + 1):
+        cell = ws.cell(row=row, column=2)
+        cell.border = Border(
+            left=thick,
+            top=cell.border.top,
+            bottom=cell.border.bottom,
+            right=cell.border.right
+        )
+
+    # 右枠（最終列）
+    for row in range(3, diff_row + 1):
+        cell = ws.cell(row=row, column=last_col)
+        cell.border = Border(
+            right=thick,
+            top=cell.border.top,
+            bottom=cell.border.bottom,
+            left=cell.border.left
+        )
+
+    # 上枠（3行目）→既存維持
+    # 下枠（差分行）
+    for col in range(2, last_col + 1):
+        cell = ws.cell(row=diff_row, column=col)
+        cell.border = Border(
+            bottom=thick,
+            left=cell.border.left,
+            right=cell.border.right,
+            top=cell.border.top
+        )
+
+    # ============================================================
+    # (4) 合計行・差分行 専用罫線
+    # ============================================================
+    thin = Side(style="dotted", color="000000")
+    medium = Side(style="medium", color="000000")
+
+    # ------------------------------------------
+    # （1）合計行（sum_row）と前週比行（diff_row）の間に 点線の横罫線
+    # ------------------------------------------
+    for col in range(2, last_col + 1):
+        cell = ws.cell(row=diff_row - 1, column=col)
+        cell.border = Border(
+            bottom=thin,
+            left=cell.border.left,
+            right=cell.border.right,
+            top=cell.border.top
+        )
+
+    # ------------------------------------------
+    # （2）合計行・前週比行の全曜日に 縦の点線（D列～最終列）
+    # ------------------------------------------
+    for col in range(col_start, last_col + 1):
+        # 合計行
+        cell = ws.cell(row=sum_row, column=col)
+        cell.border = Border(
+            left=thin,
+            right=thin,
+            top=cell.border.top,
+            bottom=cell.border.bottom
+        )
+
+        # 前週比行
+        cell = ws.cell(row=diff_row, column=col)
+        cell.border = Border(
+            left=thin,
+            right=thin,
+            top=cell.border.top,
+            bottom=cell.border.bottom
+        )
+
+    # ------------------------------------------
+    # （3）日曜 → 月曜 の境界に medium 線（縦）
+    # days: [(weekno, date), ...] の配列
+    # 曜日 index: 月=0, 火=1 ... 日=6
+    # ------------------------------------------
+    for i, (weekno, date_obj) in enumerate(days):
+        col = col_start + i
+        # 月曜列の場合のみ「その直前」が日曜
+        if date_obj.weekday() == 0 and col > col_start:
+            # 合計行
+            cell = ws.cell(row=sum_row, column=col)
+            cell.border = Border(
+                left=medium,
+                right=cell.border.right,
+                top=cell.border.top,
+                bottom=cell.border.bottom
+            )
+            # 前週比行
+            cell = ws.cell(row=diff_row, column=col)
+            cell.border = Border(
+                left=medium,
+                right=cell.border.right,
+                top=cell.border.top,
+                bottom=cell.border.bottom
+            )
+
+    # ============================================================
+    # (4) 最終：合計行の上に double 線を “再適用” （上書き保護）
+    #           合計行・差分行の最終列の右側に太線を強制適用
+    # ============================================================
+
+    double = Side(style="double", color="000000")
+
+    for col in range(2, last_col + 1):
+        cell = ws.cell(row=sum_row, column=col)
+
+        # 既存の左右・下線は保持しつつ、上だけ double にする
+        cell.border = Border(
+            top=double,
+            left=cell.border.left,
+            right=cell.border.right,
+            bottom=cell.border.bottom
+        )
+
+    thick = Side(style="thick", color="000000")
+
+    for row in (sum_row, diff_row):
+        cell = ws.cell(row=row, column=last_col)
+        cell.border = Border(
+            right=thick,
+            top=cell.border.top,
+            bottom=cell.border.bottom,
+            left=cell.border.left,
+        )
+
+# ============================================================
+# 共通 Excel 生成関数（旧方式：通常モードのブックを丸ごとメモリ上に作る）
+# ============================================================
+def build_excel_workbook(year, shop_master, data_dict):
+    wb = Workbook()
+    base_ws = wb.active
+    base_ws.title = "区分1"
+
+    # 区分名
+    title_map = get_category_titles()
+
+    # レイアウト作成
+    days, col_start, col_end = build_base_layout(base_ws, year, shop_master)
+
+    # タイトル
+    base_ws["B2"] = title_map[1]
+    base_ws["B2"].font = Font(name="Meiryo UI", size=14, bold=True)
+
+    unit_cell = base_ws.cell(row=2, column=col_end - 1)
+    unit_cell.value = "単位：台"
+    unit_cell.font = Font(name="Meiryo UI", size=11)
+    unit_cell.alignment = Alignment(horizontal="center")
+
+    # コピーして各シート作成
+    ws2 = duplicate_sheet(wb, base_ws, "区分2")
+    ws3 = duplicate_sheet(wb, base_ws, "区分3")
+    ws4 = duplicate_sheet(wb, base_ws, "区分4")
+    ws_total = duplicate_sheet(wb, base_ws, "滞留カゴ車台数実績表")
+
+    ws2["B2"] = title_map[2]
+    ws3["B2"] = title_map[3]
+    ws4["B2"] = title_map[4]
+    ws_total["B2"] = "滞留カゴ車台数実績表"
+
+    # 前週比の第1週分（7日前の合計）は5シートで共有
+    prev_totals = fetch_prev_week_totals(days)
+
+    # 値の埋め込み
+    fill_values(base_ws, days, shop_master, data_dict, 1)
+    append_summary_rows(base_ws, days, col_start, col_end - 1, year, 1, prev_totals)
+
+    fill_values(ws2, days, shop_master, data_dict, 2)
+    append_summary_rows(ws2, days, col_start, col_end - 1, year, 2, prev_totals)
+
+    fill_values(ws3, days, shop_master, data_dict, 3)
+    append_summary_rows(ws3, days, col_start, col_end - 1, year, 3, prev_totals)
+
+    fill_values(ws4, days, shop_master, data_dict, 4)
+    append_summary_rows(ws4, days, col_start, col_end - 1, year, 4, prev_totals)
+
+    fill_values(ws_total, days, shop_master, data_dict, "total")
+    append_summary_rows(ws_total, days, col_start, col_end - 1, year, "total", prev_totals)
+
+    return wb
+
+# ============================================================
+# Excel出力（2週間ファイル）
+# ============================================================
+def build_base_layout_period(ws, start_date, end_date, shop_master):
+    """
+    指定期間（start_date〜end_date）のみのレイアウトを作る。
+    ・週番号（必要な分だけ）
+    ・日付（期間の分だけ）
+    ・曜日
+    ・店舗CD・店舗名
+    """
+    # --------------------------
+    # ① 期間内の日付リスト作成
+    # --------------------------
+    days = get_period_calendar(start_date, end_date)
+
+    # --------------------------
+    # ② カレンダー描画（年度版と同じ方式）
+    # --------------------------
+    col_start = 4
+    col_idx = col_start
+    prev_weekno = None
+    week_start_col = col_start
+
+    for (weekno, date_obj) in days:
+        # 週番号セル結合
+        if weekno != prev_weekno:
+            if prev_weekno is not None:
+                ws.merge_cells(start_row=3, start_column=week_start_col,
+                               end_row=3, end_column=col_idx - 1)
+                ws.cell(row=3, column=week_start_col).value = f"第{prev_weekno}週"
+                ws.cell(row=3, column=week_start_col).alignment = Alignment(horizontal="center")
+            week_start_col = col_idx
+            prev_weekno = weekno
+
+        # 日付
+        c_date = ws.cell(row=4, column=col_idx)
+        c_date.value = date_obj
+        c_date.number_format = "mm/dd"
+        c_date.alignment = Alignment(horizontal="center")
+
+        # 曜日
+        weekday = ["月", "火", "水", "木", "金", "土", "日"][date_obj.weekday()]
+        c = ws.cell(row=5, column=col_idx)
+        c.value = weekday
+        c.alignment = Alignment(horizontal="center")
+
+        col_idx += 1
+
+    # 最後の週番号セル結合
+    ws.merge_cells(start_row=3, start_column=week_start_col,
+                   end_row=3, end_column=col_idx - 1)
+    ws.cell(row=3, column=week_start_col).value = f"第{prev_weekno}週"
+    ws.cell(row=3, column=week_start_col).alignment = Alignment(horizontal="center")
+
+    # 列幅
+    for c in range(col_start, col_idx):
+        ws.column_dimensions[get_column_letter(c)].width = 6
+
+    # 見出し
+    ws["B5"] = "店舗CD"
+    ws["C5"] = "店舗名"
+    ws.freeze_panes = "D6"
+
+    # 店舗一覧
+    row = 6
+    for cucd, name in shop_master:
+        if cucd == "B78":
+            continue
+        ws.cell(row=row, column=2).value = cucd
+        ws.cell(row=row, column=3).value = name
+        row += 1
+
+    # 共通フォーマット適用
+    apply_common_format(ws, col_start, col_idx - 1)
+    apply_borders(ws, col_start, col_idx - 1)
+    apply_header_color(ws, col_start, col_idx - 1)
+    apply_font_style(ws)
+    apply_sunday_red(ws, col_start, col_idx - 1, days)
+
+    return days, col_start, col_idx
+
+def create_excel_two_weeks():
+    today = date.today()
+    start_2w = today - timedelta(days=13)
+    end_2w   = today
+
+    # 店舗マスター
+    shop_master = get_cucd_master_tuple()
+
+    # 2週間分のデータ
+    data_dict = fetch_cart_stay_period(start_2w, end_2w)
+
+    # Excelブック生成
+    wb = Workbook()
+    ws_base = wb.active
+    ws_base.title = "区分1"
+
+    # ★ 2週間版のレイアウト（列が14列だけ）
+    days, col_start, col_end = build_base_layout_period(ws_base, start_2w, end_2w, shop_master)
+
+    # 区分タイトル
+    title_map = get_category_titles()
+
+    ws_base["B2"] = title_map[1]
+
+    # シート複製（区分2〜4 & 合計）
+    ws2 = duplicate_sheet(wb, ws_base, "区分2")
+    ws3 = duplicate_sheet(wb, ws_base, "区分3")
+    ws4 = duplicate_sheet(wb, ws_base, "区分4")
+    ws_total = duplicate_sheet(wb, ws_base, "滞留カゴ車台数実績表")
+
+    ws2["B2"] = title_map[2]
+    ws3["B2"] = title_map[3]
+    ws4["B2"] = title_map[4]
+    ws_total["B2"] = "滞留カゴ車台数実績表"
+
+    # 前週比の第1週分（7日前の合計）は5シートで共有
+    prev_totals = fetch_prev_week_totals(days)
+
+    # 値埋め込み
+    fill_values(ws_base, days, shop_master, data_dict, 1)
+    append_summary_rows(ws_base, days, col_start, col_end - 1, None, 1, prev_totals)
+
+    fill_values(ws2, days, shop_master, data_dict, 2)
+    append_summary_rows(ws2, days, col_start, col_end - 1, None, 2, prev_totals)
+
+    fill_values(ws3, days, shop_master, data_dict, 3)
+    append_summary_rows(ws3, days, col_start, col_end - 1, None, 3, prev_totals)
+
+    fill_values(ws4, days, shop_master, data_dict, 4)
+    append_summary_rows(ws4, days, col_start, col_end - 1, None, 4, prev_totals)
+
+    fill_values(ws_total, days, shop_master, data_dict, "total")
+    append_summary_rows(ws_total, days, col_start, col_end - 1, None, "total", prev_totals)
+
+    return wb
@@ -0,0 +1,228 @@
+"""
+bench/_sqlite_odbc.py
+---------------------
+ベンチマーク用: 本番DBの代わりに SQLite (メモリ上) へ接続させるための差し替え部品。
+
+・common.db_connection の pyodbc.connect を差し替え、get_connection() が SQLite を返すようにする
+・テーブルは "DBA" という名前で ATTACH したDBに作るので、DBA.xxx / xxx のどちらの書き方でも引ける
+・DATE / TIMESTAMP 型で宣言した列は date / datetime で返す
+・execute 1回ごとに latency_ms だけ待たせて、ネットワーク越しのDBの往復時間を再現する
+  (executemany は fast_executemany=True なら1往復、そうでなければ行数分の往復とみなす)
+
+本番のSQL (SQL Anywhere / SQL Server) と完全に同じ動きをするわけではないので、
+速度の比較 (往復回数の差) を見るためだけに使うこと。
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import time
+import types
+from decimal import Decimal
+
+# リポジトリ直下を import パスに追加 (main_server/main.py と同じ考え方)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+# pyodbc と同じく Decimal のパラメータを受け付ける (SQLite には数値として渡す)
+sqlite3.register_adapter(Decimal, float)
+
+_TABLE_HINT = re.compile(r"\s+WITH\s*\((?:UPDLOCK|HOLDLOCK|ROWLOCK|NOLOCK|,|\s)+\)", re.IGNORECASE)
+
+_MAIN_URI = "file:bench_main?mode=memory&cache=shared"
+_DBA_URI = "file:bench_dba?mode=memory&cache=shared"
+
+
+class Row:
+    """
+    pyodbc.Row と同様に、添字と列名 (row.cucd) の両方で読める行。
+    (tuple を継承すると row.count / row.index が tuple のメソッドになってしまうため、継承しない)
+    """
+
+    __slots__ = ("_values", "_names")
+
+    def __init__(self, values, names):
+        self._values = tuple(values)
+        self._names = names
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self._names[name.lower()]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, i):
+        return self._values[i]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(self._values)
+
+    def __repr__(self):
+        return repr(self._values)
+
+
+class Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._cur = conn.raw.cursor()
+        self.fast_executemany = False
+        self._names = None
+
+    def _wait(self, times=1):
+        if self._conn.latency:
+            time.sleep(self._conn.latency * times)
+
+    def _after_execute(self):
+        desc = self._cur.description
+        self._names = {d[0].lower(): i for i, d in enumerate(desc)} if desc else None
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        if " ".join(sql.split()).upper() == "SELECT CURRENT_TIMESTAMP":
+            # DB時刻の取得 (common.db_clock) は datetime で返す (SQLite は文字列で返すため)
+            sql = 'SELECT CURRENT_TIMESTAMP AS "ts [timestamp]"'
+        # SQL Anywhere の "CURRENT TIMESTAMP" は SQLite では CURRENT_TIMESTAMP
+        sql = sql.replace("CURRENT TIMESTAMP", "CURRENT_TIMESTAMP")
+        # SQLite の CAST(? AS DATE) は数値になってしまうので、'YYYY-MM-DD' の文字列のまま比べる
+        sql = sql.replace("CAST(? AS DATE)", "DATE(?)")
+        # SQL Server のテーブルヒントは SQLite には無い (1接続なのでロックも不要)
+        sql = _TABLE_HINT.sub("", sql)
+        self._wait()
+        self._conn.stats["executes"] += 1
+        self._cur.execute(sql, list(params))
+        self._after_execute()
+        return self
+
+    def executemany(self, sql, seq):
+        seq = [list(p) for p in seq]
+        self._wait(1 if self.fast_executemany else len(seq))
+        self._conn.stats["executemany"] += 1
+        self._conn.stats["executemany_rows"] += len(seq)
+        self._cur.executemany(sql.replace("CURRENT TIMESTAMP", "CURRENT_TIMESTAMP"), seq)
+        self._names = None
+
+    def _wrap(self, r):
+        return Row(r, self._names) if r is not None and self._names else r
+
+    def fetchone(self):
+        return self._wrap(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._wrap(r) for r in self._cur.fetchall()]
+
+    def fetchmany(self, size=1):
+        return [self._wrap(r) for r in self._cur.fetchmany(size)]
+
+    def __iter__(self):
+        for r in self._cur:
+            yield self._wrap(r)
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+
+class Connection:
+    def __init__(self, latency, stats):
+        self.raw = sqlite3.connect(_MAIN_URI, uri=True, check_same_thread=False,
+                                   detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        self.raw.execute(f"ATTACH DATABASE '{_DBA_URI}' AS DBA")
+        # SQL Anywhere の connection_property('number') (採番ロックの excluflg で使う)
+        self.raw.create_function("connection_property", 1, lambda name: 1)
+        self.latency = latency
+        self.stats = stats
+        self.autocommit = False
+
+    def cursor(self):
+        return Cursor(self)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+class FakeODBC:
+    """
+    pyodbc モジュールの代わり。install() で common.db_connection に差し込む。
+    """
+
+    Error = sqlite3.Error
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.stats = {"connects": 0, "executes": 0, "executemany": 0, "executemany_rows": 0}
+        # 共有メモリDBは接続が1本も無くなると消えるので、1本つないだままにしておく
+        self._keeper = Connection(0.0, self.stats)
+
+    def connect(self, conn_str, **kwargs):
+        self.stats["connects"] += 1
+        return Connection(self.latency, self.stats)
+
+    def setup(self, ddl_and_rows):
+        """
+        テーブル作成とデータ投入 (往復時間は待たない)。
+        ddl_and_rows: [(CREATE文, INSERT文 or None, 行のリスト), ...]
+        """
+        raw = self._keeper.raw
+        for ddl, insert, rows in ddl_and_rows:
+            raw.execute(ddl)
+            if insert and rows:
+                raw.executemany(insert, rows)
+        raw.commit()
+
+    def reset_stats(self):
+        for k in self.stats:
+            self.stats[k] = 0
+
+
+def install(latency_ms=0.0):
+    """
+    SQLite を返す pyodbc もどきを作り、common.db_connection が使うようにする。
+    common 配下のモジュールは、この関数を呼んだ後に import すること。
+    """
+    fake = FakeODBC(latency_ms)
+    module = types.ModuleType("pyodbc")
+    module.connect = fake.connect
+    module.Error = fake.Error
+
+    # pyodbc が入っていない環境でも common.db_connection を import できるようにする
+    sys.modules.setdefault("pyodbc", module)
+
+    from common import db_connection
+    db_connection.pyodbc = module
+    db_connection.close_all_pools()
+    return fake
+
+
+def timed(func, *args, **kwargs):
+    """(戻り値, 経過秒) を返す"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
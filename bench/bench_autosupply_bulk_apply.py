@@ -0,0 +1,182 @@
+"""
+bench/bench_autosupply_bulk_apply.py
+------------------------------------
+autosupply (発注曜日) の一括登録 (api_bulk_apply_arsjy04) を、
+従来の「明細1件ごとに COUNT → UPDATE or INSERT (または DELETE)」と、
+既存の什器をまとめて引いてから 削除 → 更新 → 登録 をまとめて行う方式 (bulk_apply_arsjy04) で比較する。
+
+    python bench/bench_autosupply_bulk_apply.py                 # 1k / 10k 件
+    python bench/bench_autosupply_bulk_apply.py --sizes 10000 --latency-ms 1.0
+    python bench/bench_autosupply_bulk_apply.py --fast-executemany
+
+・両方式で件数 (inserted / updated / deleted) と、テーブルの中身 (時刻の列を除く) が一致することを確認してから表示する
+・明細には 更新 / 新規 / 削除 / 無い什器の削除 / 同じ什器の2回目 (削除してから登録し直すものを含む) を混ぜる
+・master (SQL Anywhere) は既定では fast_executemany を使わないので、executemany も
+  行数分の往復として数える。--fast-executemany で DB_CONFIGS の FAST_EXECUTEMANY=True を想定した値を見る
+"""
+
+import argparse
+import random
+from datetime import datetime
+
+from _sqlite_odbc import install, timed
+
+STORE_COUNT = 200
+TABLE = "DBA.arsjy04"
+
+TABLES = [
+    """CREATE TABLE DBA.arsjy04 (type TEXT, cucd TEXT, jyno TEXT, sun TEXT, mon TEXT, tue TEXT,
+        wed TEXT, thu TEXT, fri TEXT, sat TEXT, upti TEXT, updt TEXT, rgdt TEXT)""",
+    "CREATE INDEX DBA.arsjy04_key ON arsjy04 (cucd, jyno)",
+]
+
+WEEK = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+
+
+def setup_tables(fake):
+    raw = fake._keeper.raw
+    for ddl in TABLES:
+        raw.execute(ddl)
+    raw.commit()
+
+
+def reset_table(fake, existing):
+    """店舗ごとに什器番号 10000〜 の existing 件を入れておく"""
+    rnd = random.Random(11)
+    raw = fake._keeper.raw
+    raw.execute(f"DELETE FROM {TABLE}")
+    raw.executemany(
+        f"INSERT INTO {TABLE} VALUES ('004', ?, ?, ?, ?, ?, ?, ?, ?, ?, '00:00:00', '2025-01-01', '2025-01-01')",
+        [(f"{i % STORE_COUNT:03d}", f"{10000 + i // STORE_COUNT:05d}",
+          *(rnd.choice(['o', '']) for _ in WEEK)) for i in range(existing)]
+    )
+    raw.commit()
+
+
+def make_items(size, existing, seed=9):
+    """画面から送られてくる items と同じ形の明細を作る"""
+    rnd = random.Random(seed)
+    items = []
+    for i in range(size):
+        r = rnd.random()
+        if r < 0.45:
+            n = rnd.randrange(existing)                       # 既存の什器を更新
+        elif r < 0.85:
+            n = existing + i                                  # 新規
+        else:
+            n = rnd.randrange(existing + size)                # 既存・新規・無い什器の削除
+        it = {"cucd": f"{n % STORE_COUNT:03d}", "jyno": f"{10000 + n // STORE_COUNT:05d}"}
+        it.update({c: rnd.choice(["1", ""]) for c in WEEK})
+        if r >= 0.85:
+            it["del"] = "1"
+        items.append(it)
+
+    # 同じ什器の2回目 (1回目の登録の更新・削除後の登録し直し)
+    for it in rnd.sample(items, size // 20):
+        again = dict(it, **{c: rnd.choice(["1", ""]) for c in WEEK})
+        again["del"] = "1" if rnd.random() < 0.3 else ""
+        items.append(again)
+    return items
+
+
+def snapshot(fake):
+    raw = fake._keeper.raw
+    return raw.execute(f"SELECT type, cucd, jyno, sun, mon, tue, wed, thu, fri, sat FROM {TABLE}"
+                       " ORDER BY cucd, jyno, sun, mon, tue, wed, thu, fri, sat").fetchall()
+
+
+def per_row_apply(get_connection, items):
+    """従来方式: 明細1件ごとに COUNT → UPDATE or INSERT (または DELETE)"""
+    table = TABLE
+    inserted = updated = deleted = 0
+    with get_connection("master") as conn:
+        cur = conn.cursor()
+        for it in items:
+            cucd = str(it.get("cucd", "")).strip()
+            jyno = str(it.get("jyno", "")).strip()
+            del_f = str(it.get("del", "")).strip()
+
+            def v1(x): return 'o' if str(x or '').strip() == '1' else ''
+            week = [v1(it.get(c)) for c in WEEK]
+
+            if del_f == "1":
+                cur.execute(f"DELETE FROM {table} WHERE TRIM(cucd)=? AND TRIM(jyno)=?", (cucd, jyno))
+                if getattr(cur, "rowcount", -1) > 0:
+                    deleted += 1
+            else:
+                cur.execute(f"SELECT COUNT(*) FROM {table} WHERE TRIM(cucd)=? AND TRIM(jyno)=?", (cucd, jyno))
+                cnt = cur.fetchone()[0]
+                now = datetime.now()
+                ti = now.strftime("%H:%M:%S")
+                dt = now.strftime("%Y-%m-%d")
+                if cnt and int(cnt) > 0:
+                    cur.execute(
+                        f"UPDATE {table} SET sun=?, mon=?, tue=?, wed=?, thu=?, fri=?, sat=?, upti=?, updt=? WHERE TRIM(cucd)=? AND TRIM(jyno)=?",
+                        (*week, ti, dt, cucd, jyno)
+                    )
+                    updated += 1
+                else:
+                    cur.execute(
+                        f"INSERT INTO {table} (type, cucd, jyno, sun, mon, tue, wed, thu, fri, sat, upti, updt, rgdt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        ("004", cucd, jyno, *week, ti, dt, dt)
+                    )
+                    inserted += 1
+        conn.commit()
+    return {"inserted": inserted, "updated": updated, "deleted": deleted}
+
+
+def bulk_apply(get_connection, service, items):
+    with get_connection("master") as conn:
+        counts = service.bulk_apply_arsjy04(items, conn)
+        conn.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--existing", type=int, default=20000, help="テーブルに最初から入れておく件数")
+    parser.add_argument("--latency-ms", type=float, default=0.2, help="1往復あたりの待ち時間(ミリ秒)")
+    parser.add_argument("--fast-executemany", action="store_true",
+                        help="master で fast_executemany を使う設定 (FAST_EXECUTEMANY=True) を想定する")
+    args = parser.parse_args()
+
+    fake = install(args.latency_ms)
+
+    from common.db_connection import DB_CONFIGS, get_connection
+    from autosupply_web.services import autosupply_service as service
+
+    if args.fast_executemany:
+        DB_CONFIGS.setdefault("master", {})["FAST_EXECUTEMANY"] = True
+    # テストモードの設定 (config_util) に関係なく、同じテーブルで比べる
+    service.get_arsjy04_table = lambda: TABLE
+
+    setup_tables(fake)
+
+    print(f"latency={args.latency_ms}ms  existing={args.existing}  fast_executemany={args.fast_executemany}")
+    print(f"{'items':>7} | {'ins':>6} {'upd':>6} {'del':>6} | {'per-row(s)':>10} {'trips':>7} | {'bulk(s)':>8} {'trips':>7} | {'speedup':>7}")
+
+    for size in args.sizes:
+        items = make_items(size, args.existing)
+
+        reset_table(fake, args.existing)
+        fake.reset_stats()
+        counts_old, t_old = timed(per_row_apply, get_connection, items)
+        trips_old = fake.stats["executes"] + fake.stats["executemany_rows"]
+        old = snapshot(fake)
+
+        reset_table(fake, args.existing)
+        fake.reset_stats()
+        counts_new, t_new = timed(bulk_apply, get_connection, service, items)
+        many_trips = fake.stats["executemany"] if args.fast_executemany else fake.stats["executemany_rows"]
+        trips_new = fake.stats["executes"] + many_trips
+        new = snapshot(fake)
+
+        assert counts_old == counts_new, (counts_old, counts_new)
+        assert old == new, "per-row と bulk で登録結果が異なります"
+        print(f"{len(items):>7} | {counts_new['inserted']:>6} {counts_new['updated']:>6} {counts_new['deleted']:>6} | "
+              f"{t_old:>10.3f} {trips_old:>7} | {t_new:>8.3f} {trips_new:>7} | {t_old / t_new:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
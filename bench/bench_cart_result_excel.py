@@ -0,0 +1,161 @@
+"""
+bench/bench_cart_result_excel.py
+--------------------------------
+滞留カゴ車台数実績表 (年度版) の Excel 生成を、
+旧方式 (_cart_result_legacy.build_excel_workbook: 通常モード + copy_worksheet + セルごとの書式付け) と
+新方式 (app.write_cart_stay_excel: 書き込み専用モード + 共有スタイル) で比較する。
+
+    python bench/bench_cart_result_excel.py                 # 150店舗 × 1年度
+    python bench/bench_cart_result_excel.py --shops 300 --no-verify
+
+・時間とピークメモリ (RSS) は、方式ごとに別プロセスで測る
+・--verify (既定) の場合、両方のファイルを開き直して全セルの値・書式・結合・列幅を比較する
+"""
+
+import argparse
+from copy import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+YEAR = 2025
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KB、macOS は byte
+        return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    except (ImportError, AttributeError):
+        return float("nan")
+
+
+def run_one(mode, shops, path):
+    """子プロセス側: 1方式だけ実行して結果をJSONで出力する"""
+    sys.path.insert(0, HERE)
+    from _sqlite_odbc import install
+    from _cart_result_data import setup_cart_result
+
+    fake = install()
+    setup_cart_result(fake, YEAR, shops=shops)
+
+    from cart_result import app, db
+    from common.cucd_logic import get_cucd_master_tuple
+    import _cart_result_legacy as legacy
+
+    shop_master = get_cucd_master_tuple()
+    data_dict = db.fetch_cart_stay_all(YEAR)
+    base_rss = peak_rss_mb()
+
+    started = time.perf_counter()
+    if mode == "legacy":
+        wb = legacy.build_excel_workbook(YEAR, shop_master, data_dict)
+        wb.save(path)
+    else:
+        days = db.get_week_calendar(YEAR)
+        app.write_cart_stay_excel(path, days, shop_master, app.load_pivot_for_days(days),
+                                  db.get_category_titles(), app.UNIT_LABEL)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "seconds": elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "before_rss_mb": base_rss,
+        "size_kb": os.path.getsize(path) / 1024,
+    }))
+
+
+def compare(path_a, path_b):
+    """2つのブックの見た目 (値・書式・結合・列幅・固定枠) を比較し、違いのリストを返す"""
+    from openpyxl import load_workbook
+    from openpyxl.utils import get_column_letter
+
+    wa = load_workbook(path_a)
+    wb = load_workbook(path_b)
+    diffs = []
+    if wa.sheetnames != wb.sheetnames:
+        return [f"シート名: {wa.sheetnames} != {wb.sheetnames}"]
+
+    for name in wa.sheetnames:
+        a, b = wa[name], wb[name]
+        if a.freeze_panes != b.freeze_panes:
+            diffs.append(f"{name}: freeze_panes {a.freeze_panes} != {b.freeze_panes}")
+        if set(map(str, a.merged_cells.ranges)) != set(map(str, b.merged_cells.ranges)):
+            diffs.append(f"{name}: 結合セルが異なる")
+        for col in range(1, max(a.max_column, b.max_column) + 1):
+            letter = get_column_letter(col)
+            if a.column_dimensions[letter].width != b.column_dimensions[letter].width:
+                diffs.append(f"{name}: 列幅 {letter}")
+        if a.row_dimensions[2].height != b.row_dimensions[2].height:
+            diffs.append(f"{name}: 2行目の高さ")
+
+        coords = set(a._cells) | set(b._cells)
+        for rc in sorted(coords):
+            ca, cb = a.cell(*rc), b.cell(*rc)
+            for attr in ("value", "font", "border", "fill", "alignment", "number_format"):
+                # 書式は StyleProxy で返るので、copy() で中身を取り出してから比べる
+                va, vb = getattr(ca, attr), getattr(cb, attr)
+                if attr not in ("value", "number_format"):
+                    va, vb = copy(va), copy(vb)
+                if va != vb:
+                    if attr == "value":
+                        diffs.append(f"{name}!{ca.coordinate} value: {va!r} != {vb!r}")
+                    else:
+                        diffs.append(f"{name}!{ca.coordinate} {attr} が異なる")
+                    break
+            if len(diffs) > 20:
+                return diffs
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shops", type=int, default=150)
+    parser.add_argument("--no-verify", action="store_true")
+    parser.add_argument("--mode", choices=["legacy", "stream"], help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_one(args.mode, args.shops, args.out)
+        return
+
+    tmp = tempfile.mkdtemp()
+    results = {}
+    paths = {}
+    for mode in ("legacy", "stream"):
+        paths[mode] = os.path.join(tmp, f"{mode}.xlsx")
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--shops", str(args.shops), "--out", paths[mode]],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"{YEAR}年度 × {args.shops}店舗 × 5シート")
+    print(f"{'mode':>7} | {'seconds':>8} | {'peak RSS(MB)':>12} | {'(before)':>8} | {'size(KB)':>8}")
+    for mode, r in results.items():
+        print(f"{mode:>7} | {r['seconds']:>8.2f} | {r['peak_rss_mb']:>12.1f} | {r['before_rss_mb']:>8.1f} | {r['size_kb']:>8.0f}")
+    print(f"speedup: {results['legacy']['seconds'] / results['stream']['seconds']:.1f}x")
+
+    if not args.no_verify:
+        diffs = compare(paths["legacy"], paths["stream"])
+        if diffs:
+            print("見た目の差分あり:")
+            for d in diffs:
+                print("  " + d)
+            sys.exit(1)
+        print("verify: 全セルの値・書式が一致")
+
+
+if __name__ == "__main__":
+    main()
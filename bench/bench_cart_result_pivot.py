@@ -0,0 +1,93 @@
+"""
+bench/bench_cart_result_pivot.py
+--------------------------------
+滞留カゴ車台数実績表 (年度版・5シート) の値・合計値行・前週比行の計算を、
+従来の辞書版 (fetch_cart_stay_all の {"店舗CD_YYYY-MM-DD": {...}} をセルごとに引く) と
+配列版 (cart_result.pivot: 店舗 × 日 × 区分 の NumPy 配列) で比較する。
+
+    python bench/bench_cart_result_pivot.py                  # 50 / 150 / 300 店舗
+    python bench/bench_cart_result_pivot.py --shops 150 --repeat 5
+
+・どちらも「DBから読む → 5シート分の値・合計・前週比を作る」までを測る (Excel の書き出しは含まない)
+・両方の結果が一致することを確認してから表示する
+"""
+
+import argparse
+
+from _sqlite_odbc import install, timed
+from _cart_result_data import setup_cart_result
+
+YEAR = 2025
+KBN_LIST = [1, 2, 3, 4, "total"]
+
+
+def dict_path(db, legacy, days, shops):
+    """従来方式: 辞書を作り、セルごとに日付文字列のキーで引いて合計する"""
+    data_dict = db.fetch_cart_stay_all(YEAR)
+    prev_totals = legacy.fetch_prev_week_totals(days)
+    result = {}
+    for kbn_no in KBN_LIST:
+        values = legacy.build_sheet_values(days, shops, data_dict, kbn_no)
+        totals, diffs = legacy.summary_rows(
+            days, values, lambda d, k=kbn_no: legacy.total_for_date_and_kbn(prev_totals, d, k)
+        )
+        result[kbn_no] = (values, totals, diffs)
+    return result
+
+
+def pivot_path(app, days, shops):
+    """配列版: 1回だけ配列を作り、全シート分を配列の演算で求める"""
+    pivot = app.load_pivot_for_days(days)
+    selection = pivot.select([cucd for cucd, name in shops], [d for w, d in days])
+    prev_week = pivot.day_totals(selection.prev_week_dates())
+    result = {}
+    for kbn_no in KBN_LIST:
+        totals, diffs = selection.summary(kbn_no, prev_week)
+        result[kbn_no] = (selection.rendered(kbn_no), totals, diffs)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shops", type=int, nargs="+", default=[50, 150, 300])
+    parser.add_argument("--repeat", type=int, default=3, help="各方式の実行回数 (最速値を表示)")
+    args = parser.parse_args()
+
+    fake = install()
+
+    print(f"{YEAR}年度 × 5シート (値・合計値・前週比)")
+    print(f"{'shops':>6} | {'rows':>8} | {'dict(s)':>8} | {'pivot(s)':>8} | {'speedup':>7}")
+
+    for shops in args.shops:
+        # 店舗数ごとにデータを作り直す (import 前に install 済みなので、テーブルだけ入れ替える)
+        fake._keeper.raw.executescript(
+            "DROP TABLE IF EXISTS DBA.weekno2; DROP TABLE IF EXISTS DBA.CartStayCount;"
+            "DROP TABLE IF EXISTS DBA.CartCategory; DROP TABLE IF EXISTS DBA.cusmf04;"
+            "DROP TABLE IF EXISTS DBA.closemf04;"
+        )
+        setup_cart_result(fake, YEAR, shops=shops)
+
+        from cart_result import app, db, excel_writer, fiscal_calendar
+        from common.cucd_logic import get_cucd_master_tuple
+        from common.store_master import invalidate_store_master
+        import _cart_result_legacy as legacy
+        fiscal_calendar.invalidate_fiscal_calendar()
+        invalidate_store_master()
+
+        shop_list = excel_writer.export_shops(get_cucd_master_tuple())
+        days = db.get_week_calendar(YEAR)
+        row_count = fake._keeper.raw.execute("SELECT COUNT(*) FROM DBA.CartStayCount").fetchone()[0]
+
+        t_dict = t_pivot = None
+        for _ in range(args.repeat):
+            old, t = timed(dict_path, db, legacy, days, shop_list)
+            t_dict = t if t_dict is None else min(t_dict, t)
+            new, t = timed(pivot_path, app, days, shop_list)
+            t_pivot = t if t_pivot is None else min(t_pivot, t)
+
+        assert old == new, "辞書版と配列版で結果が異なります"
+        print(f"{shops:>6} | {row_count:>8} | {t_dict:>8.3f} | {t_pivot:>8.3f} | {t_dict / t_pivot:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
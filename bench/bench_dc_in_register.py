@@ -0,0 +1,212 @@
+"""
+bench/bench_dc_in_register.py
+-----------------------------
+dc_in の伝票登録 (insert_voucher_data) を、
+従来の「明細1行ごとに INSERT・伝票1枚ごとに採番ロック」と、
+パラメータを先に作ってテーブルごとに executemany する方式で比較する。
+
+    python bench/bench_dc_in_register.py                  # 1k / 10k 行
+    python bench/bench_dc_in_register.py --sizes 1000 --latency-ms 1.0
+    python bench/bench_dc_in_register.py --fast-executemany
+
+・両方式で登録された行 (時刻の列を除く) が一致することを確認してから表示する
+・master (SQL Anywhere) は既定では fast_executemany を使わないので、executemany も
+  行数分の往復として数える。--fast-executemany で DB_CONFIGS の FAST_EXECUTEMANY=True を想定した値を見る
+・業務時間チェック (check_business_time) は時刻に関係なく通す
+"""
+
+import argparse
+import datetime
+import random
+from itertools import groupby
+
+from _sqlite_odbc import install, timed
+
+VENDOR_COUNT = 20
+DEPT_COUNT = 5
+
+TABLES = [
+    "CREATE TABLE DBA.ctlmf (deno_j TEXT)",
+    "CREATE TABLE DBA.henctlmf (hendeno_j TEXT)",
+    "CREATE TABLE DBA.excluflg (flg_deno INTEGER)",
+    """CREATE TABLE DBA.dcnyu03 (deno TEXT, no INTEGER, cucd TEXT, bucd TEXT, vecd TEXT, dldt TEXT,
+        cocd TEXT, odsu REAL, dltn REAL, prtn REAL, md REAL, dc REAL, thrflg TEXT, sign TEXT,
+        rgdt TEXT, upti TEXT, oddt TEXT, trdk TEXT, updt TEXT)""",
+    """CREATE TABLE DBA.dcneb (deno TEXT, deno11 TEXT, no TEXT, cucd TEXT, bucd TEXT, vecd TEXT,
+        dldt TEXT, oddt TEXT, trdk TEXT, cocd TEXT, odsu REAL, dltn REAL, md REAL, dc REAL,
+        nebtan REAL, nebkn REAL, thrflg TEXT, conf TEXT, sign TEXT, rgdt_k TEXT, updt_k TEXT, upti_k TEXT)""",
+    """CREATE TABLE DBA.dc_batch_log (batch_id TEXT, user_id TEXT, deno_main TEXT, deno_neb TEXT,
+        center TEXT, rgdt TIMESTAMP)""",
+]
+
+# 比較する列 (登録時刻の列は除く)
+SNAPSHOT_SQL = [
+    "SELECT deno, no, cucd, bucd, vecd, dldt, cocd, odsu, dltn, prtn, md, dc, thrflg, sign, trdk"
+    " FROM DBA.dcnyu03 ORDER BY deno, no",
+    "SELECT deno, no, cucd, bucd, vecd, dldt, cocd, odsu, dltn, prtn, md, dc, thrflg, sign, trdk"
+    " FROM DBA.dcnyu04 ORDER BY deno, no",
+    "SELECT deno, deno11, no, cucd, bucd, vecd, dldt, trdk, cocd, odsu, dltn, md, dc, nebtan, nebkn,"
+    " thrflg, conf, sign FROM DBA.dcneb ORDER BY deno, no",
+    "SELECT batch_id, user_id, deno_main, deno_neb, center FROM DBA.dc_batch_log ORDER BY deno_main",
+    "SELECT deno_j FROM DBA.ctlmf",
+    "SELECT hendeno_j FROM DBA.henctlmf",
+]
+
+
+def setup_tables(fake):
+    raw = fake._keeper.raw
+    for ddl in TABLES:
+        raw.execute(ddl)
+    raw.execute(TABLES[3].replace("dcnyu03", "dcnyu04"))
+    raw.commit()
+
+
+def reset_tables(fake):
+    raw = fake._keeper.raw
+    for table in ("dcnyu03", "dcnyu04", "dcneb", "dc_batch_log", "ctlmf", "henctlmf", "excluflg"):
+        raw.execute(f"DELETE FROM DBA.{table}")
+    raw.execute("INSERT INTO DBA.ctlmf VALUES ('999000')")     # 途中で 999999 → 000001 に戻る
+    raw.execute("INSERT INTO DBA.henctlmf VALUES ('39900')")   # 途中で 39999 → 00001 に戻る
+    raw.execute("INSERT INTO DBA.excluflg VALUES (NULL)")
+    raw.commit()
+
+
+def snapshot(fake):
+    raw = fake._keeper.raw
+    return [raw.execute(sql).fetchall() for sql in SNAPSHOT_SQL]
+
+
+def make_data_list(lines, seed=3):
+    """process_upload_csv の戻り値と同じ形 ([VoucherLine, ...]) の行を作る"""
+    from common.dc_in_line import VoucherLine
+
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(lines):
+        qty = 24 * rnd.randint(1, 5)
+        rows.append(VoucherLine(
+            center_code=rnd.choice(['D03', 'D04']),
+            delivery_date=rnd.choice(['2025/04/01', '2025/04/02']),
+            vendor_code=f"{1000 + rnd.randrange(VENDOR_COUNT)}",
+            vendor_name="取引先",
+            dept_code=f"{rnd.randint(1, DEPT_COUNT):02d}",
+            dept_name="部門",
+            item_code=f"{4900000 + i}",
+            jan="49" + str(4900000 + i),
+            item_name=f"商品{i}",
+            spec="100g",
+            manufacturer="メーカー",
+            qty_loose=qty,
+            cases=qty // 24,
+            fee_md="1.5",
+            fee_dc="2.0",
+            cost_unit=rnd.choice(["98.5", "120", "1250.75"]),
+            disc_unit=rnd.choice(["0", "0", "0", "5", "0.35"]),
+            pass_flag=rnd.choice(['0', '1']),
+        ))
+    return rows
+
+
+def per_row_insert(logic, data_list, user_id, batch_id):
+    """従来方式: 伝票1枚ごとに採番ロック、明細1行ごとに INSERT"""
+    conn = logic.get_connection('master', shared=False)
+    cursor = conn.cursor()
+    total_vouchers = 0
+    try:
+        key_func = lambda x: (x.vendor_code, x.delivery_date, x.center_name, x.dept_code)
+        data_list.sort(key=key_func)
+        for (v_code, d_date, center_name, dept_code), items in groupby(data_list, key=key_func):
+            items = sorted(items, key=lambda x: x.item_code)
+            target_table = "DBA.dcnyu03" if "守谷" in center_name else "DBA.dcnyu04"
+            center_code_db = "D03" if "守谷" in center_name else "D04"
+            today_str = datetime.datetime.now().strftime('%Y/%m/%d')
+            now_time_str = datetime.datetime.now().strftime('%H:%M:%S')
+
+            for start_idx in range(0, len(items), 6):
+                chunk_items = items[start_idx:start_idx + 6]
+                main_voucher_id = logic._get_next_number_real(cursor, 'purchase')
+                for line_no, line in enumerate(chunk_items, start=1):
+                    cursor.execute(logic.SQL_INSERT_VOUCHER.format(table=target_table), [
+                        main_voucher_id, line_no, center_code_db, dept_code, v_code, d_date,
+                        line.item_code, line.cases, line.cost_unit, line.disc_total,
+                        line.fee_md, line.fee_dc, line.pass_flag, user_id, today_str, now_time_str,
+                        today_str, '11', today_str,
+                    ])
+                total_vouchers += 1
+
+                created_discount_id = None
+                if sum(x.disc_total for x in chunk_items) > 0:
+                    discount_voucher_id = logic._get_next_number_real(cursor, 'discount')
+                    created_discount_id = discount_voucher_id
+                    line_no_neb = 1
+                    for line in chunk_items:
+                        if line.disc_total > 0:
+                            cursor.execute(logic.SQL_INSERT_DISCOUNT, [
+                                discount_voucher_id, main_voucher_id, str(line_no_neb),
+                                center_code_db, dept_code, v_code, d_date, today_str, '13',
+                                line.item_code, line.qty_loose, line.cost_unit, line.fee_md, line.fee_dc,
+                                line.neb_unit, line.disc_total,
+                                '', '1', user_id, today_str, today_str, now_time_str,
+                            ])
+                            line_no_neb += 1
+
+                cursor.execute(logic.SQL_INSERT_BATCH_LOG, [
+                    batch_id, user_id, main_voucher_id, created_discount_id, center_code_db,
+                ])
+        conn.commit()
+        return f"登録完了: {total_vouchers}件の伝票を作成しました。"
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--latency-ms", type=float, default=0.2, help="1往復あたりの待ち時間(ミリ秒)")
+    parser.add_argument("--fast-executemany", action="store_true",
+                        help="master で fast_executemany を使う設定 (FAST_EXECUTEMANY=True) を想定する")
+    args = parser.parse_args()
+
+    fake = install(args.latency_ms)
+
+    from common import dc_in_db_logic as logic
+    from common.db_connection import DB_CONFIGS
+
+    if args.fast_executemany:
+        DB_CONFIGS.setdefault("master", {})["FAST_EXECUTEMANY"] = True
+    logic.check_business_time = lambda mode='normal': None
+
+    setup_tables(fake)
+
+    print(f"latency={args.latency_ms}ms  fast_executemany={args.fast_executemany}")
+    print(f"{'lines':>7} | {'vouchers':>8} | {'per-row(s)':>10} {'trips':>7} | {'bulk(s)':>8} {'trips':>7} | {'speedup':>7}")
+
+    for lines in args.sizes:
+        data = make_data_list(lines)
+
+        reset_tables(fake)
+        fake.reset_stats()
+        msg_old, t_old = timed(per_row_insert, logic, list(data), "bench", "B1")
+        trips_old = fake.stats["executes"] + fake.stats["executemany_rows"]
+        old = snapshot(fake)
+
+        reset_tables(fake)
+        fake.reset_stats()
+        msg_new, t_new = timed(logic.insert_voucher_data, list(data), "bench", "B1")
+        many_trips = fake.stats["executemany"] if args.fast_executemany else fake.stats["executemany_rows"]
+        trips_new = fake.stats["executes"] + many_trips
+        new = snapshot(fake)
+
+        assert msg_old == msg_new, (msg_old, msg_new)
+        assert old == new, "per-row と bulk で登録結果が異なります"
+
+        vouchers = len(new[3])
+        print(f"{lines:>7} | {vouchers:>8} | {t_old:>10.3f} {trips_old:>7} | {t_new:>8.3f} {trips_new:>7} | {t_old / t_new:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+bench/bench_dc_in_upload.py
+---------------------------
+dc_in の CSVアップロード時のマスタチェックを、
+従来の「1行ごとに3回 SELECT」と、まとめて IN (...) で引く方式で比較する。
+
+    python bench/bench_dc_in_upload.py                   # 1k / 10k / 50k 行
+    python bench/bench_dc_in_upload.py --sizes 1000 --latency-ms 1.0
+
+DBは SQLite (メモリ上) で代用し、--latency-ms で1往復あたりの待ち時間を加える。
+"""
+
+import argparse
+import random
+
+from _sqlite_odbc import install, timed
+
+ITEM_COUNT = 20000
+VENDOR_COUNT = 300
+DEPT_COUNT = 40
+
+
+def build_master(fake, seed=1):
+    rnd = random.Random(seed)
+    items = [f"{4900000 + i}" for i in range(ITEM_COUNT)]
+    vendors = [f"{1000 + i}" for i in range(VENDOR_COUNT)]
+    depts = [f"{i:02d}" for i in range(1, DEPT_COUNT + 1)]
+
+    fake.setup([
+        ("CREATE TABLE DBA.comf1 (cocd TEXT PRIMARY KEY, hnam TEXT, kika TEXT, mnam TEXT)",
+         "INSERT INTO DBA.comf1 VALUES (?, ?, ?, ?)",
+         [(c, f"商品{c}", "100g", "メーカー") for c in items]),
+        ("CREATE TABLE DBA.comf204 (cocd TEXT PRIMARY KEY, bucd TEXT, janc TEXT, irsu INTEGER)",
+         "INSERT INTO DBA.comf204 VALUES (?, ?, ?, ?)",
+         [(c, rnd.choice(depts), "49" + c, rnd.choice([6, 12, 24])) for c in items]),
+        ("CREATE TABLE DBA.venmf (vecd TEXT PRIMARY KEY, nmkj TEXT)",
+         "INSERT INTO DBA.venmf VALUES (?, ?)",
+         [(v, f"取引先{v}") for v in vendors]),
+        ("CREATE TABLE DBA.nammf04 (bucd TEXT, brcd TEXT, nmkj TEXT)",
+         "INSERT INTO DBA.nammf04 VALUES (?, ?, ?)",
+         [(d, "00", f"部門{d}") for d in depts]),
+    ])
+    return items, vendors
+
+
+def make_csv(lines, items, vendors, seed=2):
+    rnd = random.Random(seed)
+    rows = []
+    for _ in range(lines):
+        rows.append([
+            rnd.choice(["D03", "D04"]), "2025/04/01", rnd.choice(vendors), "0", "0",
+            rnd.choice(items), str(24 * rnd.randint(1, 5)), "98.5", "", "0",
+        ])
+    return rows
+
+
+def per_row_lookups(cursor, csv_rows):
+    """従来方式: 1行ごとに商品・取引先・部門を SELECT する"""
+    sql_item = """
+        SELECT M1.hnam, M1.kika, M1.mnam, M2.bucd, M2.janc, M2.irsu
+        FROM DBA.comf1 M1
+        LEFT JOIN DBA.comf204 M2 ON M1.cocd = M2.cocd
+        WHERE M1.cocd = ?
+    """
+    sql_vendor = "SELECT nmkj FROM DBA.venmf WHERE vecd = ?"
+    sql_dept = "SELECT nmkj FROM DBA.nammf04 WHERE bucd = ? AND brcd = '00'"
+
+    result = []
+    for row in csv_rows:
+        cursor.execute(sql_item, [row[5]])
+        item_res = cursor.fetchone()
+        cursor.execute(sql_vendor, [row[2]])
+        v_res = cursor.fetchone()
+        cursor.execute(sql_dept, [(item_res[3] if item_res else None) or "00"])
+        d_res = cursor.fetchone()
+        result.append((tuple(item_res) if item_res else None,
+                       v_res[0] if v_res else None,
+                       d_res[0] if d_res else ""))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--latency-ms", type=float, default=0.2, help="1往復あたりの待ち時間(ミリ秒)")
+    args = parser.parse_args()
+
+    fake = install(args.latency_ms)
+
+    from common.db_connection import get_connection
+    from common import dc_in_db_logic as logic
+    from common.db_bulk import code_key
+
+    items, vendors = build_master(fake)
+
+    print(f"latency={args.latency_ms}ms  items={ITEM_COUNT} vendors={VENDOR_COUNT}")
+    print(f"{'lines':>7} | {'per-row(s)':>10} {'queries':>8} | {'bulk(s)':>8} {'queries':>8} | {'speedup':>7} | {'upload total(s)':>15}")
+
+    for lines in args.sizes:
+        csv_rows = make_csv(lines, items, vendors)
+
+        conn = get_connection("master")
+        cursor = conn.cursor()
+        try:
+            fake.reset_stats()
+            old, t_old = timed(per_row_lookups, cursor, csv_rows)
+            q_old = fake.stats["executes"]
+
+            fake.reset_stats()
+            (item_map, vendor_map, dept_map), t_new = timed(logic._load_upload_masters, cursor, csv_rows)
+            q_new = fake.stats["executes"]
+        finally:
+            cursor.close()
+            conn.close()
+
+        # 結果が同じであることを確認
+        new = []
+        for row in csv_rows:
+            item_res = item_map.get(code_key(row[5]))
+            v_res = vendor_map.get(code_key(row[2]))
+            d_res = dept_map.get(code_key((item_res[3] if item_res else None) or "00"))
+            new.append((item_res, v_res[0] if v_res else None, d_res[0] if d_res else ""))
+        assert old == new, "per-row と bulk で結果が異なります"
+
+        (processed, errors), t_total = timed(logic.process_upload_csv, csv_rows)
+        assert not errors and len(processed) == lines, errors[:5]
+
+        print(f"{lines:>7} | {t_old:>10.3f} {q_old:>8} | {t_new:>8.3f} {q_new:>8} | {t_old / t_new:>6.1f}x | {t_total:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
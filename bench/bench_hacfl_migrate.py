@@ -0,0 +1,138 @@
+"""
+bench/bench_hacfl_migrate.py
+----------------------------
+hacfl (発注CSV取込) の本登録 (migrate_work_to_main) の処理件数を測る。
+従来の「件数を数える → INSERT ... SELECT を1本 → 削除」と、
+行番号の範囲で分割して登録し、ドライバの登録件数で確かめる方式を比べる。
+
+    python bench/bench_hacfl_migrate.py                    # 10k / 50k / 100k 行
+    python bench/bench_hacfl_migrate.py --rows 200000 --chunk-rows 50000
+
+・両方式で登録先 (DBA.hacflr) の中身が一致することを確認してから表示する
+・comf204 に同じ商品CDが2行ある場合に、登録が取り消されることも確認する
+・業務時間チェック (check_time_and_get_config) は時刻に関係なく通す
+"""
+
+import argparse
+import random
+
+from _sqlite_odbc import install, timed
+
+ITEM_COUNT = 20000
+
+TABLES = [
+    "CREATE TABLE DBA.comf204 (cocd TEXT PRIMARY KEY, bucd TEXT, irsu INTEGER, btan REAL)",
+    """CREATE TABLE DBA.hacfl04_work (batch_id TEXT, line_num INTEGER, cucd TEXT, cocd TEXT,
+        odsu INTEGER, oddt DATE, dldt DATE, updt DATE, err_msg TEXT)""",
+    "CREATE INDEX DBA.hacfl04_work_batch ON hacfl04_work (batch_id, line_num)",
+    """CREATE TABLE DBA.hacflr (edpno INTEGER, type TEXT, cucd TEXT, cocd TEXT, bucd TEXT,
+        odsu INTEGER, oddt DATE, dldt DATE)""",
+]
+
+
+def setup_tables(fake):
+    raw = fake._keeper.raw
+    for ddl in TABLES:
+        raw.execute(ddl)
+    raw.executemany("INSERT INTO DBA.comf204 VALUES (?, ?, 12, 100)",
+                    [(f"{49000000 + i}", f"{i % 30:02d}") for i in range(ITEM_COUNT)])
+    raw.commit()
+
+
+def load_batch(fake, batch_id, rows, seed=7):
+    rnd = random.Random(seed)
+    params = [
+        (batch_id, i, f"{rnd.randrange(300):03d}", f"{49000000 + rnd.randrange(ITEM_COUNT + 100)}",
+         rnd.randint(1, 50), None, "2025-04-02", "2025-04-01", "")
+        for i in range(1, rows + 1)
+    ]
+    raw = fake._keeper.raw
+    raw.execute("DELETE FROM DBA.hacfl04_work")
+    raw.execute("DELETE FROM DBA.hacflr")
+    raw.executemany("INSERT INTO DBA.hacfl04_work VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", params)
+    raw.commit()
+
+
+def snapshot(fake):
+    raw = fake._keeper.raw
+    return raw.execute("SELECT edpno, type, cucd, cocd, bucd, odsu, oddt, dldt FROM DBA.hacflr"
+                       " ORDER BY cucd, cocd").fetchall()
+
+
+def single_statement(logic, batch_id, mode):
+    """従来方式: 件数を数えてから INSERT ... SELECT を1本"""
+    config = logic.MODE_CONFIG[mode]
+    conn = logic.get_connection(logic.TARGET_DB)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM DBA.hacfl04_work WHERE batch_id = ?", (batch_id,))
+        row_count = cursor.fetchone()[0]
+        cursor.execute(f"""
+            INSERT INTO {config['table']}
+            (edpno, type, cucd, cocd, bucd, odsu, oddt, dldt)
+            SELECT
+                NULL, '004', w.cucd, w.cocd, c2.bucd, w.odsu, w.oddt, w.dldt
+            FROM DBA.hacfl04_work w
+            LEFT JOIN DBA.comf204 c2 ON w.cocd = c2.cocd
+            WHERE w.batch_id = ?
+        """, (batch_id,))
+        cursor.execute("DELETE FROM DBA.hacfl04_work WHERE batch_id = ?", (batch_id,))
+        conn.commit()
+        return True, "本登録完了", row_count
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--chunk-rows", type=int, default=None, help="MIGRATE_CHUNK_ROWS を変えて測る")
+    parser.add_argument("--latency-ms", type=float, default=0.2, help="1往復あたりの待ち時間(ミリ秒)")
+    args = parser.parse_args()
+
+    fake = install(args.latency_ms)
+
+    from common import hacfl_db_logic as logic
+
+    if args.chunk_rows:
+        logic.MIGRATE_CHUNK_ROWS = args.chunk_rows
+    logic.check_time_and_get_config = lambda mode: (True, "", logic.MODE_CONFIG[mode])
+
+    setup_tables(fake)
+
+    print(f"latency={args.latency_ms}ms  chunk_rows={logic.MIGRATE_CHUNK_ROWS}")
+    print(f"{'rows':>7} | {'single(s)':>9} {'rows/s':>9} | {'chunked(s)':>10} {'rows/s':>9} {'trips':>5} | {'reported':>8}")
+
+    for rows in args.rows:
+        load_batch(fake, "B1", rows)
+        _, t_old = timed(single_statement, logic, "B1", "normal")
+        old = snapshot(fake)
+
+        load_batch(fake, "B1", rows)
+        fake.reset_stats()
+        (ok, msg, count), t_new = timed(logic.migrate_work_to_main, "B1", "normal")
+        trips = fake.stats["executes"]
+        new = snapshot(fake)
+
+        assert ok and count == rows, (ok, msg, count)
+        assert old == new, "single と chunked で登録結果が異なります"
+        print(f"{rows:>7} | {t_old:>9.3f} {rows / t_old:>9.0f} | {t_new:>10.3f} {rows / t_new:>9.0f} {trips:>5} | {count:>8}")
+
+    # comf204 に同じ商品CDが2行あると登録件数が増えるので、取り消されること
+    raw = fake._keeper.raw
+    load_batch(fake, "B1", 1000)
+    first_cocd = raw.execute("SELECT cocd FROM DBA.hacfl04_work WHERE line_num = 1").fetchone()[0]
+    raw.execute("CREATE TABLE DBA.comf204_dup AS SELECT * FROM DBA.comf204")
+    raw.execute("DROP TABLE DBA.comf204")
+    raw.execute("ALTER TABLE DBA.comf204_dup RENAME TO comf204")
+    raw.execute("INSERT INTO DBA.comf204 VALUES (?, '99', 6, 50)", (first_cocd,))
+    raw.commit()
+    ok, msg, count = logic.migrate_work_to_main("B1", "normal")
+    left = raw.execute("SELECT COUNT(*) FROM DBA.hacfl04_work").fetchone()[0]
+    assert not ok and snapshot(fake) == [] and left == 1000, (ok, msg, left)
+    print(f"comf204 duplicate -> rolled back: {msg}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+bench/bench_hacfl_validation.py
+-------------------------------
+hacfl (発注CSV取込) の作業テーブルのチェック (exec_db_validation) を、
+従来の「チェック項目ごとに UPDATE (10本前後)」と、1本の UPDATE にまとめた方式で比較する。
+
+    python bench/bench_hacfl_validation.py                 # 50k 行
+    python bench/bench_hacfl_validation.py --rows 10000 50000 --latency-ms 1.0
+
+・両方式で作業テーブルの err_msg が全行一致することを確認してから表示する
+・通常予約 (normal) / 朝締め (morning) の両モードを測る
+・SQLite の実行計画は SQL Anywhere と異なるので、差の大きさは目安として見ること
+"""
+
+import argparse
+import random
+from datetime import timedelta
+
+from _sqlite_odbc import install, timed
+
+STORE_COUNT = 300
+ITEM_COUNT = 20000
+
+TABLES = [
+    "CREATE TABLE DBA.cusmf04 (cucd TEXT PRIMARY KEY, nmkj TEXT)",
+    "CREATE TABLE DBA.comf1 (cocd TEXT PRIMARY KEY, hnam TEXT, mnam TEXT)",
+    """CREATE TABLE DBA.hacfl04_work (batch_id TEXT, line_num INTEGER, cucd TEXT, cocd TEXT,
+        odsu INTEGER, oddt DATE, dldt DATE, updt DATE, err_msg TEXT)""",
+    "CREATE INDEX DBA.hacfl04_work_batch ON hacfl04_work (batch_id, line_num)",
+]
+
+
+def setup_tables(fake):
+    raw = fake._keeper.raw
+    for ddl in TABLES:
+        raw.execute(ddl)
+    raw.executemany("INSERT INTO DBA.cusmf04 VALUES (?, '店舗')", [(f"{i:03d}",) for i in range(STORE_COUNT)])
+    raw.executemany("INSERT INTO DBA.comf1 VALUES (?, '商品', 'メーカー')",
+                    [(f"{49000000 + i}",) for i in range(ITEM_COUNT)])
+    raw.commit()
+
+
+def load_batch(fake, batch_id, rows, today, mode, seed=5):
+    """
+    作業テーブルに rows 行を入れる (1〜2割ほどの行に何かしらのエラーを混ぜる)
+    朝締めは parse_and_insert_work と同じく発注日を入れない
+    """
+    rnd = random.Random(seed)
+    params = []
+    for i in range(1, rows + 1):
+        cucd = f"{rnd.randrange(STORE_COUNT):03d}"
+        cocd = f"{49000000 + rnd.randrange(ITEM_COUNT)}"
+        odsu = rnd.randint(1, 50)
+        oddt = today + timedelta(days=1)
+        dldt = today + timedelta(days=2)
+
+        r = rnd.random()
+        if r < 0.02:
+            cucd = "9" + cucd[1:] if rnd.random() < 0.5 else cucd[:2] + " "
+        elif r < 0.04:
+            cocd = f"{59000000 + i}"
+        elif r < 0.06:
+            odsu = 0
+        elif r < 0.08:
+            dldt = today - timedelta(days=1)
+        elif r < 0.10:
+            oddt = today + timedelta(days=45)
+        elif r < 0.12:
+            oddt, dldt = dldt, oddt
+        elif r < 0.14:
+            oddt = None
+
+        if mode == 'morning':
+            oddt = None
+
+        params.append((batch_id, i, cucd, cocd, odsu, oddt, dldt, today, ''))
+
+    raw = fake._keeper.raw
+    raw.execute("DELETE FROM DBA.hacfl04_work")
+    raw.executemany("INSERT INTO DBA.hacfl04_work VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", params)
+    raw.commit()
+
+
+def reset_errors(fake):
+    raw = fake._keeper.raw
+    raw.execute("UPDATE DBA.hacfl04_work SET err_msg = ''")
+    raw.commit()
+
+
+def snapshot(fake):
+    raw = fake._keeper.raw
+    return raw.execute("SELECT line_num, err_msg FROM DBA.hacfl04_work ORDER BY line_num").fetchall()
+
+
+def per_rule_validation(logic, cursor, batch_id, mode):
+    """従来方式: チェック項目ごとに UPDATE"""
+    now = logic.get_db_server_time()
+    today_str = now.strftime('%Y-%m-%d')
+    limit_str = (now.date() + timedelta(days=40)).strftime('%Y-%m-%d')
+
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [店舗マスタ未登録]' WHERE batch_id = ? AND cucd NOT IN (SELECT cucd FROM DBA.cusmf04)", (batch_id,))
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [商品マスタ未登録]' WHERE batch_id = ? AND cocd NOT IN (SELECT cocd FROM DBA.comf1)", (batch_id,))
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [店舗CDスペース不可]' WHERE batch_id = ? AND cucd LIKE '% %'", (batch_id,))
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [発注数0]' WHERE batch_id = ? AND odsu = 0", (batch_id,))
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [納品日が過去]' WHERE batch_id = ? AND dldt IS NOT NULL AND dldt < CAST(? AS DATE)", (batch_id, today_str))
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [納品日が40日以上先]' WHERE batch_id = ? AND dldt IS NOT NULL AND dldt > CAST(? AS DATE)", (batch_id, limit_str))
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [発注日が過去]' WHERE batch_id = ? AND oddt IS NOT NULL AND oddt < CAST(? AS DATE)", (batch_id, today_str))
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [発注日が40日以上先]' WHERE batch_id = ? AND oddt IS NOT NULL AND oddt > CAST(? AS DATE)", (batch_id, limit_str))
+    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [納品日は発注日の翌日以降]' WHERE batch_id = ? AND oddt IS NOT NULL AND dldt IS NOT NULL AND oddt >= dldt", (batch_id,))
+    if mode == 'morning':
+        cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [朝締めは発注日指定不可]' WHERE batch_id = ? AND oddt IS NOT NULL", (batch_id,))
+
+
+def run(logic, validate, batch_id, mode):
+    conn = logic.get_connection(logic.TARGET_DB)
+    cursor = conn.cursor()
+    try:
+        validate(cursor, batch_id, mode)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[50000])
+    parser.add_argument("--latency-ms", type=float, default=0.2, help="1往復あたりの待ち時間(ミリ秒)")
+    args = parser.parse_args()
+
+    fake = install(args.latency_ms)
+
+    from common import hacfl_db_logic as logic
+
+    setup_tables(fake)
+    today = logic.get_db_server_time().date()
+
+    print(f"latency={args.latency_ms}ms")
+    print(f"{'rows':>7} | {'mode':>7} | {'errors':>6} | {'per-rule(s)':>11} {'trips':>5} | {'single(s)':>9} {'trips':>5} | {'speedup':>7}")
+
+    for rows in args.rows:
+        for mode in ("normal", "morning"):
+            load_batch(fake, "B1", rows, today, mode)
+            fake.reset_stats()
+            _, t_old = timed(run, logic, lambda c, b, m: per_rule_validation(logic, c, b, m), "B1", mode)
+            trips_old = fake.stats["executes"]
+            old = snapshot(fake)
+
+            reset_errors(fake)
+            fake.reset_stats()
+            _, t_new = timed(run, logic, logic.exec_db_validation, "B1", mode)
+            trips_new = fake.stats["executes"]
+            new = snapshot(fake)
+
+            assert old == new, "per-rule と single で err_msg が異なります"
+
+            errors = sum(1 for _, msg in new if msg)
+            print(f"{rows:>7} | {mode:>7} | {errors:>6} | {t_old:>11.3f} {trips_old:>5} | {t_new:>9.3f} {trips_new:>5} | {t_old / t_new:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,457 +1,77 @@
 # =======================================================
 # 必要な import（順番が超重要）
 # =======================================================
-from . import db
-from flask import render_template, request, send_file
-from openpyxl import Workbook
+from flask import render_template, request, send_file, Response, stream_with_context, jsonify, url_for
 from datetime import date, timedelta
-import os
-import tempfile
+from urllib.parse import quote
+import io
+import gzip
+import hashlib
+import json
+import zipfile
 
 from . import cart_result_bp
 
 # 共通ロジック
 from common.cucd_logic import get_cucd_master_tuple
-from .db import fetch_cart_stay_all, get_week_calendar
-from .db import fetch_total_for_date_and_kbn, fetch_cart_stay_period
-from .db import get_category_titles
-
-# 既存のフォーマット系
-from .format_common import (
-    apply_common_format,
-    apply_borders,
-    apply_header_color,
-    apply_font_style,
-    apply_sunday_red
+from common.cart_stay_cache import get_cart_stay_cache
+from .db import get_week_calendar
+from .db import get_category_titles, get_period_calendar
+from .db import load_cart_stay_pivot, fetch_week_totals, get_weeks_between
+from .db import fetch_cart_stay_version
+from .export_jobs import artifact_key, get_export_job_store
+from .pivot import CartStayPivot
+from .excel_writer import (
+    new_workbook,
+    export_shops,
+    write_sheet,
 )
 
-from openpyxl.styles import Alignment, Border, Side, Font, Color, PatternFill
-from openpyxl.utils import get_column_letter
-
-# ============================================================
-# ① レイアウト生成（値なし）
-# ============================================================
-def build_base_layout(ws, year, shop_master):
-    """
-    区分共通のレイアウト（値なし）を作成する
-    ・週番号（3行）
-    ・日付（4行）
-    ・曜日（5行・日曜赤）
-    ・店舗CD・店舗名（6行～）
-    """
-
-    # --- カレンダー情報取得 ---
-    days = get_week_calendar(year)
-
-    # --- 列開始位置 ---
-    col_start = 4
-    col_idx = col_start
-    prev_weekno = None
-    week_start_col = col_start
-
-    # --- 3〜5行目：週番号・日付・曜日 ---
-    for weekno, date_obj in days:
-        # 週番号セル結合
-        if weekno != prev_weekno:
-            if prev_weekno is not None:
-                ws.merge_cells(start_row=3, start_column=week_start_col,
-                               end_row=3, end_column=col_idx - 1)
-                ws.cell(row=3, column=week_start_col).value = f"第{prev_weekno}週"
-                ws.cell(row=3, column=week_start_col).alignment = Alignment(horizontal="center")
-            week_start_col = col_idx
-            prev_weekno = weekno
-
-        # 日付
-        c_date = ws.cell(row=4, column=col_idx)
-        c_date.value = date_obj                 # ← 年付き日付を入れる
-        c_date.number_format = "mm/dd"          # ← 表示形式で月日だけにする
-        c_date.alignment = Alignment(horizontal="center")
-
-        # 曜日
-        weekday = ["月", "火", "水", "木", "金", "土", "日"][date_obj.weekday()]
-        c = ws.cell(row=5, column=col_idx)
-        c.value = weekday
-        c.alignment = Alignment(horizontal="center")
-
-        col_idx += 1
-
-    # 最後の週番号セル結合
-    ws.merge_cells(start_row=3, start_column=week_start_col,
-                   end_row=3, end_column=col_idx - 1)
-    ws.cell(row=3, column=week_start_col).value = f"第{prev_weekno}週"
-    ws.cell(row=3, column=week_start_col).alignment = Alignment(horizontal="center")
-
-    # --- 列幅設定 ---
-    for c in range(col_start, col_idx):
-        ws.column_dimensions[get_column_letter(c)].width = 6
-
-    # --- 見出し行 ---
-    ws["B5"] = "店舗CD"
-    ws["C5"] = "店舗名"
-    ws.freeze_panes = "D6"
-
-    # --- 店舗CD・店舗名の枠だけ作る（値はのちほど fill_values で入れる） ---
-    row = 6
-    for cucd, name in shop_master:
-        if cucd == "B78":    # ★ 追加：B78 は出力しない
-            continue
-        ws.cell(row=row, column=2).value = cucd
-        ws.cell(row=row, column=3).value = name
-        row += 1
-
-    # --- 共通フォーマット ---
-    apply_common_format(ws, col_start, col_idx - 1)
-    apply_borders(ws, col_start, col_idx - 1)
-    apply_header_color(ws, col_start, col_idx - 1)
-    apply_font_style(ws)
-    apply_sunday_red(ws, col_start, col_idx - 1, days)
-
-    return days, col_start, col_idx
-
-
 # ============================================================
-# ② シートコピー
+# Excel 生成（書き込み専用モード・高速版）
 # ============================================================
-def duplicate_sheet(wb, base_ws, title):
-    """区分1レイアウトシートをコピーして新規シートにする"""
-    new_ws = wb.copy_worksheet(base_ws)
-    new_ws.title = title
-    new_ws.freeze_panes = "D6"
-    return new_ws
-
+UNIT_LABEL = "単位：台"
+TOTAL_SHEET_TITLE = "滞留カゴ車台数実績表"
 
-# ============================================================
-# ③ 値埋め込み（cat1〜4、合計）
-# ============================================================
-def fill_values(ws, days, shop_master, data_dict, kbn_no):
+def load_pivot_for_days(*day_lists):
     """
-    kbn_no:
-      1 → cat1
-      2 → cat2
-      3 → cat3
-      4 → cat4
-      "total" → cat1+cat2+cat3+cat4
+    days の期間＋その前の7日（前週比の第1週分）の CartStayCount を配列にして返す。
+    days を複数渡すと、全部を含む期間を1回で読む（zip出力の年度版＋2週間版など）。
+    前の7日は全店の合計しか使わないので、集計テーブルが有効ならそちらから読む。
     """
-    col_start = 4
-    row_idx = 6
-
-    for cucd, name in shop_master:
-        if cucd == "B78":    # ★B78のデータは飛ばす
-            continue
-
-        for i, (weekno, date_obj) in enumerate(days):
-
-            col = col_start + i
-            ymd = date_obj.strftime("%Y-%m-%d")
-            key = f"{cucd}_{ymd}"
-
-            if key not in data_dict:
-                value = ""
-            else:
-                rec = data_dict[key]
-
-                if kbn_no == "total":
-                    value = (
-                        (rec.get("cat1") or 0) +
-                        (rec.get("cat2") or 0) +
-                        (rec.get("cat3") or 0) +
-                        (rec.get("cat4") or 0)
-                    )
-                else:
-                    raw = rec.get(f"cat{kbn_no}")
-                    value = raw if raw is not None else ""
+    first = min(days[0][1] for days in day_lists)
+    end = max(days[-1][1] for days in day_lists)
+    return load_cart_stay_pivot(first - timedelta(days=7), end, totals_until=first - timedelta(days=1))
 
-            ws.cell(row=row_idx, column=col).value = value
-
-        row_idx += 1
-
-# ============================================================
-# ④ 合計行、前週比行の設定
-# ============================================================
-def append_summary_rows(ws, days, col_start, col_end, year, kbn_no):
+def write_cart_stay_excel(path, days, shop_master, pivot, title_map, unit_label=None):
     """
-    最下行の下に「合計値」「前週比」を追加する（前週が無い場合は SQL により取得）
+    区分1〜4・合計の5シートを excel_writer で書き出し、path（ファイル名 or BytesIO）に保存する。
+    見た目は旧方式 (bench/_cart_result_legacy.py の build_excel_workbook / create_excel_two_weeks) と同じ。
+      days: [(weekno, date), ...]（年度版は get_week_calendar、2週間版は get_period_calendar）
+      pivot: load_pivot_for_days(days) の結果（値・合計・前週比はすべてここから計算する）
+      unit_label: 2行目最終列の単位（年度版のみ "単位：台"）
     """
-    max_row = ws.max_row
-    sum_row = max_row + 1
-    diff_row = max_row + 2
-
-    # --- ラベル（B空欄、Cに名前） ---
-    ws.cell(row=sum_row, column=3).value = "合計値"
-    ws.cell(row=diff_row, column=3).value = "前週比"
-
-    ws.cell(row=sum_row, column=3).alignment = Alignment(horizontal="center")
-    ws.cell(row=diff_row, column=3).alignment = Alignment(horizontal="center")
-
-    # --------------------
-    # （1）合計値行
-    # --------------------
-    for i, (weekno, date_obj) in enumerate(days):
-        col = col_start + i
-        total = 0
-
-        for r in range(6, max_row + 1):
-            v = ws.cell(row=r, column=col).value
-            if isinstance(v, (int, float)):
-                total += v
-
-        ws.cell(row=sum_row, column=col).value = total
-        ws.cell(row=sum_row, column=col).alignment = Alignment(horizontal="right")
-
-    # -------------------- 
-    # （2）前週比行
-    # -------------------- 
-    for i, (weekno, date_obj) in enumerate(days):
-        col = col_start + i
-
-        cur_total = ws.cell(row=sum_row, column=col).value or 0
-
-        # 前週の列が存在する場合（同じ年度内で 7 列前にある）
-        prev_col = col - 7
-        if prev_col >= col_start:
-            prev_total = ws.cell(row=sum_row, column=prev_col).value or 0
-            diff = cur_total - prev_total
-
-            cell = ws.cell(row=diff_row, column=col)
-            cell.value = diff
-
-            if diff < 0:
-                cell.font = Font(color="FF0000")
-
-            cell.alignment = Alignment(horizontal="right")
-            continue
-
-        # --------------------------
-        # 前週が無い場合（第1週）
-        # → 日付-7日 を CartStayCount から直接取得
-        # --------------------------
-        prev_date = date_obj - timedelta(days=7)
-        prev_total = fetch_total_for_date_and_kbn(prev_date, kbn_no)
-
-        diff = cur_total - prev_total
-
-        cell = ws.cell(row=diff_row, column=col)
-        cell.value = diff
-
-        if diff < 0:
-            cell.font = Font(color="FF0000")
-
-        cell.alignment = Alignment(horizontal="right")
-
-
-    # ============================================================
-    # (3) 見た目整形（罫線・色）
-    # ============================================================
-
-    # カラー
-    fill = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
-
-    # 最終列
-    last_col = col_end
-
-    # ------------------------------------------
-    # （A）合計行 ＆ 差分行 に色付け（B～最終列）
-    # ------------------------------------------
-    for col in range(2, last_col + 1):
-        ws.cell(row=sum_row,  column=col).fill = fill
-        ws.cell(row=diff_row, column=col).fill = fill
-
-    # ------------------------------------------
-    # （B）合計行の上を「二重罫線」にする
-    # ------------------------------------------
-    double = Side(style="double", color="000000")
-
-    for col in range(2, last_col + 1):
-        cell = ws.cell(row=sum_row, column=col)
-        cell.border = Border(
-            top=double,
-            left=cell.border.left,
-            right=cell.border.right,
-            bottom=cell.border.bottom
-        )
-
-    # ------------------------------------------
-    # （C）太枠を差分行まで伸ばす
-    # ------------------------------------------
-    thick = Side(style="thick", color="000000")
-
-    # 左枠(B列)
-    for row in range(3, diff_row + 1):
-        cell = ws.cell(row=row, column=2)
-        cell.border = Border(
-            left=thick,
-            top=cell.border.top,
-            bottom=cell.border.bottom,
-            right=cell.border.right
-        )
-
-    # 右枠（最終列）
-    for row in range(3, diff_row + 1):
-        cell = ws.cell(row=row, column=last_col)
-        cell.border = Border(
-            right=thick,
-            top=cell.border.top,
-            bottom=cell.border.bottom,
-            left=cell.border.left
-        )
-
-    # 上枠（3行目）→既存維持
-    # 下枠（差分行）
-    for col in range(2, last_col + 1):
-        cell = ws.cell(row=diff_row, column=col)
-        cell.border = Border(
-            bottom=thick,
-            left=cell.border.left,
-            right=cell.border.right,
-            top=cell.border.top
-        )
-
-    # ============================================================
-    # (4) 合計行・差分行 専用罫線
-    # ============================================================
-    thin = Side(style="dotted", color="000000")
-    medium = Side(style="medium", color="000000")
-
-    # ------------------------------------------
-    # （1）合計行（sum_row）と前週比行（diff_row）の間に 点線の横罫線
-    # ------------------------------------------
-    for col in range(2, last_col + 1):
-        cell = ws.cell(row=diff_row - 1, column=col)
-        cell.border = Border(
-            bottom=thin,
-            left=cell.border.left,
-            right=cell.border.right,
-            top=cell.border.top
-        )
-
-    # ------------------------------------------
-    # （2）合計行・前週比行の全曜日に 縦の点線（D列～最終列）
-    # ------------------------------------------
-    for col in range(col_start, last_col + 1):
-        # 合計行
-        cell = ws.cell(row=sum_row, column=col)
-        cell.border = Border(
-            left=thin,
-            right=thin,
-            top=cell.border.top,
-            bottom=cell.border.bottom
-        )
-
-        # 前週比行
-        cell = ws.cell(row=diff_row, column=col)
-        cell.border = Border(
-            left=thin,
-            right=thin,
-            top=cell.border.top,
-            bottom=cell.border.bottom
-        )
-
-    # ------------------------------------------
-    # （3）日曜 → 月曜 の境界に medium 線（縦）
-    # days: [(weekno, date), ...] の配列
-    # 曜日 index: 月=0, 火=1 ... 日=6
-    # ------------------------------------------
-    for i, (weekno, date_obj) in enumerate(days):
-        col = col_start + i
-        # 月曜列の場合のみ「その直前」が日曜
-        if date_obj.weekday() == 0 and col > col_start:
-            # 合計行
-            cell = ws.cell(row=sum_row, column=col)
-            cell.border = Border(
-                left=medium,
-                right=cell.border.right,
-                top=cell.border.top,
-                bottom=cell.border.bottom
-            )
-            # 前週比行
-            cell = ws.cell(row=diff_row, column=col)
-            cell.border = Border(
-                left=medium,
-                right=cell.border.right,
-                top=cell.border.top,
-                bottom=cell.border.bottom
-            )
-
-    # ============================================================
-    # (4) 最終：合計行の上に double 線を “再適用” （上書き保護）
-    #           合計行・差分行の最終列の右側に太線を強制適用
-    # ============================================================
-
-    double = Side(style="double", color="000000")
-
-    for col in range(2, last_col + 1):
-        cell = ws.cell(row=sum_row, column=col)
-
-        # 既存の左右・下線は保持しつつ、上だけ double にする
-        cell.border = Border(
-            top=double,
-            left=cell.border.left,
-            right=cell.border.right,
-            bottom=cell.border.bottom
-        )
-
-    thick = Side(style="thick", color="000000")
-
-    for row in (sum_row, diff_row):
-        cell = ws.cell(row=row, column=last_col)
-        cell.border = Border(
-            right=thick,
-            top=cell.border.top,
-            bottom=cell.border.bottom,
-            left=cell.border.left,
-        )
-
-# ============================================================
-# 共通 Excel 生成関数
-# ============================================================
-def build_excel_workbook(year, shop_master, data_dict):
-    wb = Workbook()
-    base_ws = wb.active
-    base_ws.title = "区分1"
-
-    # 区分名
-    title_map = get_category_titles()
-
-    # レイアウト作成
-    days, col_start, col_end = build_base_layout(base_ws, year, shop_master)
-
-    # タイトル
-    base_ws["B2"] = title_map[1]
-    base_ws["B2"].font = Font(name="Meiryo UI", size=14, bold=True)
-
-    unit_cell = base_ws.cell(row=2, column=col_end - 1)
-    unit_cell.value = "単位：台"
-    unit_cell.font = Font(name="Meiryo UI", size=11)
-    unit_cell.alignment = Alignment(horizontal="center")
-
-    # コピーして各シート作成
-    ws2 = duplicate_sheet(wb, base_ws, "区分2")
-    ws3 = duplicate_sheet(wb, base_ws, "区分3")
-    ws4 = duplicate_sheet(wb, base_ws, "区分4")
-    ws_total = duplicate_sheet(wb, base_ws, "滞留カゴ車台数実績表")
-
-    ws2["B2"] = title_map[2]
-    ws3["B2"] = title_map[3]
-    ws4["B2"] = title_map[4]
-    ws_total["B2"] = "滞留カゴ車台数実績表"
-
-    # 値の埋め込み
-    fill_values(base_ws, days, shop_master, data_dict, 1)
-    append_summary_rows(base_ws, days, col_start, col_end - 1, year, 1)
-
-    fill_values(ws2, days, shop_master, data_dict, 2)
-    append_summary_rows(ws2, days, col_start, col_end - 1, year, 2)
-
-    fill_values(ws3, days, shop_master, data_dict, 3)
-    append_summary_rows(ws3, days, col_start, col_end - 1, year, 3)
-
-    fill_values(ws4, days, shop_master, data_dict, 4)
-    append_summary_rows(ws4, days, col_start, col_end - 1, year, 4)
-
-    fill_values(ws_total, days, shop_master, data_dict, "total")
-    append_summary_rows(ws_total, days, col_start, col_end - 1, year, "total")
-
-    return wb
+    shops = export_shops(shop_master)
+    dates = [date_obj for weekno, date_obj in days]
+    sheets = [
+        ("区分1", title_map[1], 1),
+        ("区分2", title_map[2], 2),
+        ("区分3", title_map[3], 3),
+        ("区分4", title_map[4], 4),
+        (TOTAL_SHEET_TITLE, TOTAL_SHEET_TITLE, "total"),
+    ]
+
+    # 店舗 × 日 × 区分 の切り出しと、前週比の第1週分（シート外の7日前・全店舗の合計）
+    selection = pivot.select([cucd for cucd, name in shops], dates)
+    prev_week = pivot.day_totals(selection.prev_week_dates())
+
+    wb = new_workbook()
+    for title, heading, kbn_no in sheets:
+        values = selection.rendered(kbn_no)
+        totals, diffs = selection.summary(kbn_no, prev_week)
+        write_sheet(wb, title, heading, days, shops, values, totals, diffs, unit_label)
+    wb.save(path)
+    return path
 
 # ============================================================
 # ④ ルート
@@ -470,259 +90,199 @@ def export_excel():
     today = date.today()
     year = today.year if year_type == "current" else today.year - 1
 
-    title_map = get_category_titles()
-
-    # 店舗マスター（タプル形式）
-    shop_master = get_cucd_master_tuple()
+    # 同じ年度・同じデータの出力が残っていればそれを返す（無ければ作って保存する）
+    plan = plan_year_export(year)
+    store = get_export_job_store()
+    path = store.get_artifact(plan["key"], ".xlsx")
+    if path is None:
+        path = store.put_artifact(plan["key"], ".xlsx", plan["build"](lambda pct, message: None))
 
-    # 区分データ1回取得
-    data_dict = fetch_cart_stay_all(year)
-
-    # Excelブック作成
-    wb = Workbook()
-    base_ws = wb.active
-    base_ws.title = "区分1"
-
-    # ---- 区分1レイアウト作成 ----
-    days, col_start, col_end = build_base_layout(base_ws, year, shop_master)
-
-    # 2行目B列タイトル
-    base_ws["B2"] = title_map[1]
-    base_ws["B2"].font = Font(name="Meiryo UI", size=14, bold=True)
-    # 2行目最終列　単位
-    unit_cell = base_ws.cell(row=2, column=col_end - 1)
-    unit_cell.value = "単位：台"
-    unit_cell.font = Font(name="Meiryo UI", size=11)
-    unit_cell.alignment = Alignment(horizontal="center")
-
-    # ---- 区分2〜4、合計シートをコピーして作成 ----
-    ws2 = duplicate_sheet(wb, base_ws, "区分2")
-    ws3 = duplicate_sheet(wb, base_ws, "区分3")
-    ws4 = duplicate_sheet(wb, base_ws, "区分4")
-    ws_total = duplicate_sheet(wb, base_ws, "滞留カゴ車台数実績表")
-
-    # ---- 各シートのB2セルに、シートタイトルを設定----
-    ws2["B2"] = title_map[2]
-    ws3["B2"] = title_map[3]
-    ws4["B2"] = title_map[4]
-    ws_total["B2"] = "滞留カゴ車台数実績表"
-
-    # ---- 値を埋め込む（高速）----
-    fill_values(base_ws, days, shop_master, data_dict, 1)
-    append_summary_rows(base_ws, days, col_start, col_end - 1, year, 1)
-    fill_values(ws2,    days, shop_master, data_dict, 2)
-    append_summary_rows(ws2,  days, col_start, col_end - 1, year, 2)
-    fill_values(ws3,    days, shop_master, data_dict, 3)
-    append_summary_rows(ws3,  days, col_start, col_end - 1, year, 3)
-    fill_values(ws4,    days, shop_master, data_dict, 4)
-    append_summary_rows(ws4,  days, col_start, col_end - 1, year, 4)
-    fill_values(ws_total, days, shop_master, data_dict, "total")
-    append_summary_rows(ws_total, days, col_start, col_end - 1, year, "total")
-
-    # ---- ファイル名・保存 ----
-    filename = f"{year}年度_滞留カゴ車台数実績表.xlsx"
-    temp_path = os.path.join(tempfile.gettempdir(), filename)
-    wb.save(temp_path)
-
-    return send_file(temp_path, as_attachment=True)
+    return send_file(path, as_attachment=True, download_name=plan["filename"])
 
 # ============================================================
-# Excel出力（zipで今年度と2週間分の2ファイル出力版）
+# zip出力用：ブックを1つずつ作って zip へ流す
 # ============================================================
-@cart_result_bp.route("/export_excel_zip", methods=["POST"])
-def export_excel_zip():
-    today = date.today()
-    ymd = today.strftime("%Y%m%d")
-    year = today.year  # 今年度出力
+# 2週間版は年度版の 1/20 程度の作業量しかなく、別プロセスで同時に作っても
+# 年度版の作成時間はそのまま残る（子プロセスの起動・データの受け渡しの分だけ遅くなる）。
+# そのため順番に作り、できたブックから zip に書いてレスポンスへ流す。
+def build_cart_stay_xlsx(days, shop_master, pivot, title_map, unit_label=None):
+    """
+    write_cart_stay_excel の結果を xlsx のバイト列で返す（DB には触らない）。
+    """
+    buf = io.BytesIO()
+    write_cart_stay_excel(buf, days, shop_master, pivot, title_map, unit_label)
+    return buf.getvalue()
 
-    # 店舗マスター
-    shop_master = get_cucd_master_tuple()
+class _ZipChunks(io.RawIOBase):
+    """ZipFile の書き込み先。書かれたバイト列を溜めておき、drain() で取り出す（シーク不可）"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
 
-    # -------------------------
-    # ① 年度版 Excel を生成
-    # -------------------------
-    data_full = fetch_cart_stay_all(year)
-    wb_full = build_excel_workbook(year, shop_master, data_full)
-    buf_full = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
-    wb_full.save(buf_full.name)
-
-    # -------------------------
-    # ② 2週間版 Excel を生成
-    # -------------------------
-    start_2w = today - timedelta(days=13)
-    end_2w = today
-
-    data_2w = fetch_cart_stay_period(start_2w, end_2w)
-    wb_2w = create_excel_two_weeks()
-    fname_2w = f"2週間滞留カゴ車台数実績表({ymd}).xlsx"
-    buf_2w = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
-    wb_2w.save(buf_2w.name)
-
-    # -------------------------
-    # ③ ZIP 作成
-    # -------------------------
-    zip_path = tempfile.NamedTemporaryFile(delete=False, suffix=".zip").name
-    import zipfile
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as z:
-        z.write(buf_full.name, arcname=f"{year}年度_滞留カゴ車台数実績表.xlsx")
-        z.write(buf_2w.name, arcname=fname_2w)
-
-    return send_file(zip_path,
-                     as_attachment=True,
-                     download_name=f"滞留カゴ車集計_{year}年度版＋2週間版_{ymd}.zip")
+def iter_zip(files):
+    """files: [(zip内のファイル名, バイト列), ...] を zip にして少しずつ返す"""
+    out = _ZipChunks()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        for arcname, data in files:
+            z.writestr(arcname, data)
+            yield out.drain()
+    yield out.drain()
 
 # ============================================================
-# Excel出力（2週間ファイル）
+# 出力内容の準備（画面からの直接出力・バックグラウンド出力で共通）
 # ============================================================
-def build_base_layout_period(ws, start_date, end_date, shop_master):
+def _export_version(day_lists, shop_master, title_map):
     """
-    指定期間（start_date〜end_date）のみのレイアウトを作る。
-    ・週番号（必要な分だけ）
-    ・日付（期間の分だけ）
-    ・曜日
-    ・店舗CD・店舗名
+    出力結果を決める値（カレンダー・店舗・区分名・期間内の CartStayCount の版）。
+    artifact_key に渡し、どれかが変われば別の成果物として作り直す。
     """
-    from common.db_connection import get_connection
-    
-    # --------------------------
-    # ① 期間内の日付リスト作成
-    # --------------------------
-    cur_date = start_date
-    days = []
-
-    with get_connection("SQLS08-14") as conn:
-        cur = conn.cursor()
-
-        while cur_date <= end_date:
-            cur.execute("""
-                SELECT weekno 
-                FROM dba.weekno2 
-                WHERE ? BETWEEN date_s AND date_e
-            """, (cur_date,))
-            row = cur.fetchone()
-            weekno = row[0] if row else 0   # 取れないことは基本ない
-            
-            days.append((weekno, cur_date))
-            cur_date += timedelta(days=1)
-
-    # --------------------------
-    # ② カレンダー描画（年度版と同じ方式）
-    # --------------------------
-    col_start = 4
-    col_idx = col_start
-    prev_weekno = None
-    week_start_col = col_start
-
-    for (weekno, date_obj) in days:
-        # 週番号セル結合
-        if weekno != prev_weekno:
-            if prev_weekno is not None:
-                ws.merge_cells(start_row=3, start_column=week_start_col,
-                               end_row=3, end_column=col_idx - 1)
-                ws.cell(row=3, column=week_start_col).value = f"第{prev_weekno}週"
-                ws.cell(row=3, column=week_start_col).alignment = Alignment(horizontal="center")
-            week_start_col = col_idx
-            prev_weekno = weekno
-
-        # 日付
-        c_date = ws.cell(row=4, column=col_idx)
-        c_date.value = date_obj
-        c_date.number_format = "mm/dd"
-        c_date.alignment = Alignment(horizontal="center")
-
-        # 曜日
-        weekday = ["月", "火", "水", "木", "金", "土", "日"][date_obj.weekday()]
-        c = ws.cell(row=5, column=col_idx)
-        c.value = weekday
-        c.alignment = Alignment(horizontal="center")
-
-        col_idx += 1
-
-    # 最後の週番号セル結合
-    ws.merge_cells(start_row=3, start_column=week_start_col,
-                   end_row=3, end_column=col_idx - 1)
-    ws.cell(row=3, column=week_start_col).value = f"第{prev_weekno}週"
-    ws.cell(row=3, column=week_start_col).alignment = Alignment(horizontal="center")
-
-    # 列幅
-    for c in range(col_start, col_idx):
-        ws.column_dimensions[get_column_letter(c)].width = 6
-
-    # 見出し
-    ws["B5"] = "店舗CD"
-    ws["C5"] = "店舗名"
-    ws.freeze_panes = "D6"
-
-    # 店舗一覧
-    row = 6
-    for cucd, name in shop_master:
-        if cucd == "B78":
-            continue
-        ws.cell(row=row, column=2).value = cucd
-        ws.cell(row=row, column=3).value = name
-        row += 1
-
-    # 共通フォーマット適用
-    apply_common_format(ws, col_start, col_idx - 1)
-    apply_borders(ws, col_start, col_idx - 1)
-    apply_header_color(ws, col_start, col_idx - 1)
-    apply_font_style(ws)
-    apply_sunday_red(ws, col_start, col_idx - 1, days)
-
-    return days, col_start, col_idx
-
-def create_excel_two_weeks():
-    today = date.today()
-    start_2w = today - timedelta(days=13)
-    end_2w   = today
+    start = min(days[0][1] for days in day_lists) - timedelta(days=7)
+    end = max(days[-1][1] for days in day_lists)
+    return [day_lists, shop_master, title_map, fetch_cart_stay_version(start, end)]
 
-    # 店舗マスター
+def plan_year_export(year):
+    """
+    年度版1ファイルの出力内容。
+    {"kind", "filename", "key"（成果物のキー）, "build"（build(progress) → xlsx のバイト列）}
+    """
     shop_master = get_cucd_master_tuple()
-
-    # 2週間分のデータ
-    data_dict = fetch_cart_stay_period(start_2w, end_2w)
-
-    # Excelブック生成
-    wb = Workbook()
-    ws_base = wb.active
-    ws_base.title = "区分1"
-
-    # ★ 2週間版のレイアウト（列が14列だけ）
-    days, col_start, col_end = build_base_layout_period(ws_base, start_2w, end_2w, shop_master)
-
-    # 区分タイトル
     title_map = get_category_titles()
+    days = get_week_calendar(year)
 
-    ws_base["B2"] = title_map[1]
-
-    # シート複製（区分2〜4 & 合計）
-    ws2 = duplicate_sheet(wb, ws_base, "区分2")
-    ws3 = duplicate_sheet(wb, ws_base, "区分3")
-    ws4 = duplicate_sheet(wb, ws_base, "区分4")
-    ws_total = duplicate_sheet(wb, ws_base, "滞留カゴ車台数実績表")
+    def build(progress):
+        progress(10, "実績データ読み込み中")
+        pivot = load_pivot_for_days(days)
+        progress(40, "Excel作成中")
+        return build_cart_stay_xlsx(days, shop_master, pivot, title_map, UNIT_LABEL)
+
+    return {
+        "kind": "year",
+        "filename": f"{year}年度_滞留カゴ車台数実績表.xlsx",
+        "key": artifact_key("year", {"year": year}, _export_version([days], shop_master, title_map)),
+        "build": build,
+    }
 
-    ws2["B2"] = title_map[2]
-    ws3["B2"] = title_map[3]
-    ws4["B2"] = title_map[4]
-    ws_total["B2"] = "滞留カゴ車台数実績表"
+def plan_zip_export(today):
+    """
+    今年度版＋2週間版の zip の出力内容（plan_year_export と同じ形）。
+    "build_files"（build_files(progress) → (zip内のファイル名, xlsx のバイト列) を1つずつ返すイテレータ）も持つ。
+    データは build_files を呼んだ時点で読み、ブックはイテレータを進めるたびに1つずつ作る。
+    """
+    ymd = today.strftime("%Y%m%d")
+    year = today.year  # 今年度出力
 
-    # 値埋め込み
-    fill_values(ws_base, days, shop_master, data_dict, 1)
-    append_summary_rows(ws_base, days, col_start, col_end - 1, None, 1)
+    shop_master = get_cucd_master_tuple()
+    title_map = get_category_titles()
+    days_full = get_week_calendar(year)
+    days_2w = get_period_calendar(today - timedelta(days=13), today)
+
+    def build_files(progress):
+        # 年度版・2週間版の両方（＋前週比の7日前）を含む期間を1回で読む
+        progress(10, "実績データ読み込み中")
+        pivot = load_pivot_for_days(days_full, days_2w)
+
+        def files():
+            # すぐできる2週間版を先に出し、年度版を作っている間もレスポンスを流し始める
+            progress(40, "Excel作成中（2週間版）")
+            yield (f"2週間滞留カゴ車台数実績表({ymd}).xlsx",
+                   build_cart_stay_xlsx(days_2w, shop_master, pivot, title_map, None))
+            progress(45, "Excel作成中（年度版）")
+            yield (f"{year}年度_滞留カゴ車台数実績表.xlsx",
+                   build_cart_stay_xlsx(days_full, shop_master, pivot, title_map, UNIT_LABEL))
+            progress(90, "zip作成中")
+
+        return files()
+
+    return {
+        "kind": "zip",
+        "filename": f"滞留カゴ車集計_{year}年度版＋2週間版_{ymd}.zip",
+        "key": artifact_key("zip", {"year": year, "ymd": ymd},
+                            _export_version([days_full, days_2w], shop_master, title_map)),
+        "build_files": build_files,
+        "build": lambda progress: b"".join(iter_zip(build_files(progress))),
+    }
 
-    fill_values(ws2, days, shop_master, data_dict, 2)
-    append_summary_rows(ws2, days, col_start, col_end - 1, None, 2)
+# ============================================================
+# Excel出力（zipで今年度と2週間分の2ファイル出力版）
+# ============================================================
+@cart_result_bp.route("/export_excel_zip", methods=["POST"])
+def export_excel_zip():
+    plan = plan_zip_export(date.today())
 
-    fill_values(ws3, days, shop_master, data_dict, 3)
-    append_summary_rows(ws3, days, col_start, col_end - 1, None, 3)
+    # 同じ日・同じデータの zip が残っていればそれを返す
+    path = get_export_job_store().get_artifact(plan["key"], ".zip")
+    if path is not None:
+        return send_file(path, as_attachment=True, download_name=plan["filename"])
 
-    fill_values(ws4, days, shop_master, data_dict, 4)
-    append_summary_rows(ws4, days, col_start, col_end - 1, None, 4)
+    # 2ファイル分のデータ読み込みは1回（ここで済ませる）、
+    # Excel はできたものから ZIP に書いてそのままレスポンスへ（一時ファイルは作らない）
+    files = plan["build_files"](lambda pct, message: None)
+    download_name = quote(plan["filename"])
 
-    fill_values(ws_total, days, shop_master, data_dict, "total")
-    append_summary_rows(ws_total, days, col_start, col_end - 1, None, "total")
+    response = Response(stream_with_context(iter_zip(files)), mimetype="application/zip")
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{download_name}"
+    return response
 
-    return wb
+# ============================================================
+# Excel出力（バックグラウンド実行）
+#   POST /export_jobs でジョブを登録 → GET /export_jobs/<id> で進捗確認
+#   → 完了したら GET /export_jobs/<id>/download
+# ============================================================
+def _job_response(job):
+    """ジョブの状態を画面へ返す形にする（成果物のキーは出さない）"""
+    body = {k: v for k, v in job.items() if k != "key"}
+    body["status_url"] = url_for("cart_result.export_job_status", job_id=job["job_id"])
+    if job["status"] == "done":
+        body["download_url"] = url_for("cart_result.export_job_download", job_id=job["job_id"])
+    return body
+
+@cart_result_bp.route("/export_jobs", methods=["POST"])
+def submit_export_job():
+    """
+    kind=zip（今年度＋2週間版）/ year（year_type=current|previous の年度版）
+    """
+    kind = request.form.get("kind", "zip")
+    today = date.today()
+    if kind == "zip":
+        plan = plan_zip_export(today)
+    elif kind == "year":
+        year_type = request.form.get("year_type")
+        plan = plan_year_export(today.year if year_type == "current" else today.year - 1)
+    else:
+        return jsonify({"error": f"kind が不正です: {kind}"}), 400
+
+    job = get_export_job_store().submit(plan["kind"], plan["key"], plan["filename"], plan["build"])
+    return jsonify(_job_response(job)), 202
+
+@cart_result_bp.route("/export_jobs/<job_id>")
+def export_job_status(job_id):
+    store = get_export_job_store()
+    store.sweep()
+    job = store.get(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません（期限切れの可能性があります）"}), 404
+    return jsonify(_job_response(job))
+
+@cart_result_bp.route("/export_jobs/<job_id>/download")
+def export_job_download(job_id):
+    store = get_export_job_store()
+    job = store.get(job_id)
+    path = store.artifact_of(job)
+    if path is None:
+        return jsonify({"error": "ダウンロードできるファイルがありません（未完了または期限切れ）"}), 404
+    return send_file(path, as_attachment=True, download_name=job["filename"])
 
 # ===============================
 # データ照会画面（GET）
@@ -747,62 +307,183 @@ def cart_result_disp():
 # ============================================
 #  データ取得 API（表示ボタン）
 # ============================================
-@cart_result_bp.route("/get_data", methods=["POST"])
+# 1回に表示できる最大日数
+DISP_MAX_DAYS = 400
+DISP_TYPES = ("total", "1", "2", "3", "4")
+DISP_UNITS = ("day", "week")
+# rows: 従来の形（(店舗, 日) ごとの行・既定。実績表示画面 cart_result_disp.html が読む）
+# columns: 列ごとの配列（build_disp_payload / build_disp_week_payload。週単位はこちらのみ）
+DISP_FORMATS = ("rows", "columns")
+
+def build_disp_rows_payload(sd, ed, disp_type):
+    """
+    従来の形の実績データ。データのある (店舗, 日) ごとに1行を返す。
+      {"result": [{"cucd", "date", "cat1"〜"cat4", "value"}, ...]}
+    cat1〜cat4 は NULL を 0 とし、value は disp_type の値（total は cat1〜cat4 の和）。
+    店舗マスタに無い店舗の行も返す（従来どおり）。
+    """
+    kbn_no = "total" if disp_type == "total" else int(disp_type)
+    dates = [sd + timedelta(days=i) for i in range((ed - sd).days + 1)]
+
+    pivot = load_cart_stay_pivot(sd, ed)
+    shops = list(pivot.shop_index)
+    selection = pivot.select(shops, dates)
+    counts = selection.counts.tolist()
+    values = selection.values(kbn_no)[0].tolist()
+
+    result = []
+    for s, d in zip(*(idx.tolist() for idx in selection.present.nonzero())):
+        rec = {"cucd": shops[s], "date": dates[d].strftime("%Y-%m-%d")}
+        rec.update((f"cat{c + 1}", n) for c, n in enumerate(counts[s][d]))
+        rec["value"] = values[s][d]
+        result.append(rec)
+    return {"result": result}
+
+def _matrix_payload(selection, kbn_no, shops):
+    """店舗 × 列（日 or 週）の値と店舗ごとの合計（日単位・週単位で共通の部分）"""
+    values = selection.values(kbn_no)[0]
+    return {
+        "cucd": [cucd for cucd, name in shops],
+        "names": [name for cucd, name in shops],
+        "values": selection.rendered(kbn_no, None),
+        "shop_totals": values.sum(axis=1).tolist(),
+        "grand_total": int(values.sum()),
+    }
+
+def build_disp_payload(sd, ed, disp_type):
+    """
+    実績表示用に、店舗 × 日付 の表を disp_type（total / 1〜4）で集計して返す。
+    行ごとの辞書ではなく、列ごとの配列にまとめる（画面側で組み替えなくてよい形）。
+
+      dates        : ["YYYY-MM-DD", ...]
+      cucd / names : 店舗CD・店舗名（店舗マスタ順）
+      values       : [店舗][日] の台数（データが無い日は null）
+      shop_totals  : 店舗ごとの期間合計
+      daily_totals : 日ごとの全店合計
+      grand_total  : 総合計
+    """
+    kbn_no = "total" if disp_type == "total" else int(disp_type)
+    dates = [sd + timedelta(days=i) for i in range((ed - sd).days + 1)]
+    shops = get_cucd_master_tuple()
+
+    pivot = load_cart_stay_pivot(sd, ed)
+    selection = pivot.select([cucd for cucd, name in shops], dates)
+
+    payload = {
+        "unit": "day",
+        "start_date": sd.strftime("%Y-%m-%d"),
+        "end_date": ed.strftime("%Y-%m-%d"),
+        "disp_type": disp_type,
+        "dates": [d.strftime("%Y-%m-%d") for d in dates],
+    }
+    payload.update(_matrix_payload(selection, kbn_no, shops))
+    payload["daily_totals"] = selection.totals(kbn_no).tolist()
+    return payload
+
+def build_disp_week_payload(weeks, disp_type):
+    """
+    店舗 × 週 の表を返す（build_disp_payload の週単位版）。
+    集計テーブル CartStayWeekSum（有効な場合）から読むので、数か月分でも数千行で済む。
+      weeks: get_weeks_between の結果 [(weekno, date_s, date_e), ...]
+      dates の代わりに weeks（各週の開始日）・weeknos、daily_totals の代わりに weekly_totals を返す
+    """
+    kbn_no = "total" if disp_type == "total" else int(disp_type)
+    shops = get_cucd_master_tuple()
+    week_from, week_to = weeks[0][1], weeks[-1][2]
+
+    rows = fetch_week_totals(week_from, week_to)
+
+    # 週の開始日を列の日付として配列にする
+    pivot = CartStayPivot(
+        [(cucd, week_s, catcd, total) for cucd, week_s, weekno, catcd, total in rows],
+        week_from, weeks[-1][1],
+    )
+    selection = pivot.select([cucd for cucd, name in shops], [date_s for weekno, date_s, date_e in weeks])
+
+    payload = {
+        "unit": "week",
+        "start_date": week_from.strftime("%Y-%m-%d"),
+        "end_date": week_to.strftime("%Y-%m-%d"),
+        "disp_type": disp_type,
+        "weeks": [date_s.strftime("%Y-%m-%d") for weekno, date_s, date_e in weeks],
+        "weeknos": [weekno for weekno, date_s, date_e in weeks],
+    }
+    payload.update(_matrix_payload(selection, kbn_no, shops))
+    payload["weekly_totals"] = selection.totals(kbn_no).tolist()
+    return payload
+
+@cart_result_bp.route("/get_data", methods=["GET", "POST"])
 def get_data():
-    from flask import request, jsonify
+    """
+    start_date / end_date / disp_type / unit（day: 日単位・既定 / week: 週単位）/
+    format（rows: 従来の形・既定 / columns: 列ごとの配列）を受け取り、
+    build_disp_rows_payload / build_disp_payload / build_disp_week_payload の JSON を返す。
+    ・集計結果は gzip 済みで (期間, 区分) ごとにキャッシュする（滞留カゴ車の登録で破棄）
+    ・ブラウザが gzip を受け付けない場合だけ展開して返す
+    ・ETag を付けるので、GET なら変化が無い時は 304 になる
+    """
+    from flask import jsonify, Response
     from datetime import datetime
-    from common.db_connection import get_connection
 
-    start_date = request.form.get("start_date")
-    end_date   = request.form.get("end_date")
-    disp_type  = request.form.get("disp_type")   # total / 1 / 2 / 3 / 4
+    start_date = request.values.get("start_date")
+    end_date   = request.values.get("end_date")
+    disp_type  = request.values.get("disp_type")   # total / 1 / 2 / 3 / 4
+    unit       = request.values.get("unit", "day")  # day / week
+    fmt        = request.values.get("format", "rows")  # rows / columns
 
     # 文字列 → date
     try:
         sd = datetime.strptime(start_date, "%Y-%m-%d").date()
         ed = datetime.strptime(end_date, "%Y-%m-%d").date()
-    except:
+    except (TypeError, ValueError):
         return jsonify({"error": "日付の形式が不正です"}), 400
 
-    # ---- 1) CartStayCount からデータ取得 ----
-    with get_connection("SQLS08-14") as conn:
-        cur = conn.cursor()
-
-        sql = """
-            SELECT cucd, idleDate, cat1, cat2, cat3, cat4
-            FROM CartStayCount
-            WHERE idleDate BETWEEN ? AND ?
-        """
-        cur.execute(sql, (sd, ed))
-        rows = cur.fetchall()
-
-    # ---- 2) データを辞書化（(cucd, date) → 値） ----
-    data = []
-    for r in rows:
-        cucd = str(r.cucd).strip()
-        d = r.idleDate
-        if hasattr(d, "date"):
-            d = d.date()
-
-        rec = {
-            "cucd": cucd,
-            "date": d.strftime("%Y-%m-%d"),
-            "cat1": r.cat1 or 0,
-            "cat2": r.cat2 or 0,
-            "cat3": r.cat3 or 0,
-            "cat4": r.cat4 or 0,
-        }
-
-        # ---- 区分ごとの値の抽出 ----
-        if disp_type == "total":
-            rec["value"] = (r.cat1 or 0) + (r.cat2 or 0) + (r.cat3 or 0) + (r.cat4 or 0)
-        else:
-            k = f"cat{disp_type}"
-            rec["value"] = rec[k]
-
-        data.append(rec)
-
-    return jsonify({"result": data})
+    if disp_type not in DISP_TYPES:
+        return jsonify({"error": "表示区分が不正です"}), 400
+    if unit not in DISP_UNITS:
+        return jsonify({"error": "表示単位が不正です"}), 400
+    if fmt not in DISP_FORMATS:
+        return jsonify({"error": "format が不正です"}), 400
+    if unit == "week" and fmt != "columns":
+        return jsonify({"error": "週単位は format=columns で指定してください"}), 400
+    if ed < sd or (ed - sd).days + 1 > DISP_MAX_DAYS:
+        return jsonify({"error": f"期間は{DISP_MAX_DAYS}日以内で指定してください"}), 400
+
+    # ---- キャッシュのキー（週単位は週の境界まで広げた期間。登録日での破棄判定に使う） ----
+    if unit == "week":
+        weeks = get_weeks_between(sd, ed)
+        if not weeks:
+            return jsonify({"error": "指定期間の週が見つかりません"}), 400
+        key = (weeks[0][1], weeks[-1][2], disp_type, unit, fmt)
+        build = lambda: build_disp_week_payload(weeks, disp_type)
+    elif fmt == "columns":
+        key = (sd, ed, disp_type, unit, fmt)
+        build = lambda: build_disp_payload(sd, ed, disp_type)
+    else:
+        key = (sd, ed, disp_type, unit, fmt)
+        build = lambda: build_disp_rows_payload(sd, ed, disp_type)
+
+    # ---- 集計（キャッシュに無ければ） ----
+    cache = get_cart_stay_cache()
+    cached = cache.get(key)
+    if cached is None:
+        generation = cache.generation()
+        body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        cached = (gzip.compress(body), hashlib.sha1(body).hexdigest())
+        cache.put(key, cached, generation)
+
+    body_gz, etag = cached
+
+    # ---- レスポンス ----
+    if "gzip" in request.accept_encodings:
+        resp = Response(body_gz, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(gzip.decompress(body_gz), mimetype="application/json")
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
 
 #--- 実績表表示画面で、店舗一覧を作るためのAPI ---
 @cart_result_bp.route("/get_shop_master")
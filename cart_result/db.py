@@ -1,90 +1,30 @@
 from datetime import timedelta, date
 from common.db_connection import get_connection
+from common import cart_stay_summary
+from . import fiscal_calendar
+from .pivot import CartStayPivot
 
 def get_week_calendar(year: int):
     """
     年度カレンダーを返す。
     ・第1週はその年の 2〜3月の最初の月曜日
     ・年度末は翌年の第1週の月曜日の前日
+    weekno2 は fiscal_calendar で年ごとにキャッシュしている（2回目以降は問い合わせなし）
     """
+    return fiscal_calendar.get_week_calendar(year)
 
-    with get_connection("SQLS08-14") as conn:
-        cur = conn.cursor()
-
-        # --------------------------
-        # ① その年の第1週の開始日（月曜日）
-        # --------------------------
-        cur.execute("""
-            SELECT date_s
-            FROM DBA.weekno2
-            WHERE date_s >= ? AND date_s < ? AND weekno = 1
-            ORDER BY date_s
-        """, (f"{year}-02-01", f"{year}-04-01"))
-        rows = cur.fetchall()
-
-        start_date = None
-        for (ds,) in rows:
-            ds = ds.date() if hasattr(ds, "date") else ds
-            if ds.weekday() == 0:  # 0=月曜日
-                start_date = ds
-                break
-
-        if start_date is None:
-            raise ValueError(f"{year}年度の開始(月曜日)が見つかりません")
-
-        # --------------------------
-        # ② 翌年の第1週の開始日（月曜日）
-        # --------------------------
-        next_year = year + 1
-        cur.execute("""
-            SELECT date_s
-            FROM DBA.weekno2
-            WHERE date_s >= ? AND date_s < ? AND weekno = 1
-            ORDER BY date_s
-        """, (f"{next_year}-02-01", f"{next_year}-04-01"))
-        rows = cur.fetchall()
-
-        next_start = None
-        for (ds,) in rows:
-            ds = ds.date() if hasattr(ds, "date") else ds
-            if ds.weekday() == 0:
-                next_start = ds
-                break
-
-        if next_start is None:
-            raise ValueError(f"{next_year}年度の開始(月曜日)が見つかりません")
-
-        # --------------------------
-        # ③ 年度末日 = 翌年第1週の前日（日曜日）
-        # --------------------------
-        end_date = next_start - timedelta(days=1)
+def get_period_calendar(start_date, end_date):
+    """
+    指定期間（start_date〜end_date）の [(weekno, date), ...] を返す。
+    2週間版のレイアウトで使う。週番号が取れない日は 0。
+    """
+    return fiscal_calendar.get_period_calendar(start_date, end_date)
 
-        # --------------------------
-        # ④ 対象期間にかかる weekno2 を取得
-        # --------------------------
-        cur.execute("""
-            SELECT weekno, date_s, date_e
-            FROM DBA.weekno2
-            WHERE date_e >= ? AND date_s <= ?
-            ORDER BY date_s
-        """, (start_date, end_date))
-        weeks = cur.fetchall()
-
-    # --------------------------
-    # ⑤ 各週の実日付に分解
-    # --------------------------
-    days = []
-    for weekno, ds, de in weeks:
-        s = ds.date() if hasattr(ds, "date") else ds
-        e = de.date() if hasattr(de, "date") else de
-
-        cur_date = s
-        while cur_date <= e:
-            if start_date <= cur_date <= end_date:
-                days.append((weekno, cur_date))
-            cur_date += timedelta(days=1)
-
-    return days
+def get_weeks_between(start_date, end_date):
+    """
+    指定期間にかかる週の [(weekno, date_s, date_e), ...] を返す（実績表示の週単位表示用）。
+    """
+    return fiscal_calendar.get_weeks_between(start_date, end_date)
 
 def fetch_cart_stay_all(year: int):
     """
@@ -136,37 +76,65 @@ def fetch_cart_stay_all(year: int):
     return data_dict
 
 
-def fetch_total_for_date_and_kbn(target_date: date, kbn_no):
+def load_cart_stay_pivot(start_date: date, end_date: date, totals_until: date = None):
     """
-    指定日・区分の合計値を CartStayCount から取得する。
-      kbn_no: 1〜4 → catcdごとの合計
-              "total" → catcd 1〜4 の合計
-    第1週の、前週差分を計算する時に使う。
+    期間内の CartStayCount を1回で取得し、店舗 × 日 × 区分の配列（pivot.CartStayPivot）にして返す。
+    Excel 出力ではこれを1回だけ作り、全シートの値・合計・前週比を配列の演算で求める。
+
+    totals_until: start_date〜この日は全店の日別合計（CartStayPivot.day_totals）しか使わない場合に渡す
+                  （前週比の第1週分）。集計テーブルが有効なら、その期間は CartStayDailySum から読み、
+                  CartStayCount は翌日〜end_date だけ読む。
+    店舗 × 日 の値そのものは CartStayCount と同じ粒度なので、集計テーブルでは置き換えられない。
     """
+    rows_from = start_date
+    daily_totals = None
+
     with get_connection("SQLS08-14") as conn:
         cur = conn.cursor()
+        if totals_until is not None and cart_stay_summary.SUMMARY_ENABLED:
+            daily_totals = cart_stay_summary.fetch_daily_totals(cur, start_date, totals_until)
+            rows_from = totals_until + timedelta(days=1)
+
+        cur.execute("""
+            SELECT cucd, idleDate, catcd, count
+            FROM CartStayCount
+            WHERE idleDate BETWEEN ? AND ?
+        """, (rows_from, end_date))
+        rows = cur.fetchall()
+
+    return CartStayPivot(rows, start_date, end_date, daily_totals)
+
+
+def fetch_cart_stay_version(start_date: date, end_date: date):
+    """
+    Excel 出力の成果物（export_jobs）を作り直さずに使い回してよいかの判定に使う版を返す。
+      ・CartStayCount 全体の最終登録日時 MAX(rgtm)（登録画面は追加・修正のたびに rgtm を更新する）
+        期間で絞らず、rgtm の索引の端を見るだけにしている（年度分を読み直さない）。
+          索引: CREATE INDEX ix_CartStayCount_rgtm ON CartStayCount (rgtm)
+        どこかの日に登録があれば他の年度の成果物も作り直しになるが、過去年度の出力はまれなので許容する
+      ・集計テーブルが有効なら、期間内の CartStayDailySum（日数×4行）の件数と区分ごとの合計
+        （rgtm を付けずに書き込んだ後で rebuild した場合も版が変わる）
+    """
+    with get_connection("SQLS08-14") as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT MAX(rgtm) FROM CartStayCount")
+        version = [str(cur.fetchone()[0])]
+        if cart_stay_summary.SUMMARY_ENABLED:
+            totals = cart_stay_summary.fetch_daily_totals(cur, start_date, end_date)
+            version.append(len(totals))
+            version.extend(sum(t for d, c, t in totals if c == catcd) for catcd in (1, 2, 3, 4))
+
+    return version
+
+
+def fetch_week_totals(week_from: date, week_to: date):
+    """
+    週の開始日が week_from〜week_to の週の、(店舗, 週, 区分) ごとの合計を
+    [(cucd, week_s, weekno, catcd, total), ...] で返す（実績表示の週単位表示用）。
+    """
+    with get_connection("SQLS08-14") as conn:
+        return cart_stay_summary.fetch_week_totals(conn.cursor(), week_from, week_to)
 
-        if kbn_no == "total":
-            # catcd 1〜4 の全部
-            sql = """
-                SELECT COALESCE(SUM(count), 0)
-                FROM CartStayCount
-                WHERE idleDate = ?
-                  AND catcd IN (1, 2, 3, 4)
-            """
-            cur.execute(sql, (target_date,))
-        else:
-            # kbn_no は 1〜4
-            sql = """
-                SELECT COALESCE(SUM(count), 0)
-                FROM CartStayCount
-                WHERE idleDate = ?
-                  AND catcd = ?
-            """
-            cur.execute(sql, (target_date, kbn_no))
-
-        row = cur.fetchone()
-        return row[0] or 0
 
 # ============================================================
 # 2週間データ専用の fetch 関数
@@ -0,0 +1,328 @@
+"""
+cart_result/excel_writer.py
+---------------------------
+滞留カゴ車台数実績表の Excel 出力 (書き込み専用モード)。
+
+従来の build_excel_workbook (bench/_cart_result_legacy.py に移した) は、区分1シートを通常モードで作って
+copy_worksheet で4枚複製し、罫線・フォントをセル1つずつ付け直していたため、
+年度分×全店舗ではセルオブジェクトが数十万個になり、時間とメモリを大きく使っていた。
+
+ここでは
+・セルの書式 (罫線・フォント・塗り・配置) を「行の種類 × 列の種類」ごとに先に決めておき、
+  同じ書式のセルは同じスタイル情報を共有する
+・openpyxl の write_only モードで、上の行から順に書き出す (シート全体をメモリに持たない)
+ことで、見た目は従来と同じまま高速に出力する。
+
+罫線の決め方は format_common.apply_borders と旧方式の append_summary_rows の処理順をそのままなぞっている。
+(見た目を変える場合は、両方を直すこと)
+"""
+
+from copy import copy
+from datetime import timedelta
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Side, Font, PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+
+COL_START = 4         # 日付の最初の列 (D列)
+FIRST_SHOP_ROW = 6    # 店舗の最初の行
+EXCLUDE_SHOPS = ("B78",)
+
+WEEKDAY_NAMES = ["月", "火", "水", "木", "金", "土", "日"]
+
+# --- 罫線 ---
+DOTTED = Side(style="dotted", color="000000")
+THICK = Side(style="thick", color="000000")
+MEDIUM = Side(style="medium", color="000000")
+DOUBLE = Side(style="double", color="000000")
+
+# --- フォント ---
+FONT_NORMAL = Font(name="Meiryo UI", size=11)
+FONT_TITLE = Font(name="Meiryo UI", size=14, bold=True)
+FONT_RED = Font(color="FF0000")
+
+# --- 塗り ---
+FILL_HEADER = PatternFill("solid", fgColor="C6D9F1")
+FILL_SUMMARY = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
+
+# --- 配置 ---
+ALIGN_CENTER = Alignment(horizontal="center")
+ALIGN_CENTER_MIDDLE = Alignment(horizontal="center", vertical="center")
+ALIGN_RIGHT = Alignment(horizontal="right")
+
+
+def export_shops(shop_master):
+    """Excelに出す店舗 (B78 は出力しない)"""
+    return [(cucd, name) for cucd, name in shop_master if cucd not in EXCLUDE_SHOPS]
+
+
+class _Layout:
+    """
+    シートの行・列の位置関係。
+    R: 最終店舗行, S: 合計値行, F: 前週比行, L: 最終列
+    """
+
+    def __init__(self, days, shop_count):
+        self.days = days
+        self.L = COL_START + len(days) - 1
+        self.R = FIRST_SHOP_ROW + shop_count - 1
+        self.S = self.R + 1
+        self.F = self.R + 2
+        self.mondays = {COL_START + i for i, (w, d) in enumerate(days) if d.weekday() == 0}
+        self.sundays = {COL_START + i for i, (w, d) in enumerate(days) if d.weekday() == 6}
+        self.week_starts = {c1 for weekno, c1, c2 in _week_ranges(days)}
+
+    def border(self, row, col):
+        """
+        セルの最終的な罫線を (左, 右, 上, 下) の Side で返す (罫線なしは None)。
+        apply_borders → append_summary_rows の順に上書きしていく処理を、そのまま1セル分なぞる。
+        """
+        L, R, S, F = self.L, self.R, self.S, self.F
+        if col < 2:
+            return None                                   # 罫線は B列から
+        left = right = top = bottom = None
+
+        # --- レイアウト (format_common.apply_borders) : 3行目〜最終店舗行 ---
+        if 3 <= row <= R:
+            if row == 3:
+                top = THICK                               # 上枠
+            if col == 2:
+                left = THICK                              # 左枠
+            if col == L:
+                right = THICK                             # 右枠
+            if col >= COL_START and row >= 4:
+                left = right = DOTTED                     # 縦点線
+            if row == 4:
+                bottom = DOTTED                           # 横点線 (4〜5行間)
+            if row >= FIRST_SHOP_ROW:
+                top = DOTTED                              # 横点線 (店舗行)
+            if col in self.mondays and row >= 4:
+                left = THICK                              # 日曜→月曜の境界
+            if col == L:
+                right = THICK                             # 右枠 (再適用)
+
+        # --- 合計行・前週比行 (app.append_summary_rows) ---
+        if row == S:
+            top = DOUBLE
+        if col == 2 and 3 <= row <= F:
+            left = THICK
+        if col == L and 3 <= row <= F:
+            right = THICK
+        if row == F:
+            bottom = THICK
+        if row == S:
+            bottom = DOTTED
+        if row in (S, F):
+            if col >= COL_START:
+                left = right = DOTTED
+            if col in self.mondays and col > COL_START:
+                left = MEDIUM
+            if row == S:
+                top = DOUBLE
+            if col == L:
+                right = THICK
+
+        if left is None and right is None and top is None and bottom is None:
+            return None
+        return (left, right, top, bottom)
+
+    def font(self, row, col):
+        # apply_font_style は ws.iter_rows() (1行目・A列から最終店舗行・最終列まで) に掛かる
+        if row == 2 and col == 2:
+            return FONT_TITLE
+        if row == 5 and col in self.sundays:
+            return FONT_RED
+        if row <= self.R:
+            return FONT_NORMAL
+        return None
+
+    def fill(self, row, col):
+        if col < 2:
+            return None                                   # 塗りは B列から
+        if 3 <= row <= 5:
+            return FILL_HEADER
+        if row in (self.S, self.F):
+            return FILL_SUMMARY
+        return None
+
+    def alignment(self, row, col, unit_label):
+        if row == 2 and col == self.L and unit_label:
+            return ALIGN_CENTER
+        if row == 3 and col in (2, 3):
+            return ALIGN_CENTER_MIDDLE
+        if row == 3 and col in self.week_starts:
+            return ALIGN_CENTER
+        if row in (4, 5) and col >= COL_START:
+            return ALIGN_CENTER
+        if row in (self.S, self.F):
+            return ALIGN_CENTER if col == 3 else (ALIGN_RIGHT if col >= COL_START else None)
+        return None
+
+    def number_format(self, row, col):
+        if row == 4 and col >= COL_START:
+            return "mm/dd"
+        return None
+
+
+class _StyleBook:
+    """
+    書式の組み合わせごとに、スタイル情報 (openpyxl の StyleArray) を1回だけ作って使い回す。
+    """
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._cache = {}
+
+    def get(self, font=None, border=None, fill=None, alignment=None, number_format=None):
+        """
+        border は _Layout.border の (左, 右, 上, 下)。
+        openpyxl の書式オブジェクトはハッシュ計算が重いので、キーはオブジェクトの id で作る
+        (このモジュールの定数しか渡さないので id で区別できる)。
+        """
+        key = (id(font), tuple(id(side) for side in border) if border else None,
+               id(fill), id(alignment), number_format)
+        style = self._cache.get(key)
+        if style is None:
+            cell = WriteOnlyCell(self._ws)
+            if font is not None:
+                cell.font = font
+            if border is not None:
+                cell.border = Border(*[side or Side() for side in border])
+            if fill is not None:
+                cell.fill = fill
+            if alignment is not None:
+                cell.alignment = alignment
+            if number_format is not None:
+                cell.number_format = number_format
+            style = cell._style
+            self._cache[key] = style
+        return style
+
+    def row_styles(self, layout, row, unit_label=None, font_override=None):
+        """1行分 (A列〜最終列) のスタイルを、列番号をキーにした辞書で返す"""
+        styles = {}
+        for col in range(1, layout.L + 1):
+            styles[col] = self.get(
+                font=font_override if font_override is not None else layout.font(row, col),
+                border=layout.border(row, col),
+                fill=layout.fill(row, col),
+                alignment=layout.alignment(row, col, unit_label),
+                number_format=layout.number_format(row, col),
+            )
+        return styles
+
+
+def _cell(ws, value, style):
+    cell = WriteOnlyCell(ws, value)
+    cell._style = copy(style)
+    return cell
+
+
+def _week_ranges(days):
+    """[(週番号, 開始列, 終了列), ...]"""
+    ranges = []
+    for i, (weekno, date_obj) in enumerate(days):
+        col = COL_START + i
+        if ranges and ranges[-1][0] == weekno:
+            ranges[-1][2] = col
+        else:
+            ranges.append([weekno, col, col])
+    return ranges
+
+
+def write_sheet(wb, title, heading, days, shops, values, totals, diffs, unit_label=None):
+    """
+    1シート分を上の行から順に書き出す。
+
+    Args:
+        heading: B2 のタイトル
+        values: pivot.PivotSelection.rendered の戻り値 ([店舗][日])
+        totals, diffs: pivot.PivotSelection.summary の戻り値
+        unit_label: 2行目最終列に出す単位 ("単位：台" など)。None なら出さない
+    """
+    ws = wb.create_sheet(title)
+    layout = _Layout(days, len(shops))
+    book = _StyleBook(ws)
+    L = layout.L
+    week_ranges = _week_ranges(days)
+
+    # --- シート設定 (行を書く前に決めておく) ---
+    ws.column_dimensions["A"].width = 2
+    ws.column_dimensions["B"].width = 5
+    ws.column_dimensions["C"].width = 22
+    for c in range(COL_START, L + 1):
+        ws.column_dimensions[get_column_letter(c)].width = 7
+    ws.row_dimensions[2].height = 19.5
+    ws.freeze_panes = "D6"
+
+    ws.merged_cells.add(CellRange("B3:B5"))
+    ws.merged_cells.add(CellRange("C3:C5"))
+    for weekno, c1, c2 in week_ranges:
+        ws.merged_cells.add(CellRange(min_col=c1, min_row=3, max_col=c2, max_row=3))
+
+    # --- 1行目 (値なし・フォントのみ) ---
+    st = book.row_styles(layout, 1)
+    ws.append([_cell(ws, None, st[col]) for col in range(1, L + 1)])
+
+    # --- 2行目: タイトル・単位 ---
+    st = book.row_styles(layout, 2, unit_label)
+    row = [_cell(ws, None, st[1]), _cell(ws, heading, st[2])]
+    for col in range(3, L + 1):
+        value = unit_label if (col == L and unit_label) else None
+        row.append(_cell(ws, value, st[col]))
+    ws.append(row)
+
+    # --- 3行目: 店番・店舗名・週番号 ---
+    week_labels = {c1: f"第{weekno}週" for weekno, c1, c2 in week_ranges}
+    st = book.row_styles(layout, 3)
+    row = [_cell(ws, None, st[1]), _cell(ws, "店番", st[2]), _cell(ws, "店舗名", st[3])]
+    for col in range(COL_START, L + 1):
+        row.append(_cell(ws, week_labels.get(col), st[col]))
+    ws.append(row)
+
+    # --- 4行目: 日付 / 5行目: 曜日 ---
+    st = book.row_styles(layout, 4)
+    row = [_cell(ws, None, st[1]), _cell(ws, None, st[2]), _cell(ws, None, st[3])]
+    for i, (weekno, date_obj) in enumerate(days):
+        row.append(_cell(ws, date_obj, st[COL_START + i]))
+    ws.append(row)
+
+    st = book.row_styles(layout, 5)
+    row = [_cell(ws, None, st[1]), _cell(ws, None, st[2]), _cell(ws, None, st[3])]
+    for i, (weekno, date_obj) in enumerate(days):
+        row.append(_cell(ws, WEEKDAY_NAMES[date_obj.weekday()], st[COL_START + i]))
+    ws.append(row)
+
+    # --- 6行目〜: 店舗ごとの値 (書式はどの店舗行も同じ) ---
+    if shops:
+        st = book.row_styles(layout, FIRST_SHOP_ROW)
+        day_styles = [st[COL_START + i] for i in range(len(days))]
+        for (cucd, name), vals in zip(shops, values):
+            row = [_cell(ws, None, st[1]), _cell(ws, cucd, st[2]), _cell(ws, name, st[3])]
+            row.extend(_cell(ws, v, s) for v, s in zip(vals, day_styles))
+            ws.append(row)
+
+    # --- 合計値行 ---
+    st = book.row_styles(layout, layout.S)
+    row = [None, _cell(ws, None, st[2]), _cell(ws, "合計値", st[3])]
+    for i, total in enumerate(totals):
+        row.append(_cell(ws, total, st[COL_START + i]))
+    ws.append(row)
+
+    # --- 前週比行 (マイナスは赤字) ---
+    st = book.row_styles(layout, layout.F)
+    st_red = book.row_styles(layout, layout.F, font_override=FONT_RED)
+    row = [None, _cell(ws, None, st[2]), _cell(ws, "前週比", st[3])]
+    for i, diff in enumerate(diffs):
+        col = COL_START + i
+        row.append(_cell(ws, diff, st_red[col] if diff < 0 else st[col]))
+    ws.append(row)
+
+    return ws
+
+
+def new_workbook():
+    """書き込み専用モードのブック"""
+    return Workbook(write_only=True)
@@ -0,0 +1,344 @@
+"""
+cart_result/export_jobs.py
+--------------------------
+Excel出力のバックグラウンド実行 (ジョブ) と、出来上がったファイル (成果物) の保存。
+
+年度版の Excel 出力はリクエストの中で作ると IIS FastCGI のタイムアウトに
+かかることがあるため、
+・submit      : ジョブを登録してすぐジョブIDを返す (作成はワーカースレッドで行う)
+・get         : 進捗 (0〜100)・状態 (queued / running / done / error) を返す
+・成果物       : 出力の種類・パラメータ・データの版 から作ったキーのファイル名で保存し、
+                同じ年度・同じデータなら作り直さずにそのまま返す
+とする。
+
+ジョブの状態と成果物はどちらも EXPORT_DIR 配下のファイルに置くので、
+IIS で複数プロセス動いていても、どのプロセスからでも進捗の確認・ダウンロードができる
+(作成そのものはジョブを受け付けたプロセスで行う)。
+・作成中のジョブは、受け付けたプロセスが JOB_HEARTBEAT_INTERVAL 秒ごとにファイルの更新時刻を進める。
+  JOB_HEARTBEAT_TIMEOUT 秒以上進んでいない作成中のジョブは、プロセスが止まった (IIS のリサイクル等) とみなしエラーにする
+・同じ成果物のキーの作成中は、キーごとの印のファイル (claim_<キー>) で、他のプロセスからも二重に作らせない
+
+期限 (ARTIFACT_TTL / JOB_TTL) を過ぎたファイルは、ジョブ登録・進捗確認のついでに
+SWEEP_INTERVAL 秒に1回まとめて削除する (従来の tempfile に残り続けていた分の置き換え)。
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+EXPORT_JOB_WORKERS = 2         # 同時に作成するジョブ数
+ARTIFACT_TTL = 3600            # 成果物を残しておく時間(秒)
+JOB_TTL = 3600                 # 終わったジョブの状態を残しておく時間(秒)
+JOB_HEARTBEAT_INTERVAL = 30    # 作成中のジョブのファイルの更新時刻を進める間隔(秒)
+JOB_HEARTBEAT_TIMEOUT = 120    # これ以上更新時刻が進んでいない作成中のジョブはエラーとみなす(秒)
+SWEEP_INTERVAL = 300           # 期限切れファイルを探す間隔(秒)
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "cart_result_exports")
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def artifact_key(kind, params, version):
+    """出力の種類・パラメータ・データの版 から成果物のキーを作る"""
+    raw = json.dumps([kind, params, version], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _write_json(path, data):
+    """途中の状態を読まれないよう、別名で書いてから置き換える"""
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class ExportJobStore:
+    """
+    ジョブの登録・実行・状態、成果物ファイルの保存・期限切れの削除 (プロセス内で1つ)。
+    """
+
+    def __init__(self, directory=EXPORT_DIR, workers=EXPORT_JOB_WORKERS,
+                 artifact_ttl=ARTIFACT_TTL, job_ttl=JOB_TTL):
+        self.directory = directory
+        self.workers = workers
+        self.artifact_ttl = artifact_ttl
+        self.job_ttl = job_ttl
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._heartbeat_thread = None
+        self._owned = set()            # このプロセスで作成中 (待機中を含む) のジョブID
+        self._last_sweep = 0.0
+
+        self.submitted = 0
+        self.cache_hits = 0
+        self.failed = 0
+        self.swept_files = 0
+
+    # --------------------------------------------------------
+    # パス
+    # --------------------------------------------------------
+    def _job_path(self, job_id):
+        return os.path.join(self.directory, f"job_{job_id}.json")
+
+    def _artifact_path(self, key, ext):
+        return os.path.join(self.directory, f"{key}{ext}")
+
+    def _claim_path(self, key):
+        return os.path.join(self.directory, f"claim_{key}")
+
+    def _ensure_dir(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    # --------------------------------------------------------
+    # 成果物
+    # --------------------------------------------------------
+    def get_artifact(self, key, ext):
+        """期限内の成果物があればそのパス、無ければ None"""
+        path = self._artifact_path(key, ext)
+        try:
+            if time.time() - os.path.getmtime(path) < self.artifact_ttl:
+                return path
+        except OSError:
+            pass
+        return None
+
+    def put_artifact(self, key, ext, data):
+        """成果物 (バイト列) を保存してパスを返す"""
+        self._ensure_dir()
+        path = self._artifact_path(key, ext)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return path
+
+    # --------------------------------------------------------
+    # ジョブ
+    # --------------------------------------------------------
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="cart_result_export"
+                )
+                self._heartbeat_thread = threading.Thread(
+                    target=self._heartbeat, name="cart_result_export_heartbeat", daemon=True
+                )
+                self._heartbeat_thread.start()
+            return self._executor
+
+    def _heartbeat(self):
+        """このプロセスで作成中のジョブのファイルの更新時刻を進める (生きている印)"""
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            with self._lock:
+                job_ids = list(self._owned)
+            for job_id in job_ids:
+                try:
+                    os.utime(self._job_path(job_id))
+                except OSError:
+                    pass
+
+    def _claim(self, key, job_id):
+        """
+        成果物のキーの作成を、プロセスをまたいで1つのジョブに限る。
+        取れたら None、他のジョブが作成中ならそのジョブの状態を返す。
+        (印のファイルは別名で書いてから os.link で作るので、既にあれば必ず失敗する)
+        """
+        path = self._claim_path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(job_id)
+        try:
+            for _ in range(3):
+                try:
+                    os.link(tmp, path)
+                    return None
+                except FileExistsError:
+                    pass
+
+                other = self.get(self._read_claim(path))
+                if other is not None and other["status"] in ACTIVE_STATUSES:
+                    return other
+                # 終わった・止まったジョブの印が残っている → 消して取り直す
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return None
+        finally:
+            os.remove(tmp)
+
+    def _read_claim(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _release_claim(self, key, job_id):
+        path = self._claim_path(key)
+        if self._read_claim(path) == job_id:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _save_job(self, job):
+        self._ensure_dir()
+        _write_json(self._job_path(job["job_id"]), job)
+
+    def _update(self, job, **changes):
+        job.update(changes)
+        self._save_job(job)
+
+    def submit(self, kind, key, filename, build):
+        """
+        ジョブを登録して、ジョブの状態 (dict) を返す。
+          key     : artifact_key() で作ったキー (同じキーの成果物があれば作らずに完了扱い)
+          filename: ダウンロード時のファイル名 (拡張子を成果物の保存にも使う)
+          build   : build(progress) → バイト列。progress(割合0〜100, メッセージ) で進捗を知らせる
+        """
+        self.sweep()
+        ext = os.path.splitext(filename)[1]
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "key": key,
+            "filename": filename,
+            "status": "queued",
+            "progress": 0,
+            "message": "待機中",
+            "cached": False,
+            "created": time.time(),
+            "finished": None,
+        }
+
+        with self._lock:
+            self.submitted += 1
+
+            if self.get_artifact(key, ext) is not None:
+                self.cache_hits += 1
+                job.update(status="done", progress=100, message="作成済み", cached=True, finished=time.time())
+                self._save_job(job)
+                return job
+
+            # 印を取る前にジョブのファイルを書いておく (他のプロセスが印から引けるように)
+            self._save_job(job)
+            running = self._claim(key, job["job_id"])
+            if running is not None:
+                # 同じ内容を (他のプロセスを含めて) 作成中なら、そのジョブを返す
+                os.remove(self._job_path(job["job_id"]))
+                return running
+            self._owned.add(job["job_id"])
+
+        self._pool().submit(self._run, job, build, ext)
+        return dict(job)
+
+    def _run(self, job, build, ext):
+        def progress(pct, message):
+            self._update(job, progress=int(pct), message=message)
+
+        try:
+            self._update(job, status="running", message="作成開始")
+            data = build(progress)
+            self.put_artifact(job["key"], ext, data)
+            self._update(job, status="done", progress=100, message="完了", finished=time.time())
+        except Exception as e:
+            self.failed += 1
+            print(f"[WARN] Excel出力ジョブ失敗 ({job['kind']} {job['job_id']}): {e}")
+            self._update(job, status="error", message=str(e), finished=time.time())
+        finally:
+            with self._lock:
+                self._owned.discard(job["job_id"])
+            self._release_claim(job["key"], job["job_id"])
+
+    def get(self, job_id):
+        """
+        ジョブの状態 (dict) を返す。無い・不正なIDなら None
+        作成中なのに JOB_HEARTBEAT_TIMEOUT 秒以上更新されていないジョブは、エラーとして返す
+        """
+        if not _JOB_ID.match(str(job_id)):
+            return None
+        path = self._job_path(job_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                job = json.load(f)
+            updated = os.path.getmtime(path)
+        except (OSError, ValueError):
+            return None
+
+        if job.get("status") in ACTIVE_STATUSES and time.time() - updated > JOB_HEARTBEAT_TIMEOUT:
+            job.update(status="error", finished=updated,
+                       message="作成していたプロセスが停止しました。もう一度出力してください。")
+        return job
+
+    def artifact_of(self, job):
+        """完了したジョブの成果物のパス (期限切れ・未完了なら None)"""
+        if job is None or job.get("status") != "done":
+            return None
+        return self.get_artifact(job["key"], os.path.splitext(job["filename"])[1])
+
+    # --------------------------------------------------------
+    # 期限切れの削除
+    # --------------------------------------------------------
+    def sweep(self, force=False):
+        """期限を過ぎた成果物・ジョブ・書きかけのファイルを削除する (SWEEP_INTERVAL 秒に1回)"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < SWEEP_INTERVAL:
+                return 0
+            self._last_sweep = now
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+
+        removed = 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            ttl = self.job_ttl if name.startswith("job_") and name.endswith(".json") else self.artifact_ttl
+            try:
+                if now - os.path.getmtime(path) >= ttl:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                # 他のプロセスが先に消した・使用中 など。次回また試す
+                continue
+
+        self.swept_files += removed
+        return removed
+
+    def status(self):
+        return {
+            "directory": self.directory,
+            "workers": self.workers,
+            "running": len(self._owned),
+            "submitted": self.submitted,
+            "cache_hits": self.cache_hits,
+            "failed": self.failed,
+            "swept_files": self.swept_files,
+            "artifact_ttl_seconds": self.artifact_ttl,
+            "job_ttl_seconds": self.job_ttl,
+        }
+
+
+_store = ExportJobStore()
+
+
+def get_export_job_store():
+    """Excel出力ジョブの管理 (プロセス内で1つ) を返す"""
+    return _store
+
+
+def get_export_job_status():
+    """ジョブ・成果物の状態 (件数など) を返す"""
+    return _store.status()
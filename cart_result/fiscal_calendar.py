@@ -0,0 +1,238 @@
+"""
+cart_result/fiscal_calendar.py
+------------------------------
+年度カレンダー (DBA.weekno2) のプロセス内キャッシュ。
+
+従来は
+・get_week_calendar : weekno2 へ3回問い合わせ、週を1日ずつ展開
+・2週間版レイアウト : 1日ごとに "WHERE ? BETWEEN date_s AND date_e" を実行
+していたため、Excel出力のたびに weekno2 への往復が発生していた。
+
+ここでは年度ごとに weekno2 を1回だけ読み込み、date_s 順に並べた区間の索引を作って
+・日付 → 週番号
+・年度 → [(週番号, 日付), ...]
+を bisect で引く。2回目以降は DB へ問い合わせない。
+
+・年度の読み込み範囲: その年の2月1日 〜 翌年の3月31日 にかかる週
+  (年度の開始・翌年度の開始を探すのに必要な範囲)
+・有効期限: FISCAL_CALENDAR_TTL 秒 (weekno2 を直した時は invalidate_fiscal_calendar() で即時反映)
+"""
+
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from common.db_connection import get_connection
+
+FISCAL_CALENDAR_TTL = 86400   # キャッシュの有効期限(秒)
+
+SQL_LOAD_WEEKS = """
+    SELECT weekno, date_s, date_e
+    FROM DBA.weekno2
+    WHERE date_e >= ? AND date_s < ?
+    ORDER BY date_s
+"""
+
+
+def _to_date(value):
+    return value.date() if hasattr(value, "date") else value
+
+
+def _window(year):
+    """year 年度の索引が受け持つ日付の範囲 [開始, 終了)"""
+    return date(year, 2, 1), date(year + 1, 4, 1)
+
+
+def _window_year(d):
+    """日付 d を受け持つ索引の年 (1月は前年の索引に入る)"""
+    return d.year if d >= date(d.year, 2, 1) else d.year - 1
+
+
+class WeekIndex:
+    """
+    weekno2 の行 (週番号, 開始日, 終了日) を開始日順に並べた区間の索引。
+    作成後は変更しない (参照側はロック不要)。
+    """
+
+    def __init__(self, rows):
+        weeks = sorted(
+            ((int(weekno), _to_date(ds), _to_date(de)) for weekno, ds, de in rows),
+            key=lambda w: w[1],
+        )
+        self.weeknos = [w[0] for w in weeks]
+        self.starts = [w[1] for w in weeks]
+        self.ends = [w[2] for w in weeks]
+        self.loaded_at = time.time()
+
+    def week_of(self, d):
+        """日付 d を含む週の週番号。どの週にも入らなければ None"""
+        i = bisect_right(self.starts, d) - 1
+        if i >= 0 and d <= self.ends[i]:
+            return self.weeknos[i]
+        return None
+
+    def first_monday_start(self, lo, hi):
+        """lo <= 開始日 < hi の第1週のうち、月曜日始まりの最初の開始日 (無ければ None)"""
+        i = bisect_left(self.starts, lo)
+        while i < len(self.starts) and self.starts[i] < hi:
+            if self.weeknos[i] == 1 and self.starts[i].weekday() == 0:  # 0=月曜日
+                return self.starts[i]
+            i += 1
+        return None
+
+    def days_between(self, start_date, end_date):
+        """
+        start_date〜end_date のうち、いずれかの週に入る日を [(週番号, 日付), ...] で返す
+        (従来の get_week_calendar と同じく、週に入らない日は出さない)
+        """
+        days = []
+        i = max(bisect_right(self.starts, start_date) - 1, 0)
+        while i < len(self.starts) and self.starts[i] <= end_date:
+            cur_date = max(self.starts[i], start_date)
+            last = min(self.ends[i], end_date)
+            while cur_date <= last:
+                days.append((self.weeknos[i], cur_date))
+                cur_date += timedelta(days=1)
+            i += 1
+        return days
+
+
+class FiscalCalendarCache:
+    """
+    年ごとの WeekIndex と、年度ごとの日付リストのキャッシュ (プロセス内で1つ)。
+    """
+
+    def __init__(self, ttl=FISCAL_CALENDAR_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indexes = {}            # {年: (WeekIndex, 期限の monotonic 時刻)}
+        self._year_days = {}          # {年度: [(週番号, 日付), ...]}
+        self.load_count = 0
+
+    def index(self, year):
+        """year 年の索引を返す。無い・期限切れなら weekno2 から読み込む"""
+        entry = self._indexes.get(year)
+        if entry is not None and time.monotonic() < entry[1]:
+            return entry[0]
+
+        with self._lock:
+            entry = self._indexes.get(year)
+            if entry is None or time.monotonic() >= entry[1]:
+                lo, hi = _window(year)
+                with get_connection("SQLS08-14") as conn:
+                    cur = conn.cursor()
+                    cur.execute(SQL_LOAD_WEEKS, (lo, hi))
+                    rows = cur.fetchall()
+                self.load_count += 1
+                entry = (WeekIndex(rows), time.monotonic() + self.ttl)
+                if not rows:
+                    # まだ週が登録されていない年は、登録後すぐ使えるようにキャッシュしない
+                    return entry[0]
+                self._indexes[year] = entry
+                self._year_days.pop(year, None)
+                self._year_days.pop(year - 1, None)
+            return entry[0]
+
+    def week_calendar(self, year):
+        """
+        year 年度の [(週番号, 日付), ...]。
+        ・第1週はその年の 2〜3月の最初の月曜日
+        ・年度末は翌年の第1週の月曜日の前日
+        """
+        index = self.index(year)
+        next_index = self.index(year + 1)
+        days = self._year_days.get(year)
+        if days is not None:
+            return list(days)
+
+        start_date = index.first_monday_start(date(year, 2, 1), date(year, 4, 1))
+        if start_date is None:
+            raise ValueError(f"{year}年度の開始(月曜日)が見つかりません")
+
+        next_start = next_index.first_monday_start(date(year + 1, 2, 1), date(year + 1, 4, 1))
+        if next_start is None:
+            raise ValueError(f"{year + 1}年度の開始(月曜日)が見つかりません")
+
+        days = index.days_between(start_date, next_start - timedelta(days=1))
+        self._year_days[year] = days
+        return list(days)
+
+    def period_calendar(self, start_date, end_date):
+        """
+        start_date〜end_date の毎日について [(週番号, 日付), ...]。
+        週番号が取れない日は 0 (従来の2週間版と同じ)。
+        """
+        days = []
+        cur_date = start_date
+        while cur_date <= end_date:
+            weekno = self.index(_window_year(cur_date)).week_of(cur_date)
+            days.append((weekno or 0, cur_date))
+            cur_date += timedelta(days=1)
+        return days
+
+    def weeks_between(self, start_date, end_date):
+        """start_date〜end_date にかかる週を [(週番号, 開始日, 終了日), ...] で返す (開始日順)"""
+        weeks = {}
+        for year in range(_window_year(start_date), _window_year(end_date) + 1):
+            index = self.index(year)
+            i = max(bisect_right(index.starts, start_date) - 1, 0)
+            while i < len(index.starts) and index.starts[i] <= end_date:
+                if index.ends[i] >= start_date:
+                    weeks[index.starts[i]] = (index.weeknos[i], index.starts[i], index.ends[i])
+                i += 1
+        return [weeks[k] for k in sorted(weeks)]
+
+    def invalidate(self, year=None):
+        """year 年 (None なら全部) の索引を捨て、次の参照で読み直させる"""
+        with self._lock:
+            if year is None:
+                self._indexes.clear()
+                self._year_days.clear()
+            else:
+                self._indexes.pop(year, None)
+                self._year_days.pop(year, None)
+                self._year_days.pop(year - 1, None)
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            "years": sorted(self._indexes),
+            "cached_fiscal_years": sorted(self._year_days),
+            "weeks": sum(len(index.starts) for index, expires in self._indexes.values()),
+            "ttl_seconds": self.ttl,
+            "seconds_to_expire": {
+                year: max(0.0, expires - now) for year, (index, expires) in sorted(self._indexes.items())
+            },
+            "load_count": self.load_count,
+        }
+
+
+_cache = FiscalCalendarCache()
+
+
+def get_week_calendar(year):
+    """year 年度の [(週番号, 日付), ...] を返す (キャッシュ済みなら DB へ問い合わせない)"""
+    return _cache.week_calendar(year)
+
+
+def get_period_calendar(start_date, end_date):
+    """start_date〜end_date の [(週番号, 日付), ...] を返す (キャッシュ済みなら DB へ問い合わせない)"""
+    return _cache.period_calendar(start_date, end_date)
+
+
+def get_weeks_between(start_date, end_date):
+    """start_date〜end_date にかかる週の [(週番号, 開始日, 終了日), ...] を返す"""
+    return _cache.weeks_between(start_date, end_date)
+
+
+def invalidate_fiscal_calendar(year=None):
+    """
+    weekno2 を修正した時に呼ぶ。year を渡すとその年の分だけ、None なら全部を読み直させる。
+    """
+    _cache.invalidate(year)
+
+
+def get_fiscal_calendar_status():
+    """キャッシュの状態 (読み込み済みの年・件数・期限など) を返す"""
+    return _cache.status()
@@ -0,0 +1,174 @@
+"""
+cart_result/pivot.py
+--------------------
+CartStayCount を「店舗 × 日 × 区分(1〜4)」の配列 (NumPy) にまとめて集計する。
+
+従来は {"店舗CD_YYYY-MM-DD": {"cat1": .., ...}} の辞書を作り、
+セル1つごとに日付を文字列にして辞書を引き、合計もセルを読み直して足していた。
+
+ここでは出力1回につき1度だけ配列を作り、
+・区分ごとの値 / 合計シートの値 (区分1〜4の和)
+・日ごとの合計 (合計値行)
+・前週比 (7列前との差)
+を配列の演算で求める。Excel 側は結果を並べるだけ。
+
+値が空欄 ("") になる条件は従来の辞書版と同じ:
+・その店舗・日の行が1件も無い → 全区分とも空欄
+・行はあるが count が NULL     → その区分だけ空欄 (合計シートでは 0 として足す)
+"""
+
+from datetime import timedelta
+
+import numpy as np
+
+CATEGORIES = (1, 2, 3, 4)
+
+
+def _key(cucd):
+    return str(cucd).strip().upper()
+
+
+def _kbn_column(by_cat, kbn_no):
+    """[日, 区分] の配列から kbn_no の列 ("total" は区分1〜4の和) を取り出す"""
+    if kbn_no == "total":
+        return by_cat.sum(axis=1)
+    return by_cat[:, int(kbn_no) - 1]
+
+
+def _to_date(value):
+    return value.date() if hasattr(value, "date") else value
+
+
+class CartStayPivot:
+    """
+    start_date〜end_date の CartStayCount を持つ配列。
+
+    counts  : int64 [店舗, 日, 区分]  (NULL・データなしは 0)
+    present : bool  [店舗, 日]        その店舗・日の行があるか
+    null    : bool  [店舗, 日, 区分]  count が NULL だったか
+    店舗の最後の1行は「データの無い店舗」用の空行 (select で存在しない店舗に割り当てる)
+
+    daily_totals: [(日付, 区分, 全店合計), ...]  店舗別の行を読まずに、日ごとの合計だけ持たせる日の分
+                  (集計テーブル CartStayDailySum から読んだ前週比の第1週分など。day_totals に足す)
+    """
+
+    def __init__(self, rows, start_date, end_date, daily_totals=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        n_days = max((end_date - start_date).days + 1, 0)
+
+        shop_index = {}
+        shop_idx, day_idx, cat_idx, values, nulls = [], [], [], [], []
+        for cucd, idle_date, catcd, count in rows:
+            day = (_to_date(idle_date) - start_date).days
+            if not 0 <= day < n_days:
+                continue
+            shop_idx.append(shop_index.setdefault(_key(cucd), len(shop_index)))
+            day_idx.append(day)
+            cat_idx.append(int(catcd) - 1)
+            values.append(count or 0)
+            nulls.append(count is None)
+
+        n_shops = len(shop_index) + 1       # +1: データの無い店舗用の空行
+        self.shop_index = shop_index
+        self.counts = np.zeros((n_shops, n_days, len(CATEGORIES)), dtype=np.int64)
+        self.present = np.zeros((n_shops, n_days), dtype=bool)
+        self.null = np.zeros((n_shops, n_days, len(CATEGORIES)), dtype=bool)
+
+        if shop_idx:
+            s = np.array(shop_idx, dtype=np.intp)
+            d = np.array(day_idx, dtype=np.intp)
+            c = np.array(cat_idx, dtype=np.intp)
+            self.present[s, d] = True       # 区分が1〜4以外の行も「行あり」として扱う (従来どおり)
+            ok = (c >= 0) & (c < len(CATEGORIES))
+            self.counts[s[ok], d[ok], c[ok]] = np.array(values, dtype=np.int64)[ok]
+            self.null[s[ok], d[ok], c[ok]] = np.array(nulls, dtype=bool)[ok]
+
+        self.extra_totals = np.zeros((n_days, len(CATEGORIES)), dtype=np.int64)
+        for idle_date, catcd, total in daily_totals or ():
+            day = (_to_date(idle_date) - start_date).days
+            if 0 <= day < n_days and 1 <= int(catcd) <= len(CATEGORIES):
+                self.extra_totals[day, int(catcd) - 1] += total or 0
+
+    def _cols(self, dates):
+        cols = np.array([(d - self.start_date).days for d in dates], dtype=np.intp)
+        if cols.size and (cols.min() < 0 or cols.max() >= self.counts.shape[1]):
+            raise ValueError("集計の期間外の日付が含まれています")
+        return cols
+
+    def day_totals(self, dates):
+        """
+        全店舗 (B78・マスタに無い店舗も含む) の日ごと・区分ごとの合計 [日, 区分]。
+        日付・区分ごとの CartStayCount の SUM(count) と同じ値 (前週比の第1週分に使う)。
+        """
+        cols = self._cols(dates)
+        return self.counts[:, cols].sum(axis=0) + self.extra_totals[cols]
+
+    def select(self, shop_codes, dates):
+        """
+        店舗CDの並び × 日付の並び で切り出す (Excel の1シート分の行・列の順)。
+        """
+        blank_row = len(self.shop_index)
+        rows = np.array([self.shop_index.get(_key(c), blank_row) for c in shop_codes], dtype=np.intp)
+        cols = self._cols(dates)
+        return PivotSelection(
+            self.counts[np.ix_(rows, cols)],
+            self.present[np.ix_(rows, cols)],
+            self.null[np.ix_(rows, cols)],
+            dates,
+        )
+
+
+class PivotSelection:
+    """
+    CartStayPivot.select の結果 (店舗 × 日 × 区分)。
+    kbn_no は従来どおり 1〜4 (区分) / "total" (区分1〜4の和)。
+    """
+
+    def __init__(self, counts, present, null, dates):
+        self.counts = counts
+        self.present = present
+        self.null = null
+        self.dates = list(dates)
+
+    def values(self, kbn_no):
+        """(値の配列 [店舗, 日], 空欄の配列 [店舗, 日])"""
+        if kbn_no == "total":
+            return self.counts.sum(axis=2), ~self.present
+        c = int(kbn_no) - 1
+        return self.counts[:, :, c], ~self.present | self.null[:, :, c]
+
+    def rendered(self, kbn_no, blank_value=""):
+        """Excel / JSON にそのまま書ける [店舗][日] のリスト (空欄は blank_value)"""
+        values, blank = self.values(kbn_no)
+        out = values.tolist()
+        for r, c in zip(*(idx.tolist() for idx in np.nonzero(blank))):
+            out[r][c] = blank_value
+        return out
+
+    def daily_totals(self):
+        """日ごと・区分ごとの合計 [日, 区分] (空欄は 0 として足す)"""
+        return self.counts.sum(axis=0)
+
+    def totals(self, kbn_no):
+        """kbn_no の日ごとの合計 [日]"""
+        return _kbn_column(self.daily_totals(), kbn_no)
+
+    def summary(self, kbn_no, prev_week_totals):
+        """
+        合計値行と前週比行を (totals, diffs) のリストで返す。
+        prev_week_totals: 先頭7日それぞれの「7日前」の合計 [日, 区分]
+                          (シート外なので呼び出し側で CartStayPivot.day_totals などから用意する)
+        """
+        totals = self.totals(kbn_no)
+        prev = _kbn_column(np.asarray(prev_week_totals, dtype=np.int64).reshape(-1, len(CATEGORIES)), kbn_no)
+
+        diffs = np.empty_like(totals)
+        head = min(7, totals.size)
+        diffs[:head] = totals[:head] - prev[:head]
+        diffs[7:] = totals[7:] - totals[:-7]
+        return totals.tolist(), diffs.tolist()
+
+    def prev_week_dates(self):
+        """先頭7日それぞれの7日前の日付"""
+        return [d - timedelta(days=7) for d in self.dates[:7]]
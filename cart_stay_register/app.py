@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for
 from common.cucd_logic import get_cucd_list, check_cucd
 from common.db_connection import get_connection
+from common.cart_stay_cache import invalidate_cart_stay_results
+from common.cart_stay_summary import apply_count_change
 from datetime import date, datetime
 from auth.auth_utils import login_required
 
@@ -159,8 +161,14 @@ def api_register_cart():
                         WHERE cucd = ? AND idleDate = ? AND catcd = ?
                     """, (new_count, cucd, idle_date, catcd))
 
+            # ④ 集計テーブルへ差分を反映（同じトランザクション）
+            apply_count_change(cur, cucd, idle_date, old_values, cat_values)
+
             conn.commit()
 
+        # 実績表示 (cart_result) の集計キャッシュから、この日を含む結果を捨てる
+        invalidate_cart_stay_results(idle_date)
+
         return jsonify(ok=True, msg="登録しました")
 
     except Exception as e:
@@ -1,5 +1,4 @@
-from datetime import datetime
-from .db_connection import get_connection
+from .db_clock import get_db_clock
 
 def get_db_server_time(target_db="master"):
     """
@@ -10,28 +9,7 @@ def get_db_server_time(target_db="master"):
     
     Returns:
         datetime: DBの現在時刻
-                  (DB接続エラー等の場合は、フェイルセーフとしてWebサーバーの現在時刻を返す)
+                  (DB時刻はキャッシュ(common/db_clock.py)から計算するため、毎回DBへは問い合わせない)
+                  (一度もDB時刻が取れていない場合は、フェイルセーフとしてWebサーバーの現在時刻を返す)
     """
-    conn = None
-    try:
-        conn = get_connection(target_db)
-        cursor = conn.cursor()
-        
-        # 一般的なSQL (Sybase, SQL Anywhere, SQL Server, PostgreSQL等で動作)
-        cursor.execute("SELECT CURRENT_TIMESTAMP")
-        row = cursor.fetchone()
-        
-        if row and row[0]:
-            # DBから取得できた場合、その値を返す
-            return row[0]
-            
-    except Exception as e:
-        # ログに出力するなど（ここではprintで代用）
-        print(f"[WARNING] DB時刻取得失敗: {str(e)} -- システム時刻を使用します")
-        
-    finally:
-        if conn:
-            conn.close()
-    
-    # 取得失敗時のフェイルセーフ：Webサーバーの現在時刻
-    return datetime.now()
\ No newline at end of file
+    return get_db_clock(target_db).now()
@@ -0,0 +1,130 @@
+"""
+common/cart_stay_cache.py
+-------------------------
+滞留カゴ車台数 (CartStayCount) の集計結果のプロセス内キャッシュ。
+
+実績表示画面 (cart_result の get_data) は、同じ期間・同じ区分を何度も表示し直すため、
+集計済みのレスポンス (gzip 圧縮済み JSON) を (開始日, 終了日, 区分, 表示単位, 形式) ごとに保存して使い回す。
+
+・有効期限: CART_STAY_CACHE_TTL 秒
+・件数上限: CART_STAY_CACHE_MAX 件 (超えたら古く使われていないものから捨てる)
+・登録画面 (cart_stay_register の api_register_cart) で台数を書き込んだら
+  invalidate_cart_stay_results(登録日) を呼び、その日を含む期間の結果を捨てる
+・集計中に書き込みがあった場合は、その集計結果は保存しない (世代番号で判定)
+
+IIS で複数プロセス動く場合、捨てられるのは書き込みを受けたプロセスの分だけなので、
+他のプロセスでは最大 CART_STAY_CACHE_TTL 秒だけ古い結果が見える。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+CART_STAY_CACHE_TTL = 60       # キャッシュの有効期限(秒)
+CART_STAY_CACHE_MAX = 64       # 保存しておく件数の上限
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d").date()
+
+
+class CartStayResultCache:
+    """
+    キー: (開始日, 終了日, 区分, 表示単位, 形式)  値: 呼び出し側が作ったもの (get_data では gzip 済み JSON など)
+    """
+
+    def __init__(self, ttl=CART_STAY_CACHE_TTL, max_entries=CART_STAY_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: (値, 期限の monotonic 時刻)}
+        self._generation = 0           # 書き込みのたびに増やす
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """保存済みの値を返す。無い・期限切れなら None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def generation(self):
+        """集計を始める前に取得し、put に渡す"""
+        return self._generation
+
+    def put(self, key, value, generation):
+        """
+        集計結果を保存する。集計中に書き込み (invalidate) があった場合は保存しない。
+        """
+        with self._lock:
+            if generation != self._generation:
+                return False
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, idle_date=None):
+        """
+        idle_date を含む期間の結果を捨てる (None、または日付として読めない値なら全部)。
+        """
+        try:
+            target = _to_date(idle_date) if idle_date is not None else None
+        except ValueError:
+            target = None
+
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if target is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] <= target <= k[1]]:
+                del self._entries[key]
+
+    def status(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "generation": self._generation,
+        }
+
+
+_cache = CartStayResultCache()
+
+
+def get_cart_stay_cache():
+    """集計結果キャッシュ (プロセス内で1つ) を返す"""
+    return _cache
+
+
+def invalidate_cart_stay_results(idle_date=None):
+    """
+    CartStayCount に書き込んだ後に呼ぶ。idle_date (登録日) を含む期間の集計結果を捨てる。
+    """
+    _cache.invalidate(idle_date)
+
+
+def get_cart_stay_cache_status():
+    """キャッシュの状態 (件数・ヒット数など) を返す"""
+    return _cache.status()
@@ -0,0 +1,252 @@
+"""
+common/cart_stay_summary.py
+---------------------------
+滞留カゴ車台数 (CartStayCount) の集計テーブル。
+
+・CartStayDailySum : (日付, 区分) ごとの全店合計
+・CartStayWeekSum  : (店舗, 週, 区分) ごとの合計 (週は DBA.weekno2 の date_s〜date_e)
+
+実績表示・Excel出力で年度分の CartStayCount を毎回集計し直さなくて済むように、
+登録画面 (cart_stay_register の api_register_cart) が台数を書き込む時に、
+同じトランザクションで差分 (新しい台数 - 元の台数) を足し込んでおく。
+
+導入手順:
+    1) python -m common.cart_stay_summary create                 # テーブル作成
+    2) python -m common.cart_stay_summary rebuild 2024-02-26 2026-03-01
+                                                              # 既存データから作り直す
+    3) 環境変数 CART_STAY_SUMMARY_ENABLED=1 を設定する (または SUMMARY_ENABLED を True にする)
+       登録時の更新と、読み出し側 (実績表示・Excel出力の合計) の切り替えが有効になる
+
+集計がずれた疑いがある時も 2) で期間を指定して作り直せる (週の境界まで広げて作り直す)。
+SQL は SQL Server と SQLite (bench/_sqlite_odbc.py) の両方で動く書き方にしている。
+(テーブルヒント WITH (UPDLOCK, HOLDLOCK) は bench/_sqlite_odbc.py 側で取り除く)
+"""
+
+import os
+from datetime import date, datetime
+
+from .db_connection import get_connection
+
+# テーブル作成・rebuild の後で有効にする (登録画面と実績画面の両方のプロセスで同じ値にすること)
+SUMMARY_ENABLED = os.environ.get("CART_STAY_SUMMARY_ENABLED") == "1"
+
+DB_KEY = "SQLS08-14"
+
+DDL_DAILY = """
+    CREATE TABLE CartStayDailySum (
+        idleDate DATE NOT NULL,
+        catcd    INT  NOT NULL,
+        total    INT  NOT NULL,
+        PRIMARY KEY (idleDate, catcd)
+    )
+"""
+
+DDL_WEEKLY = """
+    CREATE TABLE CartStayWeekSum (
+        cucd   VARCHAR(10) NOT NULL,
+        week_s DATE NOT NULL,
+        weekno INT  NOT NULL,
+        catcd  INT  NOT NULL,
+        total  INT  NOT NULL,
+        PRIMARY KEY (cucd, week_s, catcd)
+    )
+"""
+
+# --- 差分の足し込み (UPDATE して0件なら INSERT) ---
+# UPDLOCK, HOLDLOCK: 行が無くてもそのキーの範囲をトランザクション終了まで押さえる。
+# CartStayDailySum は全店で共有する行なので、同じ日に2店が同時に登録しても
+# 両方が「0件 → INSERT」になって主キー違反にならないよう、後の方を待たせる。
+SQL_DAILY_ADD = "UPDATE CartStayDailySum WITH (UPDLOCK, HOLDLOCK) SET total = total + ? WHERE idleDate = ? AND catcd = ?"
+SQL_DAILY_INSERT = "INSERT INTO CartStayDailySum (idleDate, catcd, total) VALUES (?, ?, ?)"
+SQL_WEEKLY_ADD = "UPDATE CartStayWeekSum WITH (UPDLOCK, HOLDLOCK) SET total = total + ? WHERE cucd = ? AND week_s = ? AND catcd = ?"
+SQL_WEEKLY_INSERT = "INSERT INTO CartStayWeekSum (cucd, week_s, weekno, catcd, total) VALUES (?, ?, ?, ?, ?)"
+
+SQL_WEEK_OF_DATE = """
+    SELECT weekno, date_s
+    FROM DBA.weekno2
+    WHERE ? BETWEEN date_s AND date_e
+"""
+
+# --- 作り直し・読み出し ---
+SQL_DAILY_FROM_RAW = """
+    SELECT idleDate, catcd, COALESCE(SUM(count), 0) AS total
+    FROM CartStayCount
+    WHERE idleDate BETWEEN ? AND ?
+    GROUP BY idleDate, catcd
+"""
+
+SQL_WEEKLY_FROM_RAW = """
+    SELECT c.cucd, w.date_s AS week_s, w.weekno, c.catcd, COALESCE(SUM(c.count), 0) AS total
+    FROM CartStayCount c
+    JOIN DBA.weekno2 w ON c.idleDate BETWEEN w.date_s AND w.date_e
+    WHERE c.idleDate BETWEEN ? AND ?
+    GROUP BY c.cucd, w.date_s, w.weekno, c.catcd
+"""
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d").date()
+
+
+def _add(cur, update_sql, insert_sql, key, delta, extra=()):
+    """key の行に delta を足す。行が無ければ作る"""
+    cur.execute(update_sql, [delta] + list(key))
+    if cur.rowcount == 0:
+        cur.execute(insert_sql, list(key[:2]) + list(extra) + list(key[2:]) + [delta])
+
+
+# ============================================================
+# 登録時の差分更新
+# ============================================================
+def apply_count_change(cur, cucd, idle_date, old_values, new_values):
+    """
+    CartStayCount の (店舗, 日) の台数を old_values → new_values に書き換えた時に、
+    同じカーソル (同じトランザクション) で集計テーブルへ差分を足し込む。
+    commit は呼び出し側で行う。SUMMARY_ENABLED が False の時は何もしない。
+
+    old_values / new_values: {catcd: 台数}  (無い区分・NULL は 0 とみなす)
+    """
+    if not SUMMARY_ENABLED:
+        return
+
+    deltas = {}
+    for catcd in set(old_values) | set(new_values):
+        delta = (new_values.get(catcd) or 0) - (old_values.get(catcd) or 0)
+        if delta:
+            deltas[int(catcd)] = delta
+    if not deltas:
+        return
+
+    day = _to_date(idle_date)
+    cur.execute(SQL_WEEK_OF_DATE, (day,))
+    week = cur.fetchone()
+
+    for catcd, delta in sorted(deltas.items()):
+        _add(cur, SQL_DAILY_ADD, SQL_DAILY_INSERT, (day, catcd), delta)
+        if week is not None:
+            weekno, week_s = week[0], _to_date(week[1])
+            # INSERT の列順: cucd, week_s, weekno, catcd, total
+            _add(cur, SQL_WEEKLY_ADD, SQL_WEEKLY_INSERT, (cucd, week_s, catcd), delta, extra=(weekno,))
+
+
+# ============================================================
+# 作り直し (初回の投入・ずれた時の修正)
+# ============================================================
+def _week_bounds(cur, start_date, end_date):
+    """start_date〜end_date を、かかっている週の最初の日〜最後の日まで広げる"""
+    cur.execute("""
+        SELECT MIN(date_s), MAX(date_e)
+        FROM DBA.weekno2
+        WHERE date_e >= ? AND date_s <= ?
+    """, (start_date, end_date))
+    row = cur.fetchone()
+    lo = _to_date(row[0]) if row and row[0] is not None else start_date
+    hi = _to_date(row[1]) if row and row[1] is not None else end_date
+    return min(lo, start_date), max(hi, end_date)
+
+
+def rebuild_summary(start_date, end_date):
+    """
+    start_date〜end_date (週の境界まで広げる) の集計を CartStayCount から作り直す。
+    戻り値: {"from": 開始日, "to": 終了日, "daily_rows": 件数, "weekly_rows": 件数}
+    """
+    start_date, end_date = _to_date(start_date), _to_date(end_date)
+
+    conn = get_connection(DB_KEY, shared=False)
+    try:
+        cur = conn.cursor()
+        lo, hi = _week_bounds(cur, start_date, end_date)
+
+        cur.execute("DELETE FROM CartStayDailySum WHERE idleDate BETWEEN ? AND ?", (lo, hi))
+        cur.execute(f"""
+            INSERT INTO CartStayDailySum (idleDate, catcd, total)
+            {SQL_DAILY_FROM_RAW}
+        """, (lo, hi))
+        daily_rows = cur.rowcount
+
+        cur.execute("DELETE FROM CartStayWeekSum WHERE week_s BETWEEN ? AND ?", (lo, hi))
+        cur.execute(f"""
+            INSERT INTO CartStayWeekSum (cucd, week_s, weekno, catcd, total)
+            {SQL_WEEKLY_FROM_RAW}
+        """, (lo, hi))
+        weekly_rows = cur.rowcount
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return {"from": lo, "to": hi, "daily_rows": daily_rows, "weekly_rows": weekly_rows}
+
+
+def create_summary_tables():
+    """集計テーブルを作成する (導入時に1回だけ)"""
+    conn = get_connection(DB_KEY, shared=False)
+    try:
+        cur = conn.cursor()
+        cur.execute(DDL_DAILY)
+        cur.execute(DDL_WEEKLY)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ============================================================
+# 読み出し
+# ============================================================
+def fetch_daily_totals(cur, start_date, end_date):
+    """
+    期間内の (日付, 区分) ごとの全店合計を [(idleDate, catcd, total), ...] で返す。
+    SUMMARY_ENABLED なら CartStayDailySum から、そうでなければ CartStayCount を集計する。
+    """
+    if SUMMARY_ENABLED:
+        cur.execute("""
+            SELECT idleDate, catcd, total
+            FROM CartStayDailySum
+            WHERE idleDate BETWEEN ? AND ?
+        """, (start_date, end_date))
+    else:
+        cur.execute(SQL_DAILY_FROM_RAW, (start_date, end_date))
+    return [(_to_date(d), int(catcd), total or 0) for d, catcd, total in cur.fetchall()]
+
+
+def fetch_week_totals(cur, week_from, week_to):
+    """
+    週の開始日が week_from〜week_to の週について、(店舗, 週, 区分) ごとの合計を
+    [(cucd, week_s, weekno, catcd, total), ...] で返す。
+    week_from / week_to は週の境界 (開始日・終了日) で渡すこと。
+    SUMMARY_ENABLED なら CartStayWeekSum から、そうでなければ CartStayCount を集計する。
+    """
+    if SUMMARY_ENABLED:
+        cur.execute("""
+            SELECT cucd, week_s, weekno, catcd, total
+            FROM CartStayWeekSum
+            WHERE week_s BETWEEN ? AND ?
+        """, (week_from, week_to))
+    else:
+        cur.execute(SQL_WEEKLY_FROM_RAW, (week_from, week_to))
+    return [
+        (str(cucd).strip(), _to_date(week_s), int(weekno), int(catcd), total or 0)
+        for cucd, week_s, weekno, catcd, total in cur.fetchall()
+    ]
+
+
+if __name__ == "__main__":
+    import sys
+
+    usage = "使い方: python -m common.cart_stay_summary create | rebuild 開始日 終了日 (YYYY-MM-DD)"
+    args = sys.argv[1:]
+    if args[:1] == ["create"]:
+        create_summary_tables()
+        print("集計テーブルを作成しました")
+    elif args[:1] == ["rebuild"] and len(args) == 3:
+        print(rebuild_summary(args[1], args[2]))
+    else:
+        print(usage)
+        sys.exit(1)
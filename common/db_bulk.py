@@ -0,0 +1,81 @@
+"""
+common/db_bulk.py
+-----------------
+まとめて読む・まとめて書くための共通処理。
+
+1行ずつ SELECT / INSERT するとDBとの往復回数が行数に比例して増えるため、
+キーをまとめて IN (...) で引く、行をまとめて executemany する、といった処理をここに置く。
+"""
+
+from .db_connection import supports_fast_executemany
+
+# IN (...) 1回あたりのキー数
+# (SQL Server のパラメータ上限 2100 を超えない範囲で、SQL Anywhere でも無理のない件数)
+IN_CHUNK_SIZE = 500
+
+# executemany 1回あたりの行数
+BULK_BATCH_SIZE = 1000
+
+
+def code_key(code):
+    """
+    DBから引いた行を、入力されたコードで引き当てる時のキー。
+    DB側の比較 (cucd = ? など) は大文字小文字・末尾空白を区別しないため、それに合わせる。
+    """
+    return str(code).strip().upper()
+
+
+def chunked(seq, size):
+    """リストを size 件ずつに分けて返す"""
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def fetch_in_chunks(cursor, sql, keys, chunk_size=IN_CHUNK_SIZE, params=()):
+    """
+    sql 中の {placeholders} を "?,?,..." に置き換え、keys を chunk_size 件ずつ問い合わせて全行を返す。
+
+    例:
+        rows = fetch_in_chunks(cursor,
+                               "SELECT vecd, nmkj FROM DBA.venmf WHERE vecd IN ({placeholders})",
+                               vendor_codes)
+
+    Args:
+        params: IN 句より前にある ? の値 (各チャンクの先頭に付ける)
+    """
+    keys = list(dict.fromkeys(keys))  # 重複除去 (順序は保持)
+    rows = []
+    for chunk in chunked(keys, chunk_size):
+        cursor.execute(
+            sql.format(placeholders=",".join(["?"] * len(chunk))),
+            list(params) + chunk,
+        )
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def bulk_insert(cursor, sql, rows, db_key=None, batch_size=BULK_BATCH_SIZE):
+    """
+    rows (パラメータのリスト) を batch_size 件ずつ executemany で登録し、登録件数を返す。
+    commit / rollback は呼び出し側で行う。
+
+    db_key を渡すと、そのDBが対応していれば fast_executemany を有効にする
+    (SQL Server では1バッチ1往復になる)。終わったら元の設定に戻す。
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    if not rows:
+        return 0
+
+    use_fast = bool(db_key) and supports_fast_executemany(db_key)
+    if use_fast:
+        previous = getattr(cursor, "fast_executemany", False)
+        cursor.fast_executemany = True
+    try:
+        for chunk in chunked(rows, batch_size):
+            cursor.executemany(sql, chunk)
+    finally:
+        if use_fast:
+            cursor.fast_executemany = previous
+
+    return len(rows)
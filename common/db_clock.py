@@ -0,0 +1,154 @@
+"""
+common/db_clock.py
+------------------
+DBサーバー時刻のキャッシュ。
+
+受付時間チェックのたびに SELECT CURRENT_TIMESTAMP を投げる代わりに、
+ときどきDB時刻を取得して「ローカルの単調時計(time.monotonic)との差」を覚えておき、
+now() はその差を使ってローカルで計算する。
+
+・再同期の間隔: RESYNC_SECONDS (この間隔ごとにDB時刻を取り直すので、ずれはこの範囲に収まる)
+・取得失敗時: 前回の同期結果があればそれを使い続け、RETRY_SECONDS 後に再挑戦する
+             一度も取れていなければ、従来どおりWebサーバーの時刻を返す
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .db_connection import get_connection
+
+RESYNC_SECONDS = 300   # DB時刻を取り直す間隔(秒)
+RETRY_SECONDS = 30     # 取得に失敗した時、次に試すまでの間隔(秒)
+
+
+class DBClock:
+    """
+    1つのDBキーに対する時計。
+    """
+
+    def __init__(self, target_db="master", resync_seconds=RESYNC_SECONDS, retry_seconds=RETRY_SECONDS):
+        self.target_db = target_db
+        self.resync_seconds = resync_seconds
+        self.retry_seconds = retry_seconds
+
+        self._lock = threading.Lock()
+        self._base_db_time = None     # 同期時点のDB時刻
+        self._base_mono = None        # 同期時点の time.monotonic()
+        self._next_sync = 0.0         # 次に同期する monotonic 時刻
+
+        self.skew = None              # DB時刻 - Webサーバー時刻 (timedelta)
+        self.round_trip = None        # 同期時の往復時間(秒)。誤差はこの半分以内
+        self.sync_count = 0
+        self.error_count = 0
+        self.last_error = None
+
+    def now(self):
+        """
+        DBサーバーの現在時刻 (推定値) を返す。
+        """
+        if time.monotonic() >= self._next_sync:
+            self._sync_if_due()
+
+        base_db_time, base_mono = self._base_db_time, self._base_mono
+        if base_db_time is None:
+            # 一度も取れていない → フェイルセーフとしてWebサーバーの現在時刻
+            return datetime.now()
+        return base_db_time + timedelta(seconds=time.monotonic() - base_mono)
+
+    def _sync_if_due(self):
+        # 同時に期限切れを検知しても、DBへ問い合わせるのは1スレッドだけ
+        if not self._lock.acquire(blocking=self._base_db_time is None):
+            return
+        try:
+            if time.monotonic() < self._next_sync:
+                return
+            self.sync()
+        finally:
+            self._lock.release()
+
+    def sync(self):
+        """
+        DB時刻を取得して基準を更新する。成功すれば True。
+        """
+        conn = None
+        try:
+            conn = get_connection(self.target_db)
+            cursor = conn.cursor()
+
+            # 一般的なSQL (Sybase, SQL Anywhere, SQL Server, PostgreSQL等で動作)
+            sent = time.monotonic()
+            cursor.execute("SELECT CURRENT_TIMESTAMP")
+            row = cursor.fetchone()
+            received = time.monotonic()
+
+            if not row or not row[0]:
+                raise ValueError("CURRENT_TIMESTAMP が取得できませんでした")
+
+            # DBが時刻を読んだのは往復のほぼ中間とみなす
+            mid = sent + (received - sent) / 2
+            self._base_db_time = row[0]
+            self._base_mono = mid
+            self.round_trip = received - sent
+            self.skew = row[0] - (datetime.now() - timedelta(seconds=received - mid))
+            self.sync_count += 1
+            self._next_sync = received + self.resync_seconds
+            return True
+
+        except Exception as e:
+            print(f"[WARNING] DB時刻取得失敗: {str(e)} -- "
+                  + ("前回の同期結果を使用します" if self._base_db_time else "システム時刻を使用します"))
+            self.error_count += 1
+            self.last_error = str(e)
+            self._next_sync = time.monotonic() + self.retry_seconds
+            return False
+
+        finally:
+            if conn:
+                conn.close()
+
+    def invalidate(self):
+        """次の now() で必ず取り直す"""
+        self._next_sync = 0.0
+
+    def status(self):
+        """同期状況 (ずれ・往復時間・最終同期からの経過秒など) を返す"""
+        age = None
+        if self._base_mono is not None:
+            age = time.monotonic() - self._base_mono
+        return {
+            "target_db": self.target_db,
+            "synced": self._base_db_time is not None,
+            "skew_seconds": self.skew.total_seconds() if self.skew is not None else None,
+            "round_trip_seconds": self.round_trip,
+            "seconds_since_sync": age,
+            "resync_seconds": self.resync_seconds,
+            "sync_count": self.sync_count,
+            "error_count": self.error_count,
+            "last_error": self.last_error,
+        }
+
+
+_clocks = {}
+_clocks_lock = threading.Lock()
+
+
+def get_db_clock(target_db="master"):
+    """
+    DBキーごとの時計を返す (プロセス内で共有)。
+    """
+    clock = _clocks.get(target_db)
+    if clock is None:
+        with _clocks_lock:
+            clock = _clocks.get(target_db)
+            if clock is None:
+                clock = DBClock(target_db)
+                _clocks[target_db] = clock
+    return clock
+
+
+def get_clock_status():
+    """
+    全ての時計の同期状況を {db_key: {...}} で返す。
+    """
+    return {key: clock.status() for key, clock in list(_clocks.items())}
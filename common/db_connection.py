@@ -1,88 +1,363 @@
-"""
-common/db_connection.py
------------------------
-アプリ共通のDB接続モジュール。SQL Server / SQL Anywhere 両対応。
-接続先を名前で指定して呼び出す。
-"""
-
-import pyodbc
-
-# 各アプリ用のDB接続定義
-DB_CONFIGS = {
-    # SQL Anywhere
-    "master": {
-        "TYPE": "SQLAnywhere",
-        "DRIVER": "{SQL Anywhere 12}",
-        "UID": "dba",
-        "PWD": "jsndba",
-        "DBN": "master",
-        "ENG": "asantkikan01",
-        "LINKS": "TCPIP(HOST=asantkikan01x64;PORT=2638)"
-    },
-
-    # SQL Server
-    # インスタンスがない場合は、空白で設定すること
-    # インスタンスの代わりにポート指定をしたい場合は、
-    #   "SERVER": "SQLS08-14,1433"
-    # のように設定すること(INSTANCEは空白にする)
-    "tenposeisan": {
-        "TYPE": "SQLServer",
-        "SERVER": "DB-dataag1",
-        "INSTANCE": "TENPOSEISAN",
-        "DATABASE": "tenpo_seisan",
-        "USER": "tenpo",
-        "PASSWORD": "tenpo3080"
-    },
-    "SQLS08-14": {
-        "TYPE": "SQLServer",
-        "SERVER": "SQLS08-14",
-        "INSTANCE": "",
-        "DATABASE": "JSNDWH-b",
-        "USER": "sqlsadmin",
-        "PASSWORD": "Jason3080"
-    }
-}
-
-def get_connection(db_key: str):
-    """
-    DB接続を取得。
-    db_key: "master", "tenposeisan" など
-    """
-    if db_key not in DB_CONFIGS:
-        raise ValueError(f"Unknown DB key: {db_key}")
-
-    cfg = DB_CONFIGS[db_key]
-    db_type = cfg.get("TYPE", "SQLServer")
-
-    if db_type == "SQLAnywhere":
-        # SQL Anywhere接続文字列
-        conn_str = (
-            f"DRIVER={cfg['DRIVER']};"
-            f"UID={cfg['UID']};"
-            f"PWD={cfg['PWD']};"
-            f"DBN={cfg['DBN']};"
-            f"ENG={cfg['ENG']};"
-            f"LINKS={cfg['LINKS']};"
-        )
-
-    elif db_type == "SQLServer":
-        # サーバー指定（インスタンスがある場合のみ結合）
-        if cfg.get("INSTANCE"):
-            server_str = f"{cfg['SERVER']}\\{cfg['INSTANCE']}"
-        else:
-            server_str = cfg["SERVER"]  # ← インスタンスなし
-
-        # SQL Server接続文字列
-        conn_str = (
-            "DRIVER={ODBC Driver 17 for SQL Server};"
-            f"SERVER={server_str};"
-            f"DATABASE={cfg['DATABASE']};"
-            f"UID={cfg['USER']};"
-            f"PWD={cfg['PASSWORD']};"
-            "TrustServerCertificate=yes;"
-        )
-
-    else:
-        raise ValueError(f"Unsupported DB type: {db_type}")
-
-    return pyodbc.connect(conn_str)
+"""
+common/db_connection.py
+-----------------------
+アプリ共通のDB接続モジュール。SQL Server / SQL Anywhere 両対応。
+接続先を名前で指定して呼び出す。
+
+接続はDBキーごとのプール(common/db_pool.py)から貸し出す。
+呼び出し側は従来どおり close() または with で使えばよい (close() でプールへ返却)。
+
+Flask のリクエスト処理中は、同じDBキーの接続を1本だけ借りて使い回す (flask.g に保持)。
+リクエスト終了時 (teardown_appcontext) にまとめてプールへ返す。
+別トランザクションが必要な処理は get_connection(db_key, shared=False) で専用の接続を取ること。
+"""
+
+import threading
+
+import pyodbc
+from flask import g, has_app_context
+
+from .db_pool import ConnectionPool
+
+# 各アプリ用のDB接続定義
+DB_CONFIGS = {
+    # SQL Anywhere
+    "master": {
+        "TYPE": "SQLAnywhere",
+        "DRIVER": "{SQL Anywhere 12}",
+        "UID": "dba",
+        "PWD": "jsndba",
+        "DBN": "master",
+        "ENG": "asantkikan01",
+        "LINKS": "TCPIP(HOST=asantkikan01x64;PORT=2638)"
+    },
+
+    # SQL Server
+    # インスタンスがない場合は、空白で設定すること
+    # インスタンスの代わりにポート指定をしたい場合は、
+    #   "SERVER": "SQLS08-14,1433"
+    # のように設定すること(INSTANCEは空白にする)
+    "tenposeisan": {
+        "TYPE": "SQLServer",
+        "SERVER": "DB-dataag1",
+        "INSTANCE": "TENPOSEISAN",
+        "DATABASE": "tenpo_seisan",
+        "USER": "tenpo",
+        "PASSWORD": "tenpo3080"
+    },
+    "SQLS08-14": {
+        "TYPE": "SQLServer",
+        "SERVER": "SQLS08-14",
+        "INSTANCE": "",
+        "DATABASE": "JSNDWH-b",
+        "USER": "sqlsadmin",
+        "PASSWORD": "Jason3080"
+    }
+}
+
+# コネクションプールの既定値
+# DB_CONFIGS の各定義に "POOL": {"max_size": 20} のように書けば、DBキー単位で上書きできる
+POOL_DEFAULTS = {
+    "min_size": 1,        # アイドル破棄しても残す本数
+    "max_size": 10,       # 同時貸出の上限
+    "idle_timeout": 600,  # この秒数使われなかった接続は切断する
+    "check_after": 30,    # この秒数以上使っていない接続は貸出前に SELECT 1 で確認する
+    "wait_timeout": 15,   # 上限到達時に返却を待つ秒数
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def build_connection_string(db_key: str) -> str:
+    """
+    DBキーから ODBC 接続文字列を組み立てる。
+    """
+    if db_key not in DB_CONFIGS:
+        raise ValueError(f"Unknown DB key: {db_key}")
+
+    cfg = DB_CONFIGS[db_key]
+    db_type = cfg.get("TYPE", "SQLServer")
+
+    if db_type == "SQLAnywhere":
+        # SQL Anywhere接続文字列
+        conn_str = (
+            f"DRIVER={cfg['DRIVER']};"
+            f"UID={cfg['UID']};"
+            f"PWD={cfg['PWD']};"
+            f"DBN={cfg['DBN']};"
+            f"ENG={cfg['ENG']};"
+            f"LINKS={cfg['LINKS']};"
+        )
+
+    elif db_type == "SQLServer":
+        # サーバー指定（インスタンスがある場合のみ結合）
+        if cfg.get("INSTANCE"):
+            server_str = f"{cfg['SERVER']}\\{cfg['INSTANCE']}"
+        else:
+            server_str = cfg["SERVER"]  # ← インスタンスなし
+
+        # SQL Server接続文字列
+        conn_str = (
+            "DRIVER={ODBC Driver 17 for SQL Server};"
+            f"SERVER={server_str};"
+            f"DATABASE={cfg['DATABASE']};"
+            f"UID={cfg['USER']};"
+            f"PWD={cfg['PASSWORD']};"
+            "TrustServerCertificate=yes;"
+        )
+
+    else:
+        raise ValueError(f"Unsupported DB type: {db_type}")
+
+    return conn_str
+
+
+def supports_fast_executemany(db_key: str) -> bool:
+    """
+    pyodbc の fast_executemany (パラメータ配列でまとめて送る) を使ってよいDBか。
+    ODBC Driver 17 for SQL Server では使える。SQL Anywhere は既定で使わない。
+    DB_CONFIGS の各定義に "FAST_EXECUTEMANY": True/False を書けば上書きできる。
+    """
+    cfg = DB_CONFIGS.get(db_key, {})
+    return bool(cfg.get("FAST_EXECUTEMANY", cfg.get("TYPE", "SQLServer") == "SQLServer"))
+
+
+def connect_direct(db_key: str):
+    """
+    プールを使わずに物理接続を1本作る (close() で切断される)。
+    """
+    return pyodbc.connect(build_connection_string(db_key))
+
+
+def get_pool(db_key: str) -> ConnectionPool:
+    """
+    DBキーに対応するプールを返す (初回に作成)。
+    """
+    pool = _pools.get(db_key)
+    if pool is not None:
+        return pool
+
+    # 未定義のキーはここでエラーにする
+    build_connection_string(db_key)
+
+    created = False
+    with _pools_lock:
+        pool = _pools.get(db_key)
+        if pool is None:
+            options = dict(POOL_DEFAULTS)
+            options.update(DB_CONFIGS[db_key].get("POOL", {}))
+            pool = ConnectionPool(lambda: connect_direct(db_key), name=db_key, **options)
+            _pools[db_key] = pool
+            created = True
+
+    # min_size までの接続は、他のキーの取得を止めないようロックの外で作る
+    if created:
+        pool.fill()
+    return pool
+
+
+def get_connection(db_key: str, shared: bool = True):
+    """
+    DB接続を取得。
+    db_key: "master", "tenposeisan" など
+    shared: True  → リクエスト中は同じDBキーの接続を共有する (既定)
+            False → 共有せず専用の接続を借りる (独自にトランザクション・ロックを持つ処理用)
+
+    使い終わったら close() するか、with で囲むこと。
+    (with を抜けると commit / 例外時 rollback する。pyodbc と同じ動き)
+    """
+    if shared and has_app_context():
+        return _get_request_connection(db_key)
+    return get_pool(db_key).acquire()
+
+
+# ==========================================
+# リクエスト単位の接続共有
+# ==========================================
+class RequestConnection:
+    """
+    1リクエスト内で共有する接続 (DBキーごとに1本)。
+
+    get_connection() は借りるたびに _SharedHandle を返す。トランザクションを持つのは
+    「他に借りている人がいない時に借りた利用者 (owner)」だけで、その間に借りた入れ子の利用者
+    (キャッシュの読み込み・ヘルパー関数など) は呼び出し元のトランザクションを壊さない。
+      ・入れ子の commit()    : すぐには確定せず、owner が終わる時にまとめて確定する
+      ・入れ子の rollback()  : owner のトランザクションを取り消し専用にする (owner の commit はエラー)
+      ・入れ子の autocommit  : 変更できない (独自のトランザクションが要る処理は shared=False を使う)
+    owner が close した時、未確定分は pyodbc の close と同様に rollback する
+    (入れ子の commit が残っていれば commit する)。
+    実際の返却は release_request_connections() で行う。
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._holders = 0               # 返していない利用者の数
+        self._owner = None              # トランザクションを持つ利用者
+        self._commit_requested = False  # 入れ子の利用者が commit を求めた
+        self._rollback_only = False     # 入れ子の利用者が rollback した
+
+    def _checkout(self):
+        handle = _SharedHandle(self, is_owner=self._owner is None)
+        if handle._is_owner:
+            self._owner = handle
+        self._holders += 1
+        return handle
+
+    def _commit(self):
+        if self._rollback_only:
+            self._rollback()
+            raise RuntimeError("入れ子の処理が rollback したため、commit できません (すべて取り消しました)")
+        self._conn.commit()
+        self._commit_requested = False
+
+    def _rollback(self):
+        self._conn.rollback()
+        self._commit_requested = False
+        self._rollback_only = False
+
+    def _end(self, commit):
+        """owner の終了時: commit=True なら確定 (取り消し専用なら取り消し)、False なら取り消す"""
+        if self._conn.autocommit:
+            return
+        if commit and not self._rollback_only:
+            self._commit()
+        else:
+            self._rollback()
+
+    def _release(self, handle):
+        self._holders -= 1
+        if handle is self._owner:
+            self._owner = None
+            # pyodbc の close と同じく未確定分は rollback (入れ子の commit 待ちがあれば確定)
+            self._end(commit=self._commit_requested)
+
+    def _finish(self, exc):
+        """リクエスト終了時: close されずに残った owner の未確定分を片付ける"""
+        if self._owner is None:
+            return
+        commit = exc is None and self._commit_requested
+        print(f"[WARNING] close されていないDB接続があります。未確定分を{'commit' if commit else 'rollback'}します")
+        self._owner = None
+        self._end(commit=commit)
+
+
+class _SharedHandle:
+    """RequestConnection を借りている1人分 (get_connection の戻り値)"""
+
+    def __init__(self, shared, is_owner):
+        self._shared = shared
+        self._is_owner = is_owner
+        self._closed = False
+
+    def cursor(self):
+        return self._shared._conn.cursor()
+
+    def execute(self, *args):
+        return self._shared._conn.execute(*args)
+
+    def commit(self):
+        if self._is_owner:
+            self._shared._commit()
+        else:
+            self._shared._commit_requested = True
+
+    def rollback(self):
+        if self._is_owner:
+            self._shared._rollback()
+        else:
+            self._shared._rollback_only = True
+
+    @property
+    def autocommit(self):
+        return self._shared._conn.autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if not self._is_owner:
+            if bool(value) == bool(self._shared._conn.autocommit):
+                return
+            raise RuntimeError("共有中の接続の autocommit は変更できません。shared=False で接続してください")
+        self._shared._conn.autocommit = value
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._shared._conn, name)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._shared._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            # 入れ子の with は、commit / rollback を owner に任せる
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.close()
+        return False
+
+
+def _get_request_connection(db_key):
+    cache = g.get("_db_connections")
+    if cache is None:
+        cache = {}
+        g._db_connections = cache
+
+    shared = cache.get(db_key)
+    if shared is None:
+        shared = RequestConnection(get_pool(db_key).acquire())
+        cache[db_key] = shared
+    return shared._checkout()
+
+
+def release_request_connections(exc=None):
+    """
+    リクエスト中に共有した接続をすべてプールへ返す。
+    main.py で app.teardown_appcontext に登録する。
+    """
+    cache = g.pop("_db_connections", None)
+    if not cache:
+        return
+    for shared in cache.values():
+        try:
+            shared._finish(exc)
+        except Exception as e:
+            print(f"[DB] 未確定分の片付けに失敗しました: {e}")
+        try:
+            shared._conn.close()
+        except Exception as e:
+            print(f"[DB] 接続の返却に失敗しました: {e}")
+
+
+def init_app(app):
+    """
+    Flaskアプリにリクエスト終了時の接続返却を登録する。
+    """
+    app.teardown_appcontext(release_request_connections)
+
+
+def get_pool_stats():
+    """
+    各プールのカウンタ (貸出・待ち・新規接続 など) を {db_key: {...}} で返す。
+    """
+    return {key: pool.snapshot() for key, pool in list(_pools.items())}
+
+
+def close_all_pools():
+    """
+    待機中の接続をすべて切断する (テストやプロセス終了時用)。
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
@@ -5,9 +5,11 @@ common/db_master_access.py
 autosupply_web / cart_stay_register から共通利用される。
 """
 # from common.db_connection import get_connection
+from common.store_master import get_store_directory
 
 # --- 店舗CDチェック + 店舗名（nmkn）取得
 # ---    戻り値: (ok: bool, msg: str, cucd_normalized: str|None, nmkj: str|None)
+# ---    店舗マスタはキャッシュ (common.store_master) から引くため、conn は使用しない (互換のため引数は残す)
 def chk_cucd(conn, cucd):
     if not cucd:
         return False, "店舗CDを入力してください。", None, None
@@ -16,22 +18,11 @@ def chk_cucd(conn, cucd):
     if len(cucd) != 3:
         return False, "店舗CDは3桁で入力してください。", None, None
 
-    #sql = "SELECT nmkj FROM Cusmf04 WHERE cucd = ? AND cukb = '0'"
-    sql = f"""
-            SELECT REPLACE(a.nmkj, 'ジェーソン', '') AS nmkj_trimmed 
-             FROM DBA.cusmf04 a 
-             WHERE a.cucd = ? AND a.cukb = '0'
-             AND a.cucd NOT IN (
-               SELECT cucd FROM DBA.closemf04 GROUP BY cucd);
-            """
-    cur = conn.cursor()
-    cur.execute(sql, (cucd,))
-    row = cur.fetchone()
-
-    if not row:
+    # 閉店店舗 (closemf04) は不正扱い
+    hit = get_store_directory().lookup(cucd)
+    if not hit:
         return False, "不正な店舗CDです", None, None
 
-    nmkj = getattr(row, "nmkj_trimmed", row[0] if row else "")
+    nmkj = hit[1]
 
     return True, "", cucd, nmkj  # ← (OK, メッセージ, 正規化CUCD, 取得した店舗名)
-
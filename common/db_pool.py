@@ -0,0 +1,360 @@
+"""
+common/db_pool.py
+-----------------
+DBキー単位のコネクションプール。
+get_connection() の裏側で使用し、TCP接続・認証のハンドシェイクを毎回行わないようにする。
+
+・最小/最大接続数 (min_size / max_size)。min_size までは fill() で先に接続しておく
+・一定時間使われていない接続の破棄 (idle_timeout)
+・貸出時の死活確認 (しばらく使っていない接続だけ "SELECT 1" を投げる)
+・貸出回数・待ち回数・新規接続回数などのカウンタ
+
+接続の生成は connect_func に任せるため、pyodbc をフェイクに差し替えて試験できる。
+"""
+
+import threading
+import time
+
+
+class PoolTimeoutError(Exception):
+    """最大接続数に達したまま、待機時間内に接続が返却されなかった"""
+
+
+class _PoolEntry:
+    """プール内で保持する生の接続と、最後に使われた時刻"""
+    __slots__ = ("raw", "last_used")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.last_used = time.monotonic()
+
+
+class PooledConnection:
+    """
+    プールから貸し出す接続のラッパ。
+    pyodbc の Connection と同じ使い方ができる (cursor / commit / rollback / close / with)。
+
+    ・close() で物理切断せず、未コミット分をロールバックしてプールへ返す
+    ・with ブロックを抜けると pyodbc と同様に commit (例外時は rollback) し、プールへ返す
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    @property
+    def raw(self):
+        if self._entry is None:
+            raise RuntimeError("返却済みの接続は使用できません")
+        return self._entry.raw
+
+    @property
+    def closed(self):
+        return self._entry is None
+
+    # --- pyodbc.Connection 互換 ---
+    def cursor(self):
+        return self.raw.cursor()
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def execute(self, *args):
+        return self.raw.execute(*args)
+
+    @property
+    def autocommit(self):
+        return self.raw.autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self.raw.autocommit = value
+
+    def __getattr__(self, name):
+        # timeout, getinfo など、その他の属性は生の接続へ委譲
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.raw, name)
+
+    def close(self):
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool.release(entry)
+
+    def discard(self):
+        """接続が壊れている場合など、プールへ返さずに物理切断する"""
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool.release(entry, broken=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._entry is not None and not self.raw.autocommit:
+                if exc_type is None:
+                    self.raw.commit()
+                else:
+                    self.raw.rollback()
+        finally:
+            self.close()
+        return False
+
+    def __del__(self):
+        # close() し忘れた接続は、GC のタイミングでプールへ戻す
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    1つのDBキーに対するコネクションプール。
+
+    Args:
+        connect_func: 生の接続を返す関数 (引数なし)
+        min_size: アイドル破棄をしても残しておく接続数
+        max_size: 同時に貸し出せる最大接続数
+        idle_timeout: この秒数使われなかった接続は破棄する (min_size までは残す)
+        check_after: この秒数以上アイドルだった接続は、貸出前に死活確認する (0なら毎回)
+        wait_timeout: max_size に達した時に返却を待つ秒数
+        ping_sql: 死活確認に使うSQL
+    """
+
+    def __init__(self, connect_func, min_size=0, max_size=10, idle_timeout=300,
+                 check_after=30, wait_timeout=10, ping_sql="SELECT 1", name=""):
+        if max_size < 1:
+            raise ValueError("max_size は1以上を指定してください")
+        self.name = name
+        self._connect = connect_func
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.wait_timeout = wait_timeout
+        self.ping_sql = ping_sql
+
+        self._cond = threading.Condition()
+        self._idle = []          # 返却済み(待機中)の接続。末尾が最新
+        self._in_use = 0         # 貸出中の本数
+        self._creating = 0       # 接続処理中の本数 (ロック外で接続するため)
+
+        self.stats = {
+            "checkouts": 0,      # 貸出回数
+            "waits": 0,          # max_size に達して待たされた回数
+            "creations": 0,      # 物理接続した回数
+            "reuses": 0,         # プールの接続を再利用した回数
+            "ping_failures": 0,  # 死活確認で破棄した回数
+            "evictions": 0,      # アイドル超過で破棄した回数
+            "discards": 0,       # 返却時のエラー等で破棄した回数
+            "timeouts": 0,       # 待機タイムアウト回数
+        }
+
+    # ------------------------------------------
+    # 貸出
+    # ------------------------------------------
+    def acquire(self):
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                expired = self._take_expired_locked()
+
+                if self._idle:
+                    entry = self._idle.pop()
+                    self._in_use += 1
+                    reuse = True
+                elif self._in_use + self._creating + len(self._idle) < self.max_size:
+                    self._creating += 1
+                    entry = None
+                    reuse = False
+                elif expired:
+                    # 破棄した接続を閉じてから、もう一度確認する
+                    entry = None
+                    reuse = None
+                else:
+                    # 上限到達 → 返却待ち
+                    if not waited:
+                        self.stats["waits"] += 1
+                        waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"DB接続プール({self.name})が上限({self.max_size})に達しています"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            # 切断もネットワーク待ちになることがあるので、ロックの外で行う
+            self._close_entries(expired)
+            if reuse is None:
+                continue
+
+            if reuse:
+                # しばらく使っていない接続は、渡す前に生きているか確認
+                if self._is_alive(entry):
+                    with self._cond:
+                        self.stats["checkouts"] += 1
+                        self.stats["reuses"] += 1
+                    return PooledConnection(self, entry)
+
+                self._close_raw(entry.raw)
+                with self._cond:
+                    self._in_use -= 1
+                    self.stats["ping_failures"] += 1
+                    self._cond.notify()
+                continue
+
+            # 新規接続 (ネットワーク待ちになるのでロックの外で行う)
+            try:
+                raw = self._connect()
+            except Exception:
+                with self._cond:
+                    self._creating -= 1
+                    self._cond.notify()
+                raise
+
+            with self._cond:
+                self._creating -= 1
+                self._in_use += 1
+                self.stats["creations"] += 1
+                self.stats["checkouts"] += 1
+            return PooledConnection(self, _PoolEntry(raw))
+
+    def _is_alive(self, entry):
+        if time.monotonic() - entry.last_used < self.check_after:
+            return True
+        cursor = None
+        try:
+            cursor = entry.raw.cursor()
+            cursor.execute(self.ping_sql)
+            cursor.fetchone()
+            return True
+        except Exception as e:
+            print(f"[DB Pool] {self.name}: 死活確認NGのため再接続します: {e}")
+            return False
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    # ------------------------------------------
+    # 返却
+    # ------------------------------------------
+    def release(self, entry, broken=False):
+        if not broken:
+            try:
+                # 未コミット分は pyodbc の close と同じく破棄し、状態を初期値へ戻す
+                entry.raw.rollback()
+                if entry.raw.autocommit:
+                    entry.raw.autocommit = False
+            except Exception:
+                broken = True
+
+        if broken:
+            self._close_raw(entry.raw)
+            with self._cond:
+                self._in_use -= 1
+                self.stats["discards"] += 1
+                self._cond.notify()
+            return
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append(entry)
+            expired = self._take_expired_locked()
+            self._cond.notify()
+        self._close_entries(expired)
+
+    # ------------------------------------------
+    # 事前接続
+    # ------------------------------------------
+    def fill(self):
+        """
+        接続数が min_size になるまで接続しておく (get_pool でプールを作った時に呼ぶ)。
+        接続できなかった場合は警告だけ出し、貸出時に改めて接続する。
+        """
+        while True:
+            with self._cond:
+                if self._in_use + self._creating + len(self._idle) >= self.min_size:
+                    return
+                self._creating += 1
+
+            try:
+                raw = self._connect()
+            except Exception as e:
+                with self._cond:
+                    self._creating -= 1
+                    self._cond.notify()
+                print(f"[DB Pool] {self.name}: 事前接続に失敗しました: {e}")
+                return
+
+            with self._cond:
+                self._creating -= 1
+                self._idle.append(_PoolEntry(raw))
+                self.stats["creations"] += 1
+                self._cond.notify()
+
+    # ------------------------------------------
+    # アイドル接続の整理
+    # ------------------------------------------
+    def _take_expired_locked(self):
+        """
+        アイドル超過の接続をプールから外して返す (ロックを持ったまま呼ぶ)。
+        切断は呼び出し側がロックの外で _close_entries で行う。
+        """
+        if not self._idle or self.idle_timeout is None:
+            return []
+        now = time.monotonic()
+        keep = []
+        expired = []
+        # 新しい順に見て、min_size を超える古い接続だけ破棄する
+        for entry in reversed(self._idle):
+            total = self._in_use + len(keep)
+            if now - entry.last_used > self.idle_timeout and total >= self.min_size:
+                expired.append(entry)
+            else:
+                keep.append(entry)
+        if not expired:
+            return []
+        keep.reverse()
+        self._idle = keep
+        self.stats["evictions"] += len(expired)
+        return expired
+
+    def close_all(self):
+        """待機中の接続をすべて切断する (貸出中のものは返却時に通常どおり戻る)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        self._close_entries(idle)
+
+    @classmethod
+    def _close_entries(cls, entries):
+        for entry in entries:
+            cls._close_raw(entry.raw)
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def snapshot(self):
+        """カウンタと現在の接続数を返す"""
+        with self._cond:
+            data = dict(self.stats)
+            data["idle"] = len(self._idle)
+            data["in_use"] = self._in_use
+            data["max_size"] = self.max_size
+            return data
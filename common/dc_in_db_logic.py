@@ -1,12 +1,17 @@
+import base64
+import json
+import threading
 import time
 import unicodedata
-import math
 from itertools import groupby
 import datetime
 import calendar
 
 # ★相対インポート (commonフォルダのdb_connectionを使う)
 from .db_connection import get_connection
+from .db_bulk import code_key, fetch_in_chunks, bulk_insert
+from .Get_DB_Time import get_db_server_time as _get_common_db_time
+from .dc_in_line import VoucherLine, center_code_of, to_decimal
 
 TARGET_DB = 'master'
 
@@ -38,21 +43,9 @@ def clean_str(text):
 def get_db_server_time(target_db='master'):
     """
     master DBの時刻を取得。失敗したらAPサーバー時刻を返す。
+    (共通の時計キャッシュを使うので、毎回DBへは問い合わせない)
     """
-    conn = None
-    try:
-        conn = get_connection(target_db)
-        cursor = conn.cursor()
-        cursor.execute("SELECT CURRENT_TIMESTAMP")
-        row = cursor.fetchone()
-        if row:
-            return row[0]
-    except Exception as e:
-        print(f"DB Time Error: {e}")
-    finally:
-        if conn: conn.close()
-    
-    return datetime.datetime.now()
+    return _get_common_db_time(target_db)
 
 # ==========================================
 # 共通関数: 列名を強制的に小文字にする
@@ -151,99 +144,281 @@ def _build_search_where(filters):
 # ==========================================
 # ★修正: 一覧取得 (共通ロジックを使用)
 # ==========================================
+def _voucher_select_sql(where_sql, top='', extra_columns=''):
+    """
+    一覧取得 (画面表示・CSV出力・ページ送り) で共通の SELECT ～ WHERE を生成する
+      top          : "TOP n " (件数を絞る時)
+      extra_columns: 末尾に足す列 (", 式 as 名前" の形)
+    """
+    inner_columns = """
+        deno, cocd, no, cucd, bucd, oddt, dldt, trdk, vecd, 
+        odsu, dltn, prtn, md, dc, thrflg, conf, sign, rgdt, updt, upti
+    """
+
+    return f"""
+        SELECT {top}
+            T.deno as voucher_id,
+            T.no   as line_no,
+            CASE T.cucd
+                WHEN 'D03' THEN '守谷C'
+                WHEN 'D04' THEN '狭山日高C'
+                ELSE T.cucd
+            END as center,
+            T.cucd as center_code,
+            T.dldt as delivery_date,
+            T.bucd as dept_code,
+            T.vecd as vendor_code,
+            T.sign as operator,
+            T.cocd as item_code,
+            T.oddt as order_date,
+            T.trdk as trans_code,
+            T.odsu as order_qty,
+            T.dltn as cost_price,
+            T.prtn as total_disc,
+            T.md   as fee_md,
+            T.dc   as fee_dc,
+            T.thrflg as pass_flag,
+            T.conf   as conf_flag,
+            T.rgdt   as reg_date,
+            T.updt   as update_date,
+            T.upti   as update_time,
+            V.nmkj as vendor,
+            N.nmkj as dept_name,
+            M.hnam as first_p_name,
+            M.mnam as manufacturer,
+            L.batch_id as batch_id
+            {extra_columns}
+
+        FROM (
+            SELECT {inner_columns} FROM DBA.dcnyu03
+            UNION ALL
+            SELECT {inner_columns} FROM DBA.dcnyu04
+        ) AS T
+        LEFT JOIN DBA.dc_batch_log AS L ON T.deno = L.deno_main
+        LEFT JOIN DBA.venmf AS V ON T.vecd = V.vecd
+        LEFT JOIN DBA.nammf04 AS N ON T.bucd = N.bucd AND N.brcd = '00'
+        LEFT JOIN DBA.comf1 AS M ON T.cocd = M.cocd
+        WHERE 1=1
+        {where_sql}
+    """
+
+
+def _build_voucher_list_sql(filters, is_export):
+    """
+    一覧取得 (画面表示・CSV出力) のSQLとパラメータを生成する
+    戻り値: (sql, params_list)
+    """
+    # WHERE句とパラメータを生成
+    where_sql, params = _build_search_where(filters)
+
+    # 一覧表示用なので、明細行番号 = '1' を条件に追加
+    if not is_export:
+        where_sql += " AND T.no = '1'"
+
+    sql = _voucher_select_sql(where_sql)
+
+    # ソート順の処理 (既存のまま)
+    sort_col = filters.get('sort', 'voucher_id')
+    order_dir = filters.get('order', 'asc')
+    sort_map = {
+        'voucher_id': 'T.deno', 
+        'batch_id': 'L.batch_id',
+        'dept_code': 'T.bucd',
+        'dept_name': 'N.nmkj', 'center': 'T.cucd', 'delivery_date': 'T.dldt',
+        'vendor_code': 'T.vecd', 'vendor': 'V.nmkj', 'p_name': 'M.hnam',
+        'manufacturer': 'M.mnam'
+    }
+    sql_sort = sort_map.get(sort_col, 'T.deno')
+    sql += f" ORDER BY {sql_sort} {order_dir}"
+
+    return sql, params
+
+
+# ==========================================
+# 一覧画面のページ送り (キーセット方式)
+# ==========================================
+# 一覧画面の1ページの伝票数
+VOUCHER_PAGE_SIZE = 200
+
+# ページの並びを一意に決める列 (並べ替え列の後ろに付ける)
+KEYSET_COLUMNS = ['T.dldt', 'T.deno', 'T.no']
+
+# 並べ替え列 → ページ送りのキーに使う式 (LEFT JOIN 先の列は NULL になりうるので '' に寄せる)
+KEYSET_SORT_MAP = {
+    'voucher_id': 'T.deno',   # 伝票番号順 (KEYSET_COLUMNS の先頭は納品日なので、先頭に付ける)
+    'delivery_date': None,    # T.dldt は KEYSET_COLUMNS の先頭に含まれる
+    'batch_id': "COALESCE(L.batch_id, '')",
+    'dept_code': 'T.bucd',
+    'dept_name': "COALESCE(N.nmkj, '')",
+    'center': 'T.cucd',
+    'vendor_code': 'T.vecd',
+    'vendor': "COALESCE(V.nmkj, '')",
+    'p_name': "COALESCE(M.hnam, '')",
+    'manufacturer': "COALESCE(M.mnam, '')",
+}
+
+
+def encode_page_cursor(key):
+    """ページの境目の行のキー (値のリスト) → URL に載せる文字列"""
+    raw = json.dumps(list(key), ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(token):
+    """encode_page_cursor の逆。壊れた値なら None (= 先頭ページ)"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        key = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return key if isinstance(key, list) else None
+
+
+def _keyset_columns(filters):
+    """並べ替え条件から、ページ送りのキーの式と向き ('asc' / 'desc') を返す"""
+    sort_expr = KEYSET_SORT_MAP.get(filters.get('sort') or 'voucher_id')
+    order_dir = 'desc' if filters.get('order') == 'desc' else 'asc'
+    columns = ([sort_expr] if sort_expr else []) + KEYSET_COLUMNS
+    return columns, order_dir
+
+
+def _keyset_condition(columns, key, op):
+    """
+    (c1, c2, c3) > (v1, v2, v3) を行値比較を使わずに展開する
+    → c1 > ? OR (c1 = ? AND (c2 > ? OR (c2 = ? AND c3 > ?)))
+    """
+    col, rest = columns[0], columns[1:]
+    if not rest:
+        return f"{col} {op} ?", [key[0]]
+    inner_sql, inner_params = _keyset_condition(rest, key[1:], op)
+    return f"({col} {op} ? OR ({col} = ? AND {inner_sql}))", [key[0], key[0]] + inner_params
+
+
+def get_voucher_page(filters, after=None, before=None, page_size=VOUCHER_PAGE_SIZE):
+    """
+    一覧画面用に、伝票 (明細行番号 = '1') を1ページ分だけ取得する。
+    OFFSET ではなく、前ページの最後の行のキー (並べ替え列, 納品日, 伝票番号, 行番号) より
+    後ろを TOP で取り出すので、何ページ目でも読む行数は page_size + 1 件で済む。
+
+      after  : 次ページ用のカーソル (その行より後ろを返す)
+      before : 前ページ用のカーソル (その行より前を返す)
+    戻り値: {'vouchers': [...], 'next_cursor': str or None, 'prev_cursor': str or None}
+
+    件数・合計は get_voucher_summary で別に取る。
+    """
+    columns, order_dir = _keyset_columns(filters)
+    after_key = decode_page_cursor(after)
+    before_key = decode_page_cursor(before) if after_key is None else None
+
+    where_sql, params = _build_search_where(filters)
+    where_sql += " AND T.no = '1'"
+
+    backward = before_key is not None
+    boundary = before_key if backward else after_key
+    if boundary is not None and len(boundary) == len(columns):
+        forward_op = '>' if order_dir == 'asc' else '<'
+        op = {'>': '<', '<': '>'}[forward_op] if backward else forward_op
+        keyset_sql, keyset_params = _keyset_condition(columns, boundary, op)
+        where_sql += f" AND {keyset_sql}"
+        params += keyset_params
+    else:
+        # 並べ替えを変えた後などでキーの形が合わない時は先頭ページから
+        backward = False
+        boundary = None
+
+    # 前ページは逆向きに読んで、取り出した後に並べ直す
+    scan_dir = order_dir if not backward else ('desc' if order_dir == 'asc' else 'asc')
+    order_sql = ", ".join(f"{c} {scan_dir}" for c in columns)
+    key_sql = "".join(f", {c} as page_key{i}" for i, c in enumerate(columns))
+
+    sql = _voucher_select_sql(where_sql, top=f"TOP {int(page_size) + 1} ", extra_columns=key_sql)
+    sql += f" ORDER BY {order_sql}"
+
+    conn = get_connection(TARGET_DB)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+
+    n_keys = len(columns)
+    vouchers = [_voucher_row_to_dict(names[:-n_keys], row[:-n_keys]) for row in rows]
+    first_key = list(rows[0][-n_keys:]) if rows else None
+    last_key = list(rows[-1][-n_keys:]) if rows else None
+
+    if backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = boundary is not None, has_more
+
+    return {
+        'vouchers': vouchers,
+        'next_cursor': encode_page_cursor(last_key) if has_next and last_key else None,
+        'prev_cursor': encode_page_cursor(first_key) if has_prev and first_key else None,
+    }
+
+
+def _voucher_row_to_dict(columns, row):
+    row_dict = {}
+    for col, val in zip(columns, row):
+        if isinstance(val, str): row_dict[col] = val.strip()
+        else: row_dict[col] = val
+    
+    if not row_dict.get('batch_id'):
+         row_dict['batch_id'] = ''
+    return row_dict
+
+
 def get_voucher_list(filters, is_export=False):
     conn = get_connection(TARGET_DB)
     cursor = conn.cursor()
 
     try:
-        inner_columns = """
-            deno, cocd, no, cucd, bucd, oddt, dldt, trdk, vecd, 
-            odsu, dltn, prtn, md, dc, thrflg, conf, sign, rgdt, updt, upti
-        """
-        
-        # WHERE句とパラメータを生成
-        where_sql, params = _build_search_where(filters)
+        sql, params = _build_voucher_list_sql(filters, is_export)
+        cursor.execute(sql, params)
 
-        # 一覧表示用なので、明細行番号 = '1' を条件に追加
-        if not is_export:
-            where_sql += " AND T.no = '1'"
+        columns = [column[0] for column in cursor.description]
+        return [_voucher_row_to_dict(columns, row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
 
-        sql = f"""
-            SELECT 
-                T.deno as voucher_id,
-                T.no   as line_no,
-                CASE T.cucd
-                    WHEN 'D03' THEN '守谷C'
-                    WHEN 'D04' THEN '狭山日高C'
-                    ELSE T.cucd
-                END as center,
-                T.cucd as center_code,
-                T.dldt as delivery_date,
-                T.bucd as dept_code,
-                T.vecd as vendor_code,
-                T.sign as operator,
-                T.cocd as item_code,
-                T.oddt as order_date,
-                T.trdk as trans_code,
-                T.odsu as order_qty,
-                T.dltn as cost_price,
-                T.prtn as total_disc,
-                T.md   as fee_md,
-                T.dc   as fee_dc,
-                T.thrflg as pass_flag,
-                T.conf   as conf_flag,
-                T.rgdt   as reg_date,
-                T.updt   as update_date,
-                T.upti   as update_time,
-                V.nmkj as vendor,
-                N.nmkj as dept_name,
-                M.hnam as first_p_name,
-                M.mnam as manufacturer,
-                L.batch_id as batch_id
 
-            FROM (
-                SELECT {inner_columns} FROM DBA.dcnyu03
-                UNION ALL
-                SELECT {inner_columns} FROM DBA.dcnyu04
-            ) AS T
-            LEFT JOIN DBA.dc_batch_log AS L ON T.deno = L.deno_main
-            LEFT JOIN DBA.venmf AS V ON T.vecd = V.vecd
-            LEFT JOIN DBA.nammf04 AS N ON T.bucd = N.bucd AND N.brcd = '00'
-            LEFT JOIN DBA.comf1 AS M ON T.cocd = M.cocd
-            WHERE 1=1
-            {where_sql}
-        """
+# CSV出力で一度に取り出す件数
+EXPORT_FETCH_SIZE = 1000
 
-        # ソート順の処理 (既存のまま)
-        sort_col = filters.get('sort', 'voucher_id')
-        order_dir = filters.get('order', 'asc')
-        sort_map = {
-            'voucher_id': 'T.deno', 
-            'batch_id': 'L.batch_id',
-            'dept_code': 'T.bucd',
-            'dept_name': 'N.nmkj', 'center': 'T.cucd', 'delivery_date': 'T.dldt',
-            'vendor_code': 'T.vecd', 'vendor': 'V.nmkj', 'p_name': 'M.hnam',
-            'manufacturer': 'M.mnam'
-        }
-        sql_sort = sort_map.get(sort_col, 'T.deno')
-        sql += f" ORDER BY {sql_sort} {order_dir}"
+def iter_voucher_list(filters, is_export=True, fetch_size=EXPORT_FETCH_SIZE):
+    """
+    get_voucher_list と同じ内容を、fetchmany で fetch_size 件ずつ取り出しながら1件ずつ返す。
+    (大量件数のCSV出力でも、全件をメモリに載せないため)
+
+    ストリーミング中はリクエストの処理とは寿命が異なるため、専用の接続を使う。
+    最後まで読まずに中断された場合 (ブラウザ側の切断など) も、close() で接続は返却される。
+    """
+    conn = get_connection(TARGET_DB, shared=False)
+    cursor = conn.cursor()
 
+    try:
+        sql, params = _build_voucher_list_sql(filters, is_export)
         cursor.execute(sql, params)
-        
-        # ... (結果取得処理は既存と同じ) ...
+
         columns = [column[0] for column in cursor.description]
-        results = []
-        for row in cursor.fetchall():
-            row_dict = {}
-            for col, val in zip(columns, row):
-                if isinstance(val, str): row_dict[col] = val.strip()
-                else: row_dict[col] = val
-            
-            if not row_dict.get('batch_id'):
-                 row_dict['batch_id'] = ''
-                 
-            results.append(row_dict)
-        return results
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _voucher_row_to_dict(columns, row)
     finally:
         cursor.close()
         conn.close()
@@ -254,8 +429,9 @@ def get_voucher_list(filters, is_export=False):
 # ==========================================
 def get_voucher_summary(filters):
     """
-    現在のフィルタ条件に合致する伝票の「総ケース数」を計算して返す。
+    現在のフィルタ条件に合致する伝票の「総ケース数」と「伝票数」を計算して返す。
     ※明細全行を対象とし、入数マスタ(comf204)を使ってケース換算する。
+    ※伝票数は明細行番号 = '1' の行の数 (一覧画面のページ送りの総件数に使う)
     """
     conn = get_connection(TARGET_DB)
     cursor = conn.cursor()
@@ -280,13 +456,15 @@ def get_voucher_summary(filters):
                         (CASE WHEN C.irsu IS NULL OR C.irsu = 0 THEN CAST(T.odsu AS INTEGER) 
                               ELSE CAST(T.odsu AS INTEGER) / CAST(C.irsu AS INTEGER) END)
                     ELSE 0 
-                END) as sayama_total
+                END) as sayama_total,
+
+                SUM(CASE WHEN T.no = '1' THEN 1 ELSE 0 END) as voucher_count
 
             FROM (
-                SELECT cucd, bucd, vecd, dldt, cocd, odsu, deno, trdk 
+                SELECT cucd, bucd, vecd, dldt, cocd, odsu, deno, no, trdk 
                 FROM DBA.dcnyu03 
                 UNION ALL 
-                SELECT cucd, bucd, vecd, dldt, cocd, odsu, deno, trdk 
+                SELECT cucd, bucd, vecd, dldt, cocd, odsu, deno, no, trdk 
                 FROM DBA.dcnyu04
             ) AS T
             LEFT JOIN DBA.dc_batch_log AS L ON T.deno = L.deno_main
@@ -302,152 +480,18 @@ def get_voucher_summary(filters):
         
         summary = {
             'moriya': 0,
-            'sayama': 0
+            'sayama': 0,
+            'count': 0
         }
         if row:
             summary['moriya'] = int(row[0]) if row[0] else 0
             summary['sayama'] = int(row[1]) if row[1] else 0
+            summary['count'] = int(row[2]) if row[2] else 0
             
         return summary
     finally:
         cursor.close()
         conn.close()
-# ==========================================
-# 1. 一覧・検索機能 (履歴テーブル結合版)
-# ==========================================
-def get_voucher_list(filters, is_export=False):
-    conn = get_connection(TARGET_DB)
-    cursor = conn.cursor()
-
-    try:
-        # 内部でSELECTする列 (dcnyuテーブルの列)
-        inner_columns = """
-            deno, cocd, no, cucd, bucd, oddt, dldt, trdk, vecd, 
-            odsu, dltn, prtn, md, dc, thrflg, conf, sign, rgdt, updt, upti
-        """
-
-        sql = f"""
-            SELECT 
-                T.deno as voucher_id,
-                T.no   as line_no,
-                CASE T.cucd
-                    WHEN 'D03' THEN '守谷C'
-                    WHEN 'D04' THEN '狭山日高C'
-                    ELSE T.cucd
-                END as center,
-                T.cucd as center_code,
-                T.dldt as delivery_date,
-                T.bucd as dept_code,
-                T.vecd as vendor_code,
-                T.sign as operator,
-                T.cocd as item_code,
-                T.oddt as order_date,
-                T.trdk as trans_code,
-                T.odsu as order_qty,
-                T.dltn as cost_price,
-                T.prtn as total_disc,
-                T.md   as fee_md,
-                T.dc   as fee_dc,
-                T.thrflg as pass_flag,
-                T.conf   as conf_flag,
-                T.rgdt   as reg_date,
-                T.updt   as update_date,
-                T.upti   as update_time,
-                V.nmkj as vendor,
-                N.nmkj as dept_name,
-                M.hnam as first_p_name,
-                M.mnam as manufacturer,
-                
-                -- ★追加: ログテーブルからバッチIDを取得
-                L.batch_id as batch_id
-
-            FROM (
-                SELECT {inner_columns} FROM DBA.dcnyu03
-                UNION ALL
-                SELECT {inner_columns} FROM DBA.dcnyu04
-            ) AS T
-            -- ★追加: 履歴テーブル(dc_batch_log)と結合
-            LEFT JOIN DBA.dc_batch_log AS L ON T.deno = L.deno_main
-
-            LEFT JOIN DBA.venmf AS V ON T.vecd = V.vecd
-            LEFT JOIN DBA.nammf04 AS N ON T.bucd = N.bucd AND N.brcd = '00'
-            LEFT JOIN DBA.comf1 AS M ON T.cocd = M.cocd
-            WHERE 1=1
-        """
-
-        params = []
-        
-        # ★変更: import_id ではなく batch_id で検索
-        if filters.get('batch_id'): 
-            sql += " AND L.batch_id = ?"
-            params.append(filters['batch_id'])
-        
-        c_val = filters.get('center')
-        if c_val:
-            if '守谷' in c_val or c_val == 'D03':
-                sql += " AND T.cucd = 'D03'"
-            elif '狭山' in c_val or '日高' in c_val or c_val == 'D04':
-                sql += " AND T.cucd = 'D04'"
-            else:
-                sql += " AND T.cucd = ?"
-                params.append(c_val)
-
-        if filters.get('dept'):
-            sql += " AND T.bucd = ?"
-            params.append(filters['dept'])
-        if filters.get('vendor'):
-            sql += " AND T.vecd = ?"
-            params.append(filters['vendor'])
-        if filters.get('delivery_date'):
-            sql += " AND T.dldt = ?"
-            params.append(filters['delivery_date'])
-
-        v_ids = filters.get('voucher_ids')
-        if v_ids:
-            placeholders = ','.join('?' * len(v_ids))
-            sql += f" AND T.deno IN ({placeholders})"
-            params.extend(v_ids)
-
-        t_val = filters.get('type')
-        if t_val == 'jv':  
-            sql += " AND M.mnam LIKE 'JV%'"
-        elif t_val == 'regular':
-            sql += " AND (M.mnam NOT LIKE 'JV%' OR M.mnam IS NULL)"
-
-        if not is_export:
-            sql += " AND T.no = '1'"
-
-        sort_col = filters.get('sort', 'voucher_id')
-        order_dir = filters.get('order', 'asc')
-        sort_map = {
-            'voucher_id': 'T.deno', 
-            'batch_id': 'L.batch_id', # ★追加
-            'dept_code': 'T.bucd',
-            'dept_name': 'N.nmkj', 'center': 'T.cucd', 'delivery_date': 'T.dldt',
-            'vendor_code': 'T.vecd', 'vendor': 'V.nmkj', 'p_name': 'M.hnam',
-            'manufacturer': 'M.mnam'
-        }
-        sql_sort = sort_map.get(sort_col, 'T.deno')
-        sql += f" ORDER BY {sql_sort} {order_dir}"
-
-        cursor.execute(sql, params)
-        columns = [column[0] for column in cursor.description]
-        results = []
-        for row in cursor.fetchall():
-            row_dict = {}
-            for col, val in zip(columns, row):
-                if isinstance(val, str): row_dict[col] = val.strip()
-                else: row_dict[col] = val
-            
-            if not row_dict.get('batch_id'):
-                 row_dict['batch_id'] = ''
-                 
-            results.append(row_dict)
-        return results
-    finally:
-        cursor.close()
-        conn.close()
-
 def get_filter_options():
     conn = get_connection(TARGET_DB)
     cursor = conn.cursor()
@@ -728,6 +772,49 @@ def get_related_discount_vouchers(parent_voucher_ids):
 # ==========================================
 # 4. CSVアップロード処理 (バラ数入力・ケース計算・余りチェック版)
 # ==========================================
+def _load_upload_masters(cursor, csv_rows):
+    """
+    CSV全行に出てくる商品・取引先・部門のマスタを、IN (...) でまとめて取得する。
+    戻り値: (商品, 取引先, 部門) の辞書。キーは code_key() で正規化したコード、
+    値は従来の1行ずつの SELECT で fetchone() していた行と同じ並び。
+    """
+    item_codes = []
+    vendor_codes = []
+    for row in csv_rows:
+        if len(row) < 10:
+            continue
+        vendor_codes.append(clean_str(row[2]))
+        item_codes.append(clean_str(row[5]))
+
+    sql_item = """
+        SELECT M1.cocd, M1.hnam, M1.kika, M1.mnam, M2.bucd, M2.janc, M2.irsu
+        FROM DBA.comf1 M1
+        LEFT JOIN DBA.comf204 M2 ON M1.cocd = M2.cocd
+        WHERE M1.cocd IN ({placeholders})
+    """
+    sql_vendor = "SELECT vecd, nmkj FROM DBA.venmf WHERE vecd IN ({placeholders})"
+    sql_dept = "SELECT bucd, nmkj FROM DBA.nammf04 WHERE brcd = '00' AND bucd IN ({placeholders})"
+
+    items = {}
+    for r in fetch_in_chunks(cursor, sql_item, item_codes):
+        # 同じ商品が複数行返る場合は、従来の fetchone() と同様に最初の1行を使う
+        items.setdefault(code_key(r[0]), tuple(r[1:]))
+
+    vendors = {}
+    for r in fetch_in_chunks(cursor, sql_vendor, vendor_codes):
+        vendors.setdefault(code_key(r[0]), tuple(r[1:]))
+
+    # 部門は商品マスタの部門CD (マスタに無い商品は "00") から引く
+    dept_codes = {"00"}
+    for res in items.values():
+        dept_codes.add(res[3] or "00")
+
+    depts = {}
+    for r in fetch_in_chunks(cursor, sql_dept, dept_codes):
+        depts.setdefault(code_key(r[0]), tuple(r[1:]))
+
+    return items, vendors, depts
+
 def process_upload_csv(csv_rows):
     """
     CSVを全行チェック。
@@ -735,6 +822,7 @@ def process_upload_csv(csv_rows):
     - 数量(7列目)を「バラ総数」として読み込む
     - マスタの入数で割り、ケース数を計算する
     - 割り切れない(余りが出る)場合はエラーにする
+    戻り値: ([VoucherLine, ...], [エラーメッセージ, ...])
     """
     conn = get_connection('master')
     cursor = conn.cursor()
@@ -743,14 +831,8 @@ def process_upload_csv(csv_rows):
     error_list = []
 
     try:
-        sql_item = """
-            SELECT M1.hnam, M1.kika, M1.mnam, M2.bucd, M2.janc, M2.irsu
-            FROM DBA.comf1 M1
-            LEFT JOIN DBA.comf204 M2 ON M1.cocd = M2.cocd
-            WHERE M1.cocd = ?
-        """
-        sql_vendor = "SELECT nmkj FROM DBA.venmf WHERE vecd = ?"
-        sql_dept = "SELECT nmkj FROM DBA.nammf04 WHERE bucd = ? AND brcd = '00'"
+        # マスタはファイル全体の分をまとめて引いておく (1行ごとに問い合わせない)
+        items, vendors, depts = _load_upload_masters(cursor, csv_rows)
 
         for i, row in enumerate(csv_rows):
             line_no = i + 1
@@ -804,22 +886,21 @@ def process_upload_csv(csv_rows):
                 qty_loose_input = 0
             
             try:
-                cost_unit = float(raw_cost)
+                cost_unit = to_decimal(raw_cost)
             except ValueError:
                 error_list.append(f"{line_no}行目: 原単価 '{raw_cost}' は数値で入力してください。")
-                cost_unit = 0.0
+                cost_unit = None
             
             try:
-                disc_unit = float(raw_disc) if raw_disc else 0.0
+                disc_unit = to_decimal(raw_disc, default=0)
             except ValueError:
                 error_list.append(f"{line_no}行目: 値引単価 '{raw_disc}' は数値で入力してください。")
-                disc_unit = 0.0
+                disc_unit = None
 
             # --- 3. DBマスタチェック ---
             
             # 商品マスタ
-            cursor.execute(sql_item, [item_code])
-            item_res = cursor.fetchone()
+            item_res = items.get(code_key(item_code))
             
             p_name = ""
             spec = ""
@@ -839,8 +920,7 @@ def process_upload_csv(csv_rows):
                 error_list.append(f"{line_no}行目: 商品コード '{item_code}' がマスタに存在しません。")
 
             # 取引先マスタ
-            cursor.execute(sql_vendor, [vendor_code])
-            v_res = cursor.fetchone()
+            v_res = vendors.get(code_key(vendor_code))
             if v_res:
                 vendor_name = v_res[0]
             else:
@@ -848,8 +928,7 @@ def process_upload_csv(csv_rows):
                 vendor_name = "(不明)"
 
             # 部門名
-            cursor.execute(sql_dept, [dept_code])
-            d_res = cursor.fetchone()
+            d_res = depts.get(code_key(dept_code))
             dept_name = d_res[0] if d_res else ""
 
             # --- ★追加: ケース計算と余りチェック ---
@@ -873,33 +952,28 @@ def process_upload_csv(csv_rows):
                     # error_list.append(f"{line_no}行目: 商品の入数がマスタに設定されていません。")
 
             # --- エラーがなければリストに追加 ---
+            # (金額は Decimal のまま持ち、原価合計・値引金額は VoucherLine が計算する)
             if not error_list: 
-                # 金額計算 (バラ総数 × 単価)
-                row_cost_total = (qty_loose_input * cost_unit)
-                row_disc_total = (qty_loose_input * disc_unit)
-
-                detail_row = [
-                    item_code, jan, p_name, spec, manufacturer,
-                    qty_loose_input, # [5] バラ総数 (CSV値)
-                    calc_cases,      # [6] 計算したケース数
-                    fee_md, fee_dc,
-                    "{:,.2f}".format(cost_unit),
-                    "{:,.0f}".format(row_cost_total),
-                    "{:,.0f}".format(row_disc_total)
-                ]
-
-                processed_list.append({
-                    'center_name': '守谷C' if 'D03' in center_code else '狭山日高C',
-                    'delivery_date': formatted_date,
-                    'vendor_code': vendor_code,
-                    'vendor_name': vendor_name,
-                    'dept_code': dept_code,
-                    'dept_name': dept_name,
-                    'manufacturer': manufacturer,
-                    'detail_row': detail_row,
-                    'raw_case': calc_cases, # 集計用には計算したケース数を使う
-                    'pass_flag': pass_flag
-                })
+                processed_list.append(VoucherLine(
+                    center_code='D03' if 'D03' in center_code else 'D04',
+                    delivery_date=formatted_date,
+                    vendor_code=vendor_code,
+                    vendor_name=vendor_name,
+                    dept_code=dept_code,
+                    dept_name=dept_name,
+                    item_code=item_code,
+                    jan=jan,
+                    item_name=p_name,
+                    spec=spec,
+                    manufacturer=manufacturer,
+                    qty_loose=qty_loose_input,  # バラ総数 (CSV値)
+                    cases=calc_cases,           # 計算したケース数 (集計にも使う)
+                    fee_md=fee_md,
+                    fee_dc=fee_dc,
+                    cost_unit=cost_unit,
+                    disc_unit=disc_unit,
+                    pass_flag=pass_flag,
+                ))
 
     except Exception as e:
         error_list.append(f"データ処理中に予期せぬエラーが発生しました: {e}")
@@ -912,174 +986,177 @@ def process_upload_csv(csv_rows):
 # ==========================================
 # 5. データ登録実行 (6行分割・排他制御・履歴記録)
 # ==========================================
+SQL_INSERT_VOUCHER = """
+    INSERT INTO {table} (
+        deno, no, cucd, bucd, vecd, dldt, 
+        cocd, odsu, dltn, prtn, 
+        md, dc, thrflg, sign, rgdt, upti,
+        oddt, trdk, updt
+    ) VALUES (
+        ?, ?, ?, ?, ?, ?, 
+        ?, ?, ?, ?, 
+        ?, ?, ?, ?, ?, ?,
+        ?, ?, ?
+    )
+"""
+
+SQL_INSERT_DISCOUNT = """
+    INSERT INTO DBA.dcneb (
+        deno, deno11, no, cucd, bucd, vecd, dldt, oddt, trdk,
+        cocd, odsu, dltn, md, dc, nebtan, nebkn, 
+        thrflg, conf, sign, rgdt_k, updt_k, upti_k
+    ) VALUES (
+        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 
+        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+    )
+"""
+
+SQL_INSERT_BATCH_LOG = """
+    INSERT INTO DBA.dc_batch_log (
+        batch_id, user_id, deno_main, deno_neb, center, rgdt
+    ) VALUES (?, ?, ?, ?, ?, CURRENT TIMESTAMP)
+"""
+
+
+def build_voucher_params(data_list, user_id, batch_id, cursor, today_str, now_time_str, hold=None):
+    """
+    登録する全行 (data_list: [VoucherLine, ...]) のパラメータを作る (DBへの INSERT はまだしない)。
+    1. ベンダー > 納品日 > センター > 部門 でグルーピング
+    2. 商品コード順にソート
+    3. 6行ごとに伝票を分割 (ページング)
+    4. 必要な伝票番号 (仕入・値引) を数えてから、1回の排他制御でまとめて採番
+
+    戻り値: ({挿入先テーブル: [仕入明細のパラメータ, ...]}, [値引明細のパラメータ, ...],
+             [履歴のパラメータ, ...], 仕入伝票の枚数)
+    """
+    # 1. 伝票単位のキーでグルーピング
+    # ★修正: 順序を [ベンダー > 納品日 > センター > 部門] に変更
+    key_func = lambda x: (x.vendor_code, x.delivery_date, x.center_name, x.dept_code)
+
+    # groupbyの前にキーでソートが必要
+    data_list.sort(key=key_func)
+
+    # 伝票 (6行ずつ) に分ける
+    vouchers = []   # [(グループのキー, [VoucherLine, ...]), ...]
+    for group_key, items in groupby(data_list, key=key_func):
+        # 商品番号順にソート
+        lines = sorted(items, key=lambda x: x.item_code)
+        for start_idx in range(0, len(lines), VOUCHER_LINES):
+            vouchers.append((group_key, lines[start_idx:start_idx + VOUCHER_LINES]))
+
+    # 仕入伝票 (6行ごと) と値引伝票 (値引のある6行) の番号を1回のロックでまとめて採番
+    discount_count = sum(1 for group_key, lines in vouchers if sum(x.disc_total for x in lines) > 0)
+    reserved = reserve_numbers(cursor, {'purchase': len(vouchers), 'discount': discount_count}, hold=hold)
+    purchase_ids = iter(reserved['purchase'])
+    discount_ids = iter(reserved['discount'])
+
+    main_params = {}
+    neb_params = []
+    log_params = []
+
+    for (v_code, d_date, center_name, dept_code), lines in vouchers:
+        # 挿入先テーブルの決定
+        center_code_db = center_code_of(center_name)
+        target_table = "DBA.dcnyu03" if center_code_db == "D03" else "DBA.dcnyu04"
+
+        # ---------------------------------------------
+        # A. 仕入伝票(親) の明細 (no は 1～6)
+        # ---------------------------------------------
+        main_voucher_id = next(purchase_ids)
+        rows = main_params.setdefault(target_table, [])
+        for line_no, line in enumerate(lines, start=1):
+            rows.append([
+                main_voucher_id,    # deno
+                line_no,            # no (1～6)
+                center_code_db,     # cucd
+                dept_code,          # bucd
+                v_code,             # vecd
+                d_date,             # dldt
+                line.item_code,     # cocd (Item Code)
+                line.cases,         # odsu (ケース数)
+                line.cost_unit,     # dltn (原単価)
+                line.disc_total,    # prtn (値引金額)
+                line.fee_md,        # md (本部費)
+                line.fee_dc,        # dc (物流費)
+                line.pass_flag,     # thrflg
+                user_id,            # sign
+                today_str,          # rgdt
+                now_time_str,       # upti
+                today_str,          # oddt
+                '11',               # trdk (仕入=11固定)
+                today_str           # updt
+            ])
+
+        # ---------------------------------------------
+        # B. 値引伝票の明細 (値引がある場合のみ)
+        # ---------------------------------------------
+        # ログ保存用に値引IDを記憶する変数 (値引なしならNone)
+        created_discount_id = None
+
+        if sum(x.disc_total for x in lines) > 0:
+            discount_voucher_id = next(discount_ids)
+            created_discount_id = discount_voucher_id
+
+            line_no_neb = 1
+            for line in lines:
+                if line.disc_total > 0:
+                    neb_params.append([
+                        discount_voucher_id, main_voucher_id, str(line_no_neb),
+                        center_code_db, dept_code, v_code, d_date, today_str, '13',
+                        line.item_code, line.qty_loose, line.cost_unit, line.fee_md, line.fee_dc,
+                        line.neb_unit, line.disc_total,
+                        '', '1', user_id, today_str, today_str, now_time_str
+                    ])
+                    line_no_neb += 1
+
+        # ---------------------------------------------
+        # C. 今回の伝票セットの履歴
+        # ---------------------------------------------
+        log_params.append([
+            batch_id,           # 引数で受け取ったID
+            user_id,            # ユーザーID
+            main_voucher_id,    # 仕入伝票番号
+            created_discount_id,# 値引伝票番号 (なければNone)
+            center_code_db      # D03 or D04
+        ])
+
+    return main_params, neb_params, log_params, len(vouchers)
+
+
 def insert_voucher_data(data_list, user_id, batch_id): # ★変更: batch_idを追加
     """
     データリストを受け取り、以下のルールで登録する。
     1. ベンダー > 納品日 > センター > 部門 でグルーピング
     2. 商品コード順にソート
     3. 6行ごとに伝票を分割 (ページング)
-    4. 排他制御を行いながら採番
+    4. 必要な伝票番号 (仕入・値引) を数えてから、1回の排他制御でまとめて採番
     5. 作成した伝票番号をログテーブルに保存
+    全行のパラメータを先に作り (build_voucher_params)、テーブルごとに executemany で
+    まとめて登録する (1つのトランザクション内)。
     """
     # 業務時間チェック
     time_error = check_business_time('normal')
     if time_error:
         raise Exception(time_error)
 
-    conn = get_connection('master')
+    # 採番ロックを伴う独自トランザクションなので、リクエスト共有の接続は使わない
+    conn = get_connection('master', shared=False)
     conn.autocommit = False 
     cursor = conn.cursor()
 
-    total_vouchers = 0
-    
+    hold = {}   # 採番ロックの保持時間 (行ロックが解ける commit / rollback まで) の計測用
     try:
-        # 1. 伝票単位のキーでグルーピング
-        # ★修正: 順序を [ベンダー > 納品日 > センター > 部門] に変更
-        key_func = lambda x: (x['vendor_code'], x['delivery_date'], x['center_name'], x['dept_code'])
-        
-        # groupbyの前にキーでソートが必要
-        data_list.sort(key=key_func)
-
-        # ★修正: key_funcの順序に合わせて、受け取る変数の順番も入れ替え
-        for (v_code, d_date, center_name, dept_code), items in groupby(data_list, key=key_func):
-            # イテレータをリスト化
-            items = list(items)
-            
-            # 商品番号順にソート（ここは変更なし）
-            items.sort(key=lambda x: x['detail_row'][0])
-
-            # 挿入先テーブルの決定
-            target_table = "DBA.dcnyu03" if "守谷" in center_name else "DBA.dcnyu04"
-            center_code_db = "D03" if "守谷" in center_name else "D04"
-            today_str = datetime.datetime.now().strftime('%Y/%m/%d')
-            now_time_str = datetime.datetime.now().strftime('%H:%M:%S')
-
-            # =================================================
-            # ★ 6行ごとの分割処理 (Chunking)
-            # =================================================
-            chunk_size = 6
-            # 必要な伝票枚数を計算
-            total_chunks = math.ceil(len(items) / chunk_size)
-
-            for i in range(total_chunks):
-                # リストを6行分切り出す
-                start_idx = i * chunk_size
-                end_idx = start_idx + chunk_size
-                chunk_items = items[start_idx:end_idx]
-
-                # ---------------------------------------------
-                # A. 仕入伝票番号の採番 (ロック -> 取得 -> 解除)
-                # ---------------------------------------------
-                main_voucher_id = _get_next_number_real(cursor, 'purchase')
-                
-                # ---------------------------------------------
-                # B. 仕入伝票(親)のINSERT
-                # ---------------------------------------------
-                line_no = 1
-                for row in chunk_items:
-                    d = row['detail_row']
-                    
-                    sql_insert_main = f"""
-                        INSERT INTO {target_table} (
-                            deno, no, cucd, bucd, vecd, dldt, 
-                            cocd, odsu, dltn, prtn, 
-                            md, dc, thrflg, sign, rgdt, upti,
-                            oddt, trdk, updt
-                        ) VALUES (
-                            ?, ?, ?, ?, ?, ?, 
-                            ?, ?, ?, ?, 
-                            ?, ?, ?, ?, ?, ?,
-                            ?, ?, ?
-                        )
-                    """
-                    
-                    val_discount = float(d[11].replace(',',''))
-                    
-                    params_main = [
-                        main_voucher_id,    # deno
-                        line_no,            # no (1～6)
-                        center_code_db,     # cucd
-                        dept_code,          # bucd
-                        v_code,             # vecd
-                        d_date,             # dldt
-                        d[0],               # cocd (Item Code)
-                        d[6],               # odsu (ケース数)
-                        float(d[9].replace(',','')), # dltn (原単価)
-                        val_discount,       # prtn (値引金額)
-                        d[7],               # md (本部費)
-                        d[8],               # dc (物流費)
-                        row.get('pass_flag', '0'), # thrflg
-                        user_id,            # sign
-                        today_str,          # rgdt
-                        now_time_str,       # upti
-                        today_str,          # oddt
-                        '11',               # trdk (仕入=11固定)
-                        today_str           # updt
-                    ]
-                    
-                    cursor.execute(sql_insert_main, params_main)
-                    line_no += 1
-                
-                total_vouchers += 1
-
-                # ---------------------------------------------
-                # C. 値引伝票の処理 (値引がある場合のみ)
-                # ---------------------------------------------
-                total_discount_in_chunk = sum(float(x['detail_row'][11].replace(',','')) for x in chunk_items)
-                
-                # ログ保存用に値引IDを記憶する変数 (値引なしならNone)
-                created_discount_id = None 
-
-                if total_discount_in_chunk > 0:
-                    # 値引伝票番号の採番
-                    discount_voucher_id = _get_next_number_real(cursor, 'discount')
-                    created_discount_id = discount_voucher_id # ★ログ用に確保
-                    
-                    line_no_neb = 1
-                    for row in chunk_items:
-                        d = row['detail_row'] 
-                        val_disc_total = float(d[11].replace(',',''))
-                        
-                        if val_disc_total > 0:
-                            val_qty = float(d[5]) 
-                            val_cost_unit = float(d[9].replace(',',''))
-                            val_disc_unit = val_disc_total / val_qty if val_qty != 0 else 0
-
-                            sql_insert_neb = """
-                                INSERT INTO DBA.dcneb (
-                                    deno, deno11, no, cucd, bucd, vecd, dldt, oddt, trdk,
-                                    cocd, odsu, dltn, md, dc, nebtan, nebkn, 
-                                    thrflg, conf, sign, rgdt_k, updt_k, upti_k
-                                ) VALUES (
-                                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 
-                                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
-                                )
-                            """
-                            
-                            params_neb = [
-                                discount_voucher_id, main_voucher_id, str(line_no_neb),
-                                center_code_db, dept_code, v_code, d_date, today_str, '13',
-                                d[0], val_qty, val_cost_unit, d[7], d[8], val_disc_unit, val_disc_total,
-                                '', '1', user_id, today_str, today_str, now_time_str
-                            ]
-                            cursor.execute(sql_insert_neb, params_neb)
-                            line_no_neb += 1
-
-                # =================================================
-                # ★追加: ここで「今回の伝票セット」を履歴テーブルに保存
-                # =================================================
-                sql_log = """
-                    INSERT INTO DBA.dc_batch_log (
-                        batch_id, user_id, deno_main, deno_neb, center, rgdt
-                    ) VALUES (?, ?, ?, ?, ?, CURRENT TIMESTAMP)
-                """
-                cursor.execute(sql_log, [
-                    batch_id,           # 引数で受け取ったID
-                    user_id,            # ユーザーID
-                    main_voucher_id,    # さっき採番した仕入伝票番号
-                    created_discount_id,# 値引伝票番号 (なければNone)
-                    center_code_db      # D03 or D04
-                ])
+        now = datetime.datetime.now()
+        main_params, neb_params, log_params, total_vouchers = build_voucher_params(
+            data_list, user_id, batch_id, cursor,
+            now.strftime('%Y/%m/%d'), now.strftime('%H:%M:%S'), hold=hold,
+        )
+
+        # 仕入伝票 → 値引伝票 → 履歴 の順にまとめて登録
+        for target_table, rows in main_params.items():
+            bulk_insert(cursor, SQL_INSERT_VOUCHER.format(table=target_table), rows, db_key='master')
+        bulk_insert(cursor, SQL_INSERT_DISCOUNT, neb_params, db_key='master')
+        bulk_insert(cursor, SQL_INSERT_BATCH_LOG, log_params, db_key='master')
 
         conn.commit()
         return f"登録完了: {total_vouchers}件の伝票を作成しました。"
@@ -1088,75 +1165,150 @@ def insert_voucher_data(data_list, user_id, batch_id): # ★変更: batch_idを
         conn.rollback()
         raise e
     finally:
+        _record_lock_hold(hold)
         cursor.close()
         conn.close()
 
 # ==========================================
 # (内部関数) 実採番ロジック・排他制御
 # ==========================================
-def _get_next_number_real(cursor, num_type):
+VOUCHER_LINES = 6   # 伝票1枚あたりの行数
+
+# 採番テーブルの設定
+#   max   : 上限。上限の次は 1 に戻る (0 は使わない)
+#   width : 0埋めの桁数
+SEQUENCE_CONFIG = {
+    'purchase': {'table': 'DBA.ctlmf', 'column': 'deno_j', 'max': 999999, 'width': 6},
+    'discount': {'table': 'DBA.henctlmf', 'column': 'hendeno_j', 'max': 39999, 'width': 5},  # 値引は39999の次が00001
+}
+
+LOCK_WAIT_SECONDS = 20   # excluflg のロック待ちの上限(秒)
+LOCK_POLL_INTERVAL = 0.5 # ロック待ちのポーリング間隔(秒)
+
+# 採番ロックの計測 (get_sequence_lock_stats で参照)
+_lock_stats_lock = threading.Lock()
+_lock_stats = {
+    "acquired": 0,          # ロックを取れた回数
+    "timeouts": 0,          # 取れずにタイムアウトした回数
+    "retries": 0,           # 他端末が使用中で待った回数 (競合)
+    "wait_seconds": 0.0,    # ロック待ちの合計
+    "max_wait_seconds": 0.0,
+    "hold_seconds": 0.0,    # ロックを持っていた時間の合計 (取得〜登録の commit / rollback)
+    "max_hold_seconds": 0.0,
+    "numbers": {"purchase": 0, "discount": 0},  # 採番した番号の数
+}
+
+
+def _next_sequence_value(current_val, max_val):
+    """番号を1つ進める。上限の次は 0 → 0 は使わないので 1"""
+    next_val = 0 if current_val >= max_val else current_val + 1
+    return next_val or 1
+
+
+def reserve_numbers(cursor, counts, hold=None):
     """
-    仕様に基づいた採番処理
+    伝票番号をまとめて採番する。
+      counts: {'purchase': 仕入伝票の枚数, 'discount': 値引伝票の枚数}
+      戻り値: {'purchase': ['000123', ...], 'discount': ['00045', ...]}  (0件の種類は空リスト)
+
     1. excluflg でロックを取得 (最大20秒待機)
-    2. ctlmf / henctlmf から番号を取得・更新
+    2. ctlmf / henctlmf から現在の番号を読み、必要な数だけ進めた番号で1回だけ更新
+       (上限に達したら 1 に戻る)
     3. excluflg のロックを解除
+    ロックは種類・枚数に関係なく1回だけ取る。
+    番号の更新は呼び出し側のトランザクションに含まれる (登録が失敗すれば番号も元に戻り、欠番にならない)。
+
+    hold: dict を渡すと、ロックを取った時刻を hold['locked_at'] に入れ、保持時間はここでは記録しない。
+          excluflg / ctlmf / henctlmf の行ロックは呼び出し側の commit まで残るので、
+          commit (または rollback) の後に _record_lock_hold(hold) で記録すること。
     """
-    
-    # ターゲットのテーブル設定
-    if num_type == 'purchase':
-        tbl_name = "DBA.ctlmf"
-        col_name = "deno_j"
-        max_val = 999999
-        width = 6
-    else:
-        tbl_name = "DBA.henctlmf"
-        col_name = "hendeno_j"
-        max_val = 39999 # 値引は39999の次が00000
-        width = 5
+    result = {num_type: [] for num_type in SEQUENCE_CONFIG}
+    needed = {num_type: int(n) for num_type, n in counts.items() if n and int(n) > 0}
+    if not needed:
+        return result
+
+    for num_type, n in needed.items():
+        if num_type not in SEQUENCE_CONFIG:
+            raise ValueError(f"採番の種類が不正です: {num_type}")
+        if n > SEQUENCE_CONFIG[num_type]['max']:
+            raise Exception(f"採番エラー: 一度に採番できる件数を超えています ({num_type}: {n}件)")
 
     # ------------------------------------
     # Step 1. 排他ロック取得 (excluflg)
     # ------------------------------------
     _lock_sequence(cursor)
+    locked_at = time.perf_counter()
+    if hold is not None:
+        hold['locked_at'] = locked_at
 
     try:
-        # ------------------------------------
-        # Step 2. 現在の番号を取得
-        # ------------------------------------
-        cursor.execute(f"SELECT {col_name} FROM {tbl_name}")
-        row = cursor.fetchone()
-        if not row:
-            raise Exception(f"採番エラー: {tbl_name} のデータが見つかりません")
-        
-        current_val = int(row[0])
+        for num_type, n in needed.items():
+            conf = SEQUENCE_CONFIG[num_type]
+
+            # ------------------------------------
+            # Step 2. 現在の番号を取得
+            # ------------------------------------
+            cursor.execute(f"SELECT {conf['column']} FROM {conf['table']}")
+            row = cursor.fetchone()
+            if not row:
+                raise Exception(f"採番エラー: {conf['table']} のデータが見つかりません")
+
+            # ------------------------------------
+            # Step 3. ルールに基づいて n 回カウントアップ
+            # ------------------------------------
+            val = int(row[0])
+            numbers = []
+            for _ in range(n):
+                val = _next_sequence_value(val, conf['max'])
+                numbers.append(str(val).zfill(conf['width']))
+
+            # ------------------------------------
+            # Step 4. テーブル更新 (最後に使った番号)
+            # ------------------------------------
+            cursor.execute(f"UPDATE {conf['table']} SET {conf['column']} = ?", [numbers[-1]])
+            result[num_type] = numbers
 
-        # ------------------------------------
-        # Step 3. ルールに基づいてカウントアップ
-        # ------------------------------------
-        # 上限に達していたら 0 にリセット
-        if current_val >= max_val:
-            next_val = 0
-        else:
-            next_val = current_val + 1
-            
-        # 000000 は使わないので、もし0なら 1 にする
-        if next_val == 0:
-            next_val = 1
-
-        # ------------------------------------
-        # Step 4. テーブル更新
-        # ------------------------------------
-        formatted_num = str(next_val).zfill(width)
-        
-        cursor.execute(f"UPDATE {tbl_name} SET {col_name} = ?", [formatted_num])
-        
-        return formatted_num
+        return result
 
     finally:
         # ------------------------------------
         # Step 5. ロック解除 (必ず通る道で)
         # ------------------------------------
         _unlock_sequence(cursor)
+        with _lock_stats_lock:
+            for num_type, numbers in result.items():
+                _lock_stats["numbers"][num_type] += len(numbers)
+        if hold is None:
+            _record_lock_hold({'locked_at': locked_at})
+
+
+def _record_lock_hold(hold):
+    """ロックを取ってから、それが解ける (commit / rollback) までの時間を記録する"""
+    locked_at = hold.get('locked_at')
+    if locked_at is None:
+        return
+    held = time.perf_counter() - locked_at
+    with _lock_stats_lock:
+        _lock_stats["hold_seconds"] += held
+        _lock_stats["max_hold_seconds"] = max(_lock_stats["max_hold_seconds"], held)
+
+
+def _get_next_number_real(cursor, num_type):
+    """
+    1件だけ採番する (reserve_numbers の1件版)
+    """
+    return reserve_numbers(cursor, {num_type: 1})[num_type][0]
+
+
+def get_sequence_lock_stats():
+    """採番ロックの取得回数・待ち時間・保持時間などを返す (運用確認用)"""
+    with _lock_stats_lock:
+        stats = dict(_lock_stats)
+        stats["numbers"] = dict(_lock_stats["numbers"])
+    acquired = stats["acquired"]
+    stats["avg_wait_seconds"] = stats["wait_seconds"] / acquired if acquired else 0.0
+    stats["avg_hold_seconds"] = stats["hold_seconds"] / acquired if acquired else 0.0
+    return stats
 
 
 def _lock_sequence(cursor):
@@ -1167,16 +1319,21 @@ def _lock_sequence(cursor):
     
     ★ 20秒経過しても取れなければエラーにする
     """
-    max_wait_seconds = 20  # 最大待機秒数
-    interval = 0.5         # ポーリング間隔(秒)
+    max_wait_seconds = LOCK_WAIT_SECONDS  # 最大待機秒数
+    interval = LOCK_POLL_INTERVAL         # ポーリング間隔(秒)
     
     start_time = time.time()
+    retries = 0
     
     while True:
         # 1. 現在時刻チェック
         elapsed = time.time() - start_time
         if elapsed > max_wait_seconds:
-            raise Exception("他端末で採番処理中のため、タイムアウトしました。(20秒経過)")
+            with _lock_stats_lock:
+                _lock_stats["timeouts"] += 1
+                _lock_stats["retries"] += retries
+                _lock_stats["wait_seconds"] += elapsed
+            raise Exception(f"他端末で採番処理中のため、タイムアウトしました。({max_wait_seconds}秒経過)")
         
         # 2. ロック取得試行
         # NULLの行を探して、自分の接続番号で更新する
@@ -1189,10 +1346,16 @@ def _lock_sequence(cursor):
         cursor.execute(sql)
         
         if cursor.rowcount > 0:
-            # ロック成功！
+            # ロック成功！ (待ち時間・競合回数を記録)
+            with _lock_stats_lock:
+                _lock_stats["acquired"] += 1
+                _lock_stats["retries"] += retries
+                _lock_stats["wait_seconds"] += elapsed
+                _lock_stats["max_wait_seconds"] = max(_lock_stats["max_wait_seconds"], elapsed)
             return
         
         # 3. 失敗したら少し待つ
+        retries += 1
         time.sleep(interval)
 
 
@@ -1234,7 +1397,7 @@ def _get_next_number(cursor, num_type):
 
 def save_to_work_table(batch_id, user_id, data_list):
     """
-    解析済みデータ(data_list)をワークテーブル DC_IN_CSV にINSERTする
+    解析済みデータ(data_list: [VoucherLine, ...])をワークテーブル DC_IN_CSV にINSERTする
     """
     conn = get_connection('master')
     cursor = conn.cursor()
@@ -1264,62 +1427,46 @@ def save_to_work_table(batch_id, user_id, data_list):
             )
         """
 
-        for i, row in enumerate(data_list, 1):
-            # process_upload_csv で作った detail_row リストの中身を取り出す
-            # 構造: [0]商品CD, [1]JAN, [2]商品名, [3]規格, [4]メーカー, 
-            #       [5]総数, [6]ケース, [7]MD, [8]DC, 
-            #       [9]原単価(str), [10]原価合計(str), [11]値引合計(str)
-            d_row = row['detail_row']
-            
-            # 文字列の金額を数値に戻す
-            val_cost_total = float(d_row[10].replace(',', ''))
-            val_disc_total = float(d_row[11].replace(',', ''))
-            val_cost_unit  = float(d_row[9].replace(',', ''))
-            
-            # disc_unit (値引単価) は detail_row に含まれていないため、
-            # 本来は process_upload_csv で保持すべきですが、
-            # ここでは簡易的に「値引合計 ÷ 総数」で逆算するか、一旦 0 で登録します。
-            # (もしCSVの生の値が必要なら process_upload_csv の戻り値に追加修正が必要です)
-            val_disc_unit = 0
-            if d_row[5] > 0:
-                val_disc_unit = val_disc_total / d_row[5]
-
+        all_params = []
+        for i, line in enumerate(data_list, 1):
             params = [
                 batch_id,           # batch_id
                 i,                  # line_no
                 user_id,            # user_id
                 
                 # --- CSV項目 ---
-                "D03" if "守谷" in row['center_name'] else "D04", # center_code
-                row['delivery_date'], # delivery_date
-                row['vendor_code'],   # vendor_code
-                d_row[7],             # fee_md
-                d_row[8],             # fee_dc
-                d_row[0],             # item_code
-                row['raw_case'],      # qty_case
-                val_cost_unit,        # cost_unit
-                row['pass_flag'],     # pass_flag
-                val_disc_unit,        # disc_unit
+                line.center_code,     # center_code
+                line.delivery_date,   # delivery_date
+                line.vendor_code,     # vendor_code
+                line.fee_md,          # fee_md
+                line.fee_dc,          # fee_dc
+                line.item_code,       # item_code
+                line.cases,           # qty_case
+                line.cost_unit,       # cost_unit
+                line.pass_flag,       # pass_flag
+                line.disc_unit,       # disc_unit (CSVの値引単価そのもの)
                 
                 # --- マスタ補完 ---
-                row['center_name'],
-                row['vendor_name'],
-                row['dept_code'],
-                row['dept_name'],
-                d_row[2], # item_name
-                d_row[3], # spec
-                row['manufacturer'],
-                d_row[1], # jan_code
+                line.center_name,
+                line.vendor_name,
+                line.dept_code,
+                line.dept_name,
+                line.item_name,
+                line.spec,
+                line.manufacturer,
+                line.jan,
                 0,        # per_case (取得元がない場合は0、あれば入れる)
 
                 # --- 計算 ---
-                d_row[5],       # qty_loose_total
-                val_cost_total, # cost_total
-                val_disc_total  # disc_total
+                line.qty_loose,       # qty_loose_total
+                line.cost_total,      # cost_total
+                line.disc_total       # disc_total
             ]
-            
-            cursor.execute(sql, params)
-            
+            all_params.append(params)
+
+        # 1行ずつではなく、まとめて登録する
+        bulk_insert(cursor, sql, all_params, db_key='master')
+
         conn.commit()
     except Exception as e:
         conn.rollback()
@@ -1331,7 +1478,7 @@ def save_to_work_table(batch_id, user_id, data_list):
 def get_data_from_work_table(batch_id):
     """
     ワークテーブルからデータを取得し、
-    process_upload_csv の戻り値と同じ辞書リスト形式に復元して返す。
+    process_upload_csv の戻り値と同じ [VoucherLine, ...] に復元して返す。
     (確認画面の表示や、本番登録処理で再利用するため)
     """
     conn = get_connection('master')
@@ -1340,55 +1487,19 @@ def get_data_from_work_table(batch_id):
         # 必要な列を全取得
         sql = """
             SELECT 
-                center_name, delivery_date, vendor_code, vendor_name,
-                dept_code, dept_name, manufacturer, pass_flag,
-                item_code, jan_code, item_name, spec,
+                center_code, delivery_date, vendor_code, vendor_name,
+                dept_code, dept_name, item_code, jan_code, item_name, spec, manufacturer,
                 qty_loose_total, qty_case, fee_md, fee_dc,
-                cost_unit, cost_total, disc_total,
+                cost_unit, disc_unit, pass_flag,
                 user_id
             FROM DC_IN_CSV
             WHERE batch_id = ?
             ORDER BY line_no
         """
         cursor.execute(sql, [batch_id])
-        rows = cursor.fetchall()
-        
-        reconstructed_list = []
-        
-        for r in rows:
-            # DBから取得した値を、HTML表示用(detail_row)のリスト形式に戻す
-            # フォーマット: "{:,.2f}" などでカンマ区切り文字列にする
-            
-            detail_row = [
-                r[8],  # item_code
-                r[9],  # jan_code
-                r[10], # item_name
-                r[11], # spec
-                r[6],  # manufacturer
-                r[12], # qty_loose_total
-                r[13], # qty_case
-                r[14], # fee_md
-                r[15], # fee_dc
-                "{:,.2f}".format(r[16]) if r[16] else "0.00", # cost_unit
-                "{:,.0f}".format(r[17]) if r[17] else "0",    # cost_total
-                "{:,.0f}".format(r[18]) if r[18] else "0"     # disc_total
-            ]
 
-            reconstructed_list.append({
-                'center_name': r[0],
-                'delivery_date': r[1],
-                'vendor_code': r[2],
-                'vendor_name': r[3],
-                'dept_code': r[4],
-                'dept_name': r[5],
-                'manufacturer': r[6],
-                'pass_flag': r[7],
-                'raw_case': r[13], # qty_caseと同じ
-                'detail_row': detail_row,
-                'user_id': r[19]   # 登録用に追加で持たせておく
-            })
-            
-        return reconstructed_list
+        # user_id: 登録用に追加で持たせておく
+        return [VoucherLine(*r) for r in cursor.fetchall()]
     finally:
         cursor.close()
         conn.close()
@@ -0,0 +1,104 @@
+"""
+common/dc_in_line.py
+--------------------
+dc_in (DC入荷CSV) の明細1行。
+
+CSVアップロード (process_upload_csv) → ワークテーブル (save_to_work_table / get_data_from_work_table)
+→ 本登録 (insert_voucher_data) → 確認画面 (confirm.html) まで、この形のまま受け渡す。
+
+従来は detail_row = [商品CD, JAN, ..., "1,250.75", "30,018", "120"] のような
+「カンマ区切りの文字列を含む位置指定のリスト」＋辞書で受け渡していたため、
+工程ごとに float(x.replace(',', '')) で数値に戻し、値引単価は 値引合計 ÷ 総数 で逆算していた。
+
+ここでは金額を Decimal で持ち、文字列にするのは画面に表示する時だけにする。
+・原単価     : 小数2桁に丸めて持つ (従来の "{:,.2f}" と同じ)
+・原価合計 / 値引合計 : バラ総数 × 単価 を円単位に丸めた値 (従来の "{:,.0f}" と同じ) をプロパティで返す
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+CENTER_NAMES = {"D03": "守谷C", "D04": "狭山日高C"}
+
+_CENT = Decimal("0.01")
+_YEN = Decimal("1")
+
+
+def to_decimal(value, default=None):
+    """数値・数値の文字列 (カンマ区切り可) を Decimal にする。空なら default、数値でなければ ValueError"""
+    if value is None or value == "":
+        if default is None:
+            raise ValueError("数値が空です")
+        return default
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    try:
+        result = Decimal(str(value).replace(",", "").strip())
+    except InvalidOperation:
+        raise ValueError(f"数値ではありません: {value}") from None
+    if not result.is_finite():
+        raise ValueError(f"数値ではありません: {value}")
+    return result
+
+
+def center_code_of(center_name):
+    """センター名 (守谷C / 狭山日高C) → センターコード"""
+    return "D03" if "守谷" in center_name else "D04"
+
+
+class VoucherLine:
+    """
+    DC入荷の明細1行 (CSVの1行 + マスタで補完した項目)。
+    大量行でもメモリを食わないよう __slots__ で持つ。
+    """
+    __slots__ = (
+        "center_code", "delivery_date", "vendor_code", "vendor_name",
+        "dept_code", "dept_name", "item_code", "jan", "item_name", "spec", "manufacturer",
+        "qty_loose", "cases", "fee_md", "fee_dc", "cost_unit", "disc_unit", "pass_flag", "user_id",
+    )
+
+    def __init__(self, center_code, delivery_date, vendor_code, vendor_name,
+                 dept_code, dept_name, item_code, jan, item_name, spec, manufacturer,
+                 qty_loose, cases, fee_md, fee_dc, cost_unit, disc_unit, pass_flag, user_id=None):
+        self.center_code = center_code          # D03 / D04
+        self.delivery_date = delivery_date      # YYYY/MM/DD
+        self.vendor_code = vendor_code
+        self.vendor_name = vendor_name
+        self.dept_code = dept_code
+        self.dept_name = dept_name
+        self.item_code = item_code
+        self.jan = jan
+        self.item_name = item_name
+        self.spec = spec
+        self.manufacturer = manufacturer
+        self.qty_loose = int(qty_loose or 0)    # バラ総数 (CSVの値)
+        self.cases = int(cases or 0)            # 入数で割ったケース数
+        self.fee_md = fee_md                    # 本部費 (CSVの値のまま)
+        self.fee_dc = fee_dc                    # 物流費 (CSVの値のまま)
+        self.cost_unit = to_decimal(cost_unit, Decimal(0)).quantize(_CENT, ROUND_HALF_EVEN)  # 原単価
+        self.disc_unit = to_decimal(disc_unit, Decimal(0))  # 値引単価
+        self.pass_flag = pass_flag
+        self.user_id = user_id                  # ワークテーブルから読んだ時の登録者
+
+    @property
+    def center_name(self):
+        return CENTER_NAMES.get(self.center_code, self.center_code)
+
+    @property
+    def cost_total(self):
+        """原価合計 (バラ総数 × 原単価、円単位)"""
+        return (self.cost_unit * self.qty_loose).quantize(_YEN, ROUND_HALF_EVEN)
+
+    @property
+    def disc_total(self):
+        """値引金額 (バラ総数 × 値引単価、円単位)"""
+        return (self.disc_unit * self.qty_loose).quantize(_YEN, ROUND_HALF_EVEN)
+
+    @property
+    def neb_unit(self):
+        """値引伝票 (dcneb.nebtan) の値引単価 = 値引金額 ÷ バラ総数 (割り切れないので従来どおり float)"""
+        return float(self.disc_total) / self.qty_loose if self.qty_loose else 0
+
+    def __repr__(self):
+        return f"VoucherLine({self.center_code} {self.delivery_date} {self.vendor_code} {self.item_code} x{self.qty_loose})"
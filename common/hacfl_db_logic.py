@@ -1,11 +1,13 @@
 import csv
-import io
 import uuid
 from datetime import datetime, date, timedelta
 
 # 同階層の db_connection をインポート
 from .db_connection import get_connection
+from .db_bulk import bulk_insert
 from .Get_DB_Time import get_db_server_time
+from .hacfl_validation import iter_csv_rows, validate_upload, check_fixed_dates, format_error_report
+from .master_lookup import get_store_name, get_product_info
 
 TARGET_DB = "master"
 
@@ -178,18 +180,20 @@ def parse_and_insert_work(file_storage, mode, user_id=None, fixed_oddt=None, fix
         except UnicodeDecodeError:
             return False, "文字コード判別不能(UTF-8/SJISのみ)", None
 
+    # ★DBへ書き込む前に、メモリ上で全行チェックする (エラーがあれば作業テーブルへは登録しない)
     try:
-        stream = io.StringIO(csv_text, newline=None)
-        csv_reader = csv.reader(stream)
-        rows = list(csv_reader)
-    except Exception as e:
+        clean_rows, row_errors, read_count = validate_upload(iter_csv_rows(csv_text))
+    except csv.Error as e:
         return False, f"CSV読込エラー: {str(e)}", None
+    except Exception as e:
+        return False, f"マスタチェックエラー: {str(e)}", None
 
-    if len(rows) == 0:
+    if read_count == 0:
         return False, "データ行が含まれていません。", None
 
-    # ★ヘッダー判定ロジックを廃止し、「ヘッダーなし固定」とする
-    # そのまま rows を回す
+    date_errors = check_fixed_dates(mode, fixed_oddt, fixed_dldt, today_date, WORK_DATE_LIMIT_DAYS)
+    if row_errors or date_errors:
+        return False, format_error_report(row_errors, date_errors), None
 
     conn = None
     try:
@@ -207,39 +211,16 @@ def parse_and_insert_work(file_storage, mode, user_id=None, fixed_oddt=None, fix
             (batch_id, line_num, cucd, cocd, odsu, oddt, dldt, updt, err_msg)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, '')
         """
-        
-        insert_count = 0
-        seen_keys = set()
-        
-        # 1行目からデータとして処理
-        for i, row in enumerate(rows, start=1):
-            # 空行スキップ
-            if not row or all(c.strip() == '' for c in row):
-                continue
-
-            if len(row) < 3: row += [''] * (3 - len(row))
-            
-            cucd_val = row[0].strip()
-            if len(cucd_val) > 3:
-                return False, f"{i}行目: 店舗CDが長すぎます('{cucd_val}')", None
-
-            cocd_val = row[1].strip()
-            if len(cocd_val) > 8:
-                return False, f"{i}行目: 商品CDが長すぎます('{cocd_val}')", None
-
-            current_key = (cucd_val, cocd_val)
-            if current_key in seen_keys:
-                return False, f"{i}行目: 店舗CD '{cucd_val}' 商品CD '{cocd_val}' が重複しています。", None
-            seen_keys.add(current_key)
-
-            odsu_str = row[2].strip()
-            odsu_val = int(odsu_str) if odsu_str.isdigit() else 0
-
-            # ★ updt に today_date をセット
-            params = [batch_id, i, cucd_val, cocd_val, odsu_val, fixed_oddt, fixed_dldt, today_date]
-            cursor.execute(sql, params)
-            insert_count += 1
-            
+
+        # ★ updt に today_date をセット
+        all_params = [
+            [batch_id, i, cucd_val, cocd_val, odsu_val, fixed_oddt, fixed_dldt, today_date]
+            for i, cucd_val, cocd_val, odsu_val in clean_rows
+        ]
+
+        # チェック済みの行だけを、まとめて登録する
+        insert_count = bulk_insert(cursor, sql, all_params, db_key=TARGET_DB)
+
         conn.commit()
         return True, f"{insert_count}件取り込み完了", batch_id
 
@@ -250,69 +231,79 @@ def parse_and_insert_work(file_storage, mode, user_id=None, fixed_oddt=None, fix
         if conn: conn.close()
 
 
-def exec_db_validation(cursor, batch_id, mode):
-    """ SQLによる一括チェック """
-    
-    now = get_db_server_time()
-    today_str = now.strftime('%Y-%m-%d')
-    
-    # 40日制限
-    limit_date = now.date() + timedelta(days=40)
-    limit_str = limit_date.strftime('%Y-%m-%d')
+# ---------------------------------------------------------
+# 作業テーブルのチェック項目
+#   (条件, エラー文言, 条件の ? に渡す値の名前) をこの順に err_msg へ連結する
+#   値の名前: 'today' = 本日 / 'limit' = 本日 + WORK_DATE_LIMIT_DAYS
+# ---------------------------------------------------------
+WORK_DATE_LIMIT_DAYS = 40   # 納品日・発注日に指定できる先の日数
 
+WORK_VALIDATION_RULES = [
     # 1. マスタ存在チェック
-    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [店舗マスタ未登録]' WHERE batch_id = ? AND cucd NOT IN (SELECT cucd FROM DBA.cusmf04)", (batch_id,))
-    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [商品マスタ未登録]' WHERE batch_id = ? AND cocd NOT IN (SELECT cocd FROM DBA.comf1)", (batch_id,))
-    
+    ("NOT EXISTS (SELECT 1 FROM DBA.cusmf04 m WHERE m.cucd = w.cucd)", ' [店舗マスタ未登録]', ()),
+    ("NOT EXISTS (SELECT 1 FROM DBA.comf1 m WHERE m.cocd = w.cocd)", ' [商品マスタ未登録]', ()),
     # 2. 値チェック
-    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [店舗CDスペース不可]' WHERE batch_id = ? AND cucd LIKE '% %'", (batch_id,))
-    cursor.execute("UPDATE DBA.hacfl04_work SET err_msg = err_msg || ' [発注数0]' WHERE batch_id = ? AND odsu = 0", (batch_id,))
-
-    # 3. 日付チェック
-    # --- 納品日 (dldt) ---
-    cursor.execute("""
-        UPDATE DBA.hacfl04_work 
-        SET err_msg = err_msg || ' [納品日が過去]' 
-        WHERE batch_id = ? AND dldt IS NOT NULL AND dldt < CAST(? AS DATE)
-    """, (batch_id, today_str))
-
-    cursor.execute("""
-        UPDATE DBA.hacfl04_work 
-        SET err_msg = err_msg || ' [納品日が40日以上先]' 
-        WHERE batch_id = ? AND dldt IS NOT NULL AND dldt > CAST(? AS DATE)
-    """, (batch_id, limit_str))
-
-    # --- 発注日 (oddt) ---
-    # oddtは NULL OK なので、IS NOT NULL の場合のみチェック
-    cursor.execute("""
-        UPDATE DBA.hacfl04_work 
-        SET err_msg = err_msg || ' [発注日が過去]' 
-        WHERE batch_id = ? AND oddt IS NOT NULL AND oddt < CAST(? AS DATE)
-    """, (batch_id, today_str))
-    
-    cursor.execute("""
-        UPDATE DBA.hacfl04_work 
-        SET err_msg = err_msg || ' [発注日が40日以上先]' 
-        WHERE batch_id = ? AND oddt IS NOT NULL AND oddt > CAST(? AS DATE)
-    """, (batch_id, limit_str))
-
-    # --- 矛盾チェック (発注日 < 納品日) ---
-    cursor.execute("""
-        UPDATE DBA.hacfl04_work 
-        SET err_msg = err_msg || ' [納品日は発注日の翌日以降]' 
-        WHERE batch_id = ? 
-          AND oddt IS NOT NULL 
-          AND dldt IS NOT NULL 
-          AND oddt >= dldt
-    """, (batch_id,))
-    
-    # 朝締めモードなのに発注日が指定されていたらエラー（ロジックでNoneにするので基本発生しない）
+    ("w.cucd LIKE '% %'", ' [店舗CDスペース不可]', ()),
+    ("w.odsu = 0", ' [発注数0]', ()),
+    # 3. 日付チェック (oddt は NULL OK なので、IS NOT NULL の場合のみ)
+    ("w.dldt IS NOT NULL AND w.dldt < CAST(? AS DATE)", ' [納品日が過去]', ('today',)),
+    ("w.dldt IS NOT NULL AND w.dldt > CAST(? AS DATE)", ' [納品日が40日以上先]', ('limit',)),
+    ("w.oddt IS NOT NULL AND w.oddt < CAST(? AS DATE)", ' [発注日が過去]', ('today',)),
+    ("w.oddt IS NOT NULL AND w.oddt > CAST(? AS DATE)", ' [発注日が40日以上先]', ('limit',)),
+    # 矛盾チェック (発注日 < 納品日)
+    ("w.oddt IS NOT NULL AND w.dldt IS NOT NULL AND w.oddt >= w.dldt", ' [納品日は発注日の翌日以降]', ()),
+]
+
+# 朝締めモードなのに発注日が指定されていたらエラー（ロジックでNoneにするので基本発生しない）
+WORK_VALIDATION_RULES_MORNING = [
+    ("w.oddt IS NOT NULL", ' [朝締めは発注日指定不可]', ()),
+]
+
+
+def build_validation_sql(batch_id, mode, today):
+    """
+    チェック項目をまとめて1本の UPDATE にする。
+      err_msg = err_msg || CASE WHEN 条件1 THEN 文言1 ELSE '' END || CASE ... END || ...
+    どれかの条件に当たる行だけを更新する (エラーの無い行は書き込まない)。
+    戻り値: (sql, params)
+    """
+    rules = list(WORK_VALIDATION_RULES)
     if mode == 'morning':
-        cursor.execute("""
-            UPDATE DBA.hacfl04_work 
-            SET err_msg = err_msg || ' [朝締めは発注日指定不可]' 
-            WHERE batch_id = ? AND oddt IS NOT NULL 
-        """, (batch_id,))
+        rules += WORK_VALIDATION_RULES_MORNING
+
+    values = {
+        'today': today.strftime('%Y-%m-%d'),
+        'limit': (today + timedelta(days=WORK_DATE_LIMIT_DAYS)).strftime('%Y-%m-%d'),
+    }
+
+    cases = []
+    case_params = []
+    for condition, message, names in rules:
+        cases.append(f"CASE WHEN {condition} THEN '{message}' ELSE '' END")
+        case_params.extend(values[n] for n in names)
+
+    set_sql = "\n            || ".join(cases)
+    any_error = "\n            OR ".join(f"({condition})" for condition, message, names in rules)
+    sql = f"""
+        UPDATE DBA.hacfl04_work AS w
+        SET err_msg = w.err_msg
+            || {set_sql}
+        WHERE w.batch_id = ?
+          AND ({any_error})
+    """
+    # SET 句の ? → WHERE の batch_id → WHERE の条件の ? の順
+    return sql, case_params + [batch_id] + case_params
+
+
+def exec_db_validation(cursor, batch_id, mode):
+    """
+    SQLによる一括チェック。
+    WORK_VALIDATION_RULES を1本の UPDATE にまとめて、作業テーブルを1回だけ走査する
+    (従来はチェック項目ごとに UPDATE していたため、項目数だけ全行を読み直していた)。
+    """
+    now = get_db_server_time()
+    sql, params = build_validation_sql(batch_id, mode, now.date())
+    cursor.execute(sql, params)
 
 
 def get_work_data_checked(batch_id, mode):
@@ -356,7 +347,7 @@ def get_work_data_checked(batch_id, mode):
 
             # 全角チェック
             all_text = "".join([str(col) for col in row[1:6] if col is not None])
-            if not all(ord(c) < 128 for c in all_text):
+            if not all_text.isascii():
                  row_errors.append(" [全角文字が含まれています]")
 
             if row_errors: has_global_error = True
@@ -382,10 +373,31 @@ def get_work_data_checked(batch_id, mode):
     return has_global_error, data_list
 
 
+# 本登録で1回の INSERT ... SELECT に含める行数 (行番号の範囲で区切る)
+MIGRATE_CHUNK_ROWS = 20000
+
+# マスタから部門を補完してINSERT (comf204 は結合1回。行番号の範囲は分割登録の時だけ使う)
+SQL_MIGRATE_WORK = """
+    INSERT INTO {target_table}
+    (edpno, type, cucd, cocd, bucd, odsu, oddt, dldt)
+    SELECT
+        NULL, '004', w.cucd, w.cocd, c2.bucd, w.odsu, w.oddt, w.dldt
+    FROM DBA.hacfl04_work w
+    LEFT JOIN DBA.comf204 c2 ON w.cocd = c2.cocd
+    WHERE w.batch_id = ?
+      AND w.line_num BETWEEN ? AND ?
+"""
+
+
 def migrate_work_to_main(batch_id, mode, user_id=None):
     """
     【CSV本登録用】
     modeを受け取り、INSERT先のテーブルを切り替える
+
+    作業テーブルの行を INSERT ... SELECT でまとめて登録する
+    (MIGRATE_CHUNK_ROWS 行を超える時は行番号の範囲で分けて、同じトランザクションで登録)。
+    ドライバが返す登録件数・削除件数が作業テーブルの件数と合わない場合は、
+    (comf204 に同じ商品CDが複数ある等) 全て取り消してエラーにする。
     """
     # 1. 時間＆モードチェック (これでテーブル名も決まる)
     # ★本登録ボタンを押した瞬間にも時間を再チェックする(タイムラグ対策)
@@ -398,32 +410,39 @@ def migrate_work_to_main(batch_id, mode, user_id=None):
         conn = get_connection(TARGET_DB)
         cursor = conn.cursor()
 
-        cursor.execute("SELECT COUNT(*) FROM DBA.hacfl04_work WHERE batch_id = ?", (batch_id,))
+        cursor.execute(
+            "SELECT COUNT(*), MIN(line_num), MAX(line_num) FROM DBA.hacfl04_work WHERE batch_id = ?",
+            (batch_id,)
+        )
         count_row = cursor.fetchone()
         row_count = count_row[0] if count_row else 0
         
         if row_count == 0:
             return False, "登録対象データがありません(タイムアウト等)", 0
 
-        target_table = config['table']
-        
-        # マスタから部門を補完してINSERT
-        sql_copy = f"""
-            INSERT INTO {target_table} 
-            (edpno, type, cucd, cocd, bucd, odsu, oddt, dldt)
-            SELECT 
-                NULL, '004', w.cucd, w.cocd, c2.bucd, w.odsu, w.oddt, w.dldt
-            FROM DBA.hacfl04_work w
-            LEFT JOIN DBA.comf204 c2 ON w.cocd = c2.cocd
-            WHERE w.batch_id = ?
-        """
-        cursor.execute(sql_copy, (batch_id,))
-        
+        first_line, last_line = count_row[1], count_row[2]
+        sql_copy = SQL_MIGRATE_WORK.format(target_table=config['table'])
+
+        inserted = 0
+        for lo in range(first_line, last_line + 1, MIGRATE_CHUNK_ROWS):
+            cursor.execute(sql_copy, (batch_id, lo, min(lo + MIGRATE_CHUNK_ROWS - 1, last_line)))
+            inserted = inserted + cursor.rowcount if inserted >= 0 and cursor.rowcount >= 0 else -1
+
         # 登録後、ワークテーブルから削除
         cursor.execute("DELETE FROM DBA.hacfl04_work WHERE batch_id = ?", (batch_id,))
+        deleted = cursor.rowcount
+
+        # rowcount が取れないドライバ (-1) の時は、件数の確認を省く
+        if inserted >= 0 and deleted >= 0 and not (inserted == deleted == row_count):
+            conn.rollback()
+            return False, (
+                f"本登録エラー: 件数が一致しません "
+                f"(作業データ {row_count}件 / 登録 {inserted}件 / 削除 {deleted}件)。登録を取り消しました。"
+            ), 0
+
         conn.commit()
         
-        return True, "本登録完了", row_count
+        return True, "本登録完了", inserted if inserted >= 0 else row_count
     except Exception as e:
         if conn: conn.rollback()
         return False, f"本登録エラー: {str(e)}", 0
@@ -432,52 +451,18 @@ def migrate_work_to_main(batch_id, mode, user_id=None):
 
 
 def get_store_name_by_cd(cucd):
-    """ 店舗CDから店舗名を取得 """
-    conn = None
+    """ 店舗CDから店舗名を取得 (common.master_lookup のキャッシュ経由) """
     try:
-        conn = get_connection(TARGET_DB)
-        cursor = conn.cursor()
-        
-        sql = "SELECT nmkj FROM DBA.cusmf04 WHERE cucd = ?"
-        cursor.execute(sql, (cucd,))
-        row = cursor.fetchone()
-        
-        return row[0].strip() if row else None
-    except:
+        return get_store_name(cucd)
+    except Exception as e:
+        print(f"[WARNING] 店舗名の取得に失敗しました ({cucd}): {e}")
         return None
-    finally:
-        if conn: conn.close()
 
 
 def get_product_info_by_cd(cocd):
-    """ 商品CDから詳細情報(品名, 規格, メーカー, 部門, 入数, B単)を取得 """
-    conn = None
+    """ 商品CDから詳細情報(品名, 規格, メーカー, 部門, 入数, B単)を取得 (common.master_lookup のキャッシュ経由) """
     try:
-        conn = get_connection(TARGET_DB)
-        cursor = conn.cursor()
-        
-        sql = """
-            SELECT 
-                c3.hnam_k, c3.kika_k, c3.mnam_p, -- 0,1,2
-                c2.bucd, c2.irsu, c2.btan        # 3,4,5
-            FROM DBA.comf3 c3
-            LEFT JOIN DBA.comf204 c2 ON c3.cocd = c2.cocd
-            WHERE c3.cocd = ?
-        """
-        cursor.execute(sql, (cocd,))
-        row = cursor.fetchone()
-        
-        if row:
-            return {
-                "name": row[0] or "",
-                "kika": row[1] or "",
-                "maker": row[2] or "",
-                "bucd": row[3] or "",
-                "irsu": row[4] if row[4] is not None else "",
-                "btan": row[5] if row[5] is not None else ""
-            }
-        return None
-    except:
+        return get_product_info(cocd)
+    except Exception as e:
+        print(f"[WARNING] 商品情報の取得に失敗しました ({cocd}): {e}")
         return None
-    finally:
-        if conn: conn.close()
\ No newline at end of file
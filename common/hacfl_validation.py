@@ -0,0 +1,276 @@
+"""
+common/hacfl_validation.py
+--------------------------
+hacfl (発注CSV取込) のアップロード時チェック。
+
+従来は CSV の全行をいったん作業テーブル (DBA.hacfl04_work) へ登録してから、
+確認画面でマスタ存在・発注数・日付などをチェックしていたため、
+エラーだらけのファイルでも全行がDBへ書き込まれていた。
+
+ここでは CSV を1行ずつ読みながら、作業テーブルのチェック (hacfl_db_logic.WORK_VALIDATION_RULES) と
+同じ文言でメモリ上でチェックし、エラーが1件も無い時だけ作業テーブルへ登録させる。
+
+・店舗CD / 商品CD の存在チェックは、cusmf04 / comf1 のコードを読み込んだ集合 (MASTER_CODES_TTL 秒キャッシュ) で引く
+・集合に無かったコードだけ、念のためDBへ IN (...) でまとめて問い合わせる
+  (キャッシュを読み込んだ後に登録されたコードを、誤ってエラーにしないため)
+・確認画面では従来どおり作業テーブルのチェック (exec_db_validation) も行う
+  (アップロード後にマスタが変わった場合の保険)
+"""
+
+import csv
+import io
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .db_connection import get_connection
+from .db_bulk import code_key, fetch_in_chunks
+
+MASTER_CODES_TTL = 600        # マスタのコード集合の有効期限(秒)
+MAX_ERROR_LINES = 50          # 画面に表示するエラー行数の上限
+
+TARGET_DB = "master"
+
+
+class MasterCodeSet:
+    """
+    マスタのコード列を集合で持つキャッシュ (プロセス内で1つずつ)。
+      load_sql : 全コードを読む SELECT
+      check_sql: {placeholders} 付きの、指定コードだけを読む SELECT
+    """
+
+    def __init__(self, name, load_sql, check_sql, ttl=MASTER_CODES_TTL):
+        self.name = name
+        self.load_sql = load_sql
+        self.check_sql = check_sql
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._codes = None
+        self._expires = 0.0           # 次に読み直す monotonic 時刻
+
+        self.load_count = 0
+        self.db_checks = 0
+        self.last_load_seconds = None
+
+    def _current(self):
+        codes = self._codes
+        if codes is not None and time.monotonic() < self._expires:
+            return codes
+
+        with self._lock:
+            if self._codes is None or time.monotonic() >= self._expires:
+                started = time.monotonic()
+                with get_connection(TARGET_DB) as conn:
+                    cur = conn.cursor()
+                    cur.execute(self.load_sql)
+                    rows = cur.fetchall()
+                self._codes = {code_key(r[0]) for r in rows if r[0] is not None}
+                self._expires = time.monotonic() + self.ttl
+                self.load_count += 1
+                self.last_load_seconds = time.monotonic() - started
+            return self._codes
+
+    def contains(self, code):
+        """キャッシュ上にあるか (無くても、missing() で確認するまではエラーにしない)"""
+        return code_key(code) in self._current()
+
+    def missing(self, codes):
+        """
+        codes のうちマスタに無いものを返す。
+        キャッシュに無かったコードは DB に問い合わせ、見つかったものはキャッシュへ足す。
+        """
+        current = self._current()
+        candidates = [c for c in dict.fromkeys(codes) if code_key(c) not in current]
+        if not candidates:
+            return set()
+
+        with get_connection(TARGET_DB) as conn:
+            cur = conn.cursor()
+            rows = fetch_in_chunks(cur, self.check_sql, candidates)
+        self.db_checks += 1
+
+        found = {code_key(r[0]) for r in rows if r[0] is not None}
+        if found:
+            with self._lock:
+                if self._codes is current:
+                    self._codes = current | found
+        return {c for c in candidates if code_key(c) not in found}
+
+    def invalidate(self):
+        """次の参照で読み直す"""
+        self._expires = 0.0
+
+    def status(self):
+        codes = self._codes
+        return {
+            "codes": len(codes) if codes is not None else 0,
+            "ttl_seconds": self.ttl,
+            "seconds_to_expire": max(0.0, self._expires - time.monotonic()) if codes is not None else None,
+            "load_count": self.load_count,
+            "db_checks": self.db_checks,
+            "last_load_seconds": self.last_load_seconds,
+        }
+
+
+_stores = MasterCodeSet(
+    "cusmf04",
+    "SELECT cucd FROM DBA.cusmf04",
+    "SELECT cucd FROM DBA.cusmf04 WHERE cucd IN ({placeholders})",
+)
+_items = MasterCodeSet(
+    "comf1",
+    "SELECT cocd FROM DBA.comf1",
+    "SELECT cocd FROM DBA.comf1 WHERE cocd IN ({placeholders})",
+)
+
+
+# =========================================================
+#  CSVの読み込み・チェック
+# =========================================================
+def iter_csv_rows(csv_text):
+    """
+    CSV (ヘッダーなし: 店舗CD, 商品CD, 発注数) を1行ずつ (行番号, 店舗CD, 商品CD, 発注数の文字列) で返す。
+    空行は飛ばす。
+    """
+    reader = csv.reader(io.StringIO(csv_text, newline=None))
+    for i, row in enumerate(reader, start=1):
+        if not row or all(c.strip() == '' for c in row):
+            continue
+        if len(row) < 3:
+            row += [''] * (3 - len(row))
+        yield i, row[0].strip(), row[1].strip(), row[2].strip()
+
+
+def check_fixed_dates(mode, fixed_oddt, fixed_dldt, today, limit_days):
+    """
+    画面で指定した発注日・納品日のチェック (全行共通なので1回だけ)。
+    エラー文言のリストを返す (作業テーブルのチェックと同じ文言)。
+    """
+    errors = []
+    limit = today + timedelta(days=limit_days)
+    dates = {}
+    for label, value in (('納品日', fixed_dldt), ('発注日', fixed_oddt)):
+        if not value:
+            continue
+        if not str(value).isascii():
+            errors.append(f" [{label}に全角文字が含まれています]")
+            continue
+        try:
+            dates[label] = datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+        except ValueError:
+            errors.append(f" [{label}の形式が不正です]")
+
+    for label in ('納品日', '発注日'):
+        d = dates.get(label)
+        if d is None:
+            continue
+        if d < today:
+            errors.append(f" [{label}が過去]")
+        if d > limit:
+            errors.append(f" [{label}が40日以上先]")
+
+    if '発注日' in dates and '納品日' in dates and dates['発注日'] >= dates['納品日']:
+        errors.append(" [納品日は発注日の翌日以降]")
+    if mode == 'morning' and fixed_oddt:
+        errors.append(" [朝締めは発注日指定不可]")
+    return errors
+
+
+def validate_upload(rows):
+    """
+    iter_csv_rows() の行をチェックする。
+    戻り値: (登録する行 [(行番号, 店舗CD, 商品CD, 発注数)], エラー [(行番号, エラー文言)], 読んだ行数)
+      ・エラー文言は作業テーブルのチェックと同じ " [店舗マスタ未登録]" などをつなげたもの
+      ・エラーが1件でもあれば、登録する行は返さない (メモリ節約のため途中から溜めない)
+    """
+    clean = []
+    problems = {}                 # {行番号: [店舗マスタ未登録か, 商品マスタ未登録か, [その他のエラー]]}
+    seen_keys = set()
+    store_misses = {}             # {店舗CD: [行番号]} キャッシュに無かったもの
+    item_misses = {}
+    count = 0
+
+    for i, cucd, cocd, odsu_str in rows:
+        count += 1
+        errors = []
+
+        if len(cucd) > 3:
+            errors.append(f" 店舗CDが長すぎます('{cucd}')")
+        if len(cocd) > 8:
+            errors.append(f" 商品CDが長すぎます('{cocd}')")
+
+        current_key = (cucd, cocd)
+        if current_key in seen_keys:
+            errors.append(f" 店舗CD '{cucd}' 商品CD '{cocd}' が重複しています。")
+        seen_keys.add(current_key)
+
+        # 作業テーブルのチェック (WORK_VALIDATION_RULES) と同じ順・同じ文言
+        # (長さ・重複のエラーがある行も、全ての項目をチェックして報告する)
+        if not _stores.contains(cucd):
+            store_misses.setdefault(cucd, []).append(i)
+        if not _items.contains(cocd):
+            item_misses.setdefault(cocd, []).append(i)
+        if ' ' in cucd:
+            errors.append(' [店舗CDスペース不可]')
+        odsu_val = int(odsu_str) if odsu_str.isdigit() else 0
+        if odsu_val == 0:
+            errors.append(' [発注数0]')
+        # 全角の数字 (１２ など) も isdigit() / int() を通ってしまうので、アップロードされた全項目を見る
+        if not (cucd + cocd + odsu_str).isascii():
+            errors.append(' [全角文字が含まれています]')
+
+        if errors:
+            problems[i] = [False, False, errors]
+            clean = None
+        elif clean is not None:
+            clean.append((i, cucd, cocd, odsu_val))
+
+    # キャッシュに無かったコードだけ、DBで確かめる
+    if store_misses:
+        for code in _stores.missing(store_misses):
+            for i in store_misses[code]:
+                problems.setdefault(i, [False, False, []])[0] = True
+    if item_misses:
+        for code in _items.missing(item_misses):
+            for i in item_misses[code]:
+                problems.setdefault(i, [False, False, []])[1] = True
+
+    if not problems:
+        return clean, [], count
+
+    report = []
+    for i in sorted(problems):
+        store_missing, item_missing, errors = problems[i]
+        messages = []
+        if store_missing:
+            messages.append(' [店舗マスタ未登録]')
+        if item_missing:
+            messages.append(' [商品マスタ未登録]')
+        report.append((i, "".join(messages + errors)))
+    return [], report, count
+
+
+def format_error_report(errors, batch_errors=()):
+    """エラーの一覧を画面表示用の文字列にする (MAX_ERROR_LINES 行まで)"""
+    lines = []
+    if batch_errors:
+        lines.append("画面指定の日付:" + "".join(batch_errors))
+    lines.extend(f"{i}行目:{message}" for i, message in errors[:MAX_ERROR_LINES])
+    if len(errors) > MAX_ERROR_LINES:
+        lines.append(f"…ほか {len(errors) - MAX_ERROR_LINES} 行")
+
+    head = f"エラーがあるため取り込みませんでした (エラー {len(errors)} 行)。" if errors else \
+        "エラーがあるため取り込みませんでした。"
+    return "\n".join([head] + lines)
+
+
+def invalidate_master_codes():
+    """cusmf04 / comf1 のコード集合を次の参照で読み直させる"""
+    _stores.invalidate()
+    _items.invalidate()
+
+
+def get_master_codes_status():
+    """コード集合のキャッシュの状態 (件数・期限など) を返す"""
+    return {"stores": _stores.status(), "items": _items.status()}
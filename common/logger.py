@@ -1,11 +1,50 @@
 # common/logger.py
+import atexit
+import glob
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
 from flask import request
 
 # インポートパスの調整（環境依存を防ぐためtry-except）
 try:
     from common.db_connection import get_connection
+    from common.db_clock import get_db_clock
 except ImportError:
     from .db_connection import get_connection
+    from .db_clock import get_db_clock
+
+# ==========================================
+# 設定: ログ書き込み (非同期・まとめ書き)
+# ==========================================
+LOG_QUEUE_SIZE = 10000       # メモリ上に溜めておける最大件数
+LOG_BATCH_SIZE = 200         # この件数たまったらまとめてINSERT
+LOG_FLUSH_INTERVAL = 2.0     # 件数が少なくても、この秒数ごとに書き込む
+LOG_RETRY_INTERVAL = 30.0    # DB停止中、退避ファイルの再送を試みる間隔(秒)
+LOG_ORPHAN_REPLAY_AGE = 600  # 他プロセスの再送中ファイルが、この秒数更新されなければ引き取る (プロセスが落ちた分)
+
+# DBに書けなかったログの退避先 (1行1件のJSON, 追記のみ)
+LOG_SPOOL_PATH = os.environ.get("WEBLOG_SPOOL_PATH") or os.path.join(
+    tempfile.gettempdir(), "flask_apps_weblog_spool.jsonl"
+)
+
+# 1件ずつ書き直してもDBが受け付けなかったログ (msg が長すぎる等) の置き場。再送はしない
+LOG_REJECT_PATH = os.environ.get("WEBLOG_REJECT_PATH") or os.path.join(
+    tempfile.gettempdir(), "flask_apps_weblog_rejected.jsonl"
+)
+
+SQL_INSERT_WEBLOG = """
+    INSERT INTO DBA.weblog
+    (log_dt, user_id, client_ip, module, action, msg)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
 
 def get_client_ip():
     """
@@ -13,51 +52,372 @@ def get_client_ip():
     """
     if not request:
         return '0.0.0.0'
-    
+
     # IISやロードバランサ経由の場合、X-Forwarded-Forを優先
     x_forwarded = request.headers.getlist("X-Forwarded-For")
     if x_forwarded:
         return x_forwarded[0].split(',')[0].strip()
-        
+
     return request.remote_addr or '0.0.0.0'
 
+
+class WeblogWriter:
+    """
+    DBA.weblog への書き込みをバックグラウンドで行うクラス。
+
+    ・write() はキューに積むだけで、すぐに戻る (ユーザーのリクエストでDBを待たない)
+    ・ワーカースレッドが件数 or 時間でまとめて executemany する
+    ・DBに書けない時は退避ファイルへ追記し、DB復旧後に再送する
+    ・DBが特定の行だけ受け付けない時は、その行だけ LOG_REJECT_PATH へ移す
+    """
+
+    def __init__(self, spool_path=LOG_SPOOL_PATH, queue_size=LOG_QUEUE_SIZE,
+                 batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL,
+                 retry_interval=LOG_RETRY_INTERVAL, reject_path=LOG_REJECT_PATH):
+        self.spool_path = spool_path
+        self.reject_path = reject_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._spool_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._next_replay = 0.0
+        # 再送中ファイルの名前に付ける印 (同じ退避ファイルを使う他のプロセス・インスタンスと区別する)
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self.metrics = {
+            "queued": 0,     # キューに積んだ件数
+            "written": 0,    # DBへ書き込めた件数
+            "spooled": 0,    # 退避ファイルへ書いた件数
+            "replayed": 0,   # 退避ファイルから再送できた件数
+            "rejected": 0,   # DBが受け付けなかった (1件ずつでも書けなかった) 件数
+            "dropped": 0,    # どこにも書けず捨てた件数
+            "batches": 0,    # executemany の実行回数
+            "db_errors": 0,  # DB書き込みの失敗回数
+        }
+
+    # ------------------------------------------
+    # 受付 (リクエストスレッド側)
+    # ------------------------------------------
+    def write(self, entry):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+            self.metrics["queued"] += 1
+        except queue.Full:
+            # キューがあふれた場合はDBを待たずに退避ファイルへ
+            self._spool([entry])
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="weblog-writer", daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------
+    # ワーカースレッド
+    # ------------------------------------------
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(batch)
+                self._done(len(batch) + 1)
+                return
+
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                # DBへ書く (または退避する) まで完了にしない (flush() が書き終わりを待てるように)
+                self._done(len(batch))
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _done(self, count):
+        for _ in range(count):
+            self._queue.task_done()
+
+    def _flush(self, batch):
+        if batch:
+            unsent = self._write(batch)
+            if unsent:
+                self._spool(unsent)
+                return
+
+        # DBが生きていそうなら、退避分を再送する
+        if time.monotonic() >= self._next_replay and self._has_spool():
+            try:
+                self._replay()
+            except Exception as e:
+                # 再送の失敗でワーカースレッドを止めない (次の機会に再送する)
+                print(f"[Log Replay Error] {e}")
+
+    def _write(self, rows):
+        """
+        rows をDBへ書く。戻り値: DBにつながらず書けなかった行 (退避ファイルへ回す分)
+        まとめ書きが失敗してもDBにはつながる場合は1件ずつ書き直し、それでも書けない行は
+        LOG_REJECT_PATH へ移す (不正な1行のために、同じまとめの他の行まで再送し続けないように)
+        """
+        if self._insert(rows):
+            self.metrics["written"] += len(rows)
+            return []
+        return self._insert_each(rows)
+
+    def _insert(self, rows):
+        conn = None
+        cursor = None
+        try:
+            # 業務側のトランザクションに巻き込まれないよう、専用の接続で書き込む
+            conn = get_connection('master', shared=False)
+            cursor = conn.cursor()
+            cursor.executemany(SQL_INSERT_WEBLOG, [list(r) for r in rows])
+            conn.commit()
+            self.metrics["batches"] += 1
+            return True
+        except Exception as e:
+            print(f"[Log Write Error] {e}")
+            self.metrics["db_errors"] += 1
+            self._next_replay = time.monotonic() + self.retry_interval
+            if conn:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                conn.close()
+
+    def _insert_each(self, rows):
+        """まとめ書きが失敗した時、1件ずつ書き直す。戻り値: DBにつながらず書けなかった行"""
+        try:
+            conn = get_connection('master', shared=False)
+        except Exception as e:
+            print(f"[Log Write Error] {e}")
+            return rows
+
+        cursor = conn.cursor()
+        rejected = []
+        try:
+            for i, r in enumerate(rows):
+                try:
+                    cursor.execute(SQL_INSERT_WEBLOG, list(r))
+                    conn.commit()
+                    self.metrics["written"] += 1
+                except Exception as e:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        # 接続が切れた場合は、この行から後ろを退避ファイルへ回す
+                        print(f"[Log Write Error] {e}")
+                        return rows[i:]
+                    print(f"[Log Reject] {e}")
+                    rejected.append(r)
+            # DBにはつながっているので、退避分の再送を待たせない
+            self._next_replay = 0.0
+            return []
+        finally:
+            if rejected:
+                self._reject(rejected)
+            cursor.close()
+            conn.close()
+
+    # ------------------------------------------
+    # 退避ファイル
+    # ------------------------------------------
+    def _spool(self, rows):
+        try:
+            with self._spool_lock:
+                with open(self.spool_path, "a", encoding="utf-8") as f:
+                    for r in rows:
+                        f.write(json.dumps(_to_json(r), ensure_ascii=False) + "\n")
+            self.metrics["spooled"] += len(rows)
+        except Exception as e:
+            print(f"[Log Spool Error] {e}")
+            self.metrics["dropped"] += len(rows)
+
+    def _reject(self, rows):
+        """DBが受け付けなかった行を LOG_REJECT_PATH へ移す (再送はしない)"""
+        try:
+            with self._spool_lock:
+                with open(self.reject_path, "a", encoding="utf-8") as f:
+                    for r in rows:
+                        f.write(json.dumps(_to_json(r), ensure_ascii=False) + "\n")
+            self.metrics["rejected"] += len(rows)
+        except Exception as e:
+            print(f"[Log Reject Error] {e}")
+            self.metrics["dropped"] += len(rows)
+
+    def _has_spool(self):
+        return os.path.exists(self.spool_path) or bool(glob.glob(self.spool_path + ".*.replay"))
+
+    def _replay_files(self):
+        """このインスタンスが名前を変えて引き取った再送中ファイル"""
+        return sorted(glob.glob(f"{self.spool_path}.{self._owner}-*.replay"))
+
+    def _claim(self, path):
+        """path を自分の再送中ファイルに名前を変える。他が先に引き取っていれば False"""
+        work = f"{self.spool_path}.{self._owner}-{uuid.uuid4().hex[:8]}.replay"
+        try:
+            os.replace(path, work)
+            return True
+        except OSError:
+            return False
+
+    def _claim_orphans(self):
+        """落ちたプロセスが残した再送中ファイル (LOG_ORPHAN_REPLAY_AGE 秒以上更新なし) を引き取る"""
+        mine = set(self._replay_files())
+        now = time.time()
+        for path in glob.glob(self.spool_path + ".*.replay"):
+            if path in mine:
+                continue
+            try:
+                if now - os.path.getmtime(path) < LOG_ORPHAN_REPLAY_AGE:
+                    continue
+            except OSError:
+                continue
+            self._claim(path)
+
+    def _replay(self):
+        """
+        退避ファイルを読み直してDBへ再送する。
+        他プロセスと取り合わないよう、まず名前を変えて自分専用にしてから読む。
+        (名前を変えられるのは1つのプロセスだけなので、同じ行を二重に再送しない)
+        """
+        with self._spool_lock:
+            if os.path.exists(self.spool_path):
+                self._claim(self.spool_path)
+        self._claim_orphans()
+
+        for path in self._replay_files():
+            try:
+                with open(path, encoding="utf-8") as f:
+                    rows = [_from_json(json.loads(line)) for line in f if line.strip()]
+            except (OSError, ValueError) as e:
+                print(f"[Log Replay Error] {path}: {e}")
+                continue
+
+            for i in range(0, len(rows), self.batch_size):
+                chunk = rows[i:i + self.batch_size]
+                written = self.metrics["written"]
+                unsent = self._write(chunk)
+                # 再送分は written ではなく replayed に数える
+                self.metrics["replayed"] += self.metrics["written"] - written
+                self.metrics["written"] = written
+                if unsent:
+                    # DBにつながらない場合だけ、残りを退避ファイルへ戻して次の機会に再送
+                    with self._spool_lock:
+                        with open(self.spool_path, "a", encoding="utf-8") as f:
+                            for r in unsent + rows[i + self.batch_size:]:
+                                f.write(json.dumps(_to_json(r), ensure_ascii=False) + "\n")
+                    _remove(path)
+                    return
+
+            _remove(path)
+
+    # ------------------------------------------
+    # 終了・状態確認
+    # ------------------------------------------
+    def flush(self, timeout=10.0):
+        """キューに積まれた分を書き終えるまで待つ (最大 timeout 秒)"""
+        end = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < end:
+            time.sleep(0.05)
+
+    def stop(self, timeout=10.0):
+        """残りを書き出してワーカーを止める (プロセス終了時)"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def get_metrics(self):
+        data = dict(self.metrics)
+        data["pending"] = self._queue.qsize()
+        return data
+
+
+_STOP = object()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        print(f"[Log Replay Error] {path}: {e}")
+
+
+def _to_json(r):
+    log_dt, user_id, client_ip, module, action, msg = r
+    return [log_dt.strftime("%Y-%m-%d %H:%M:%S.%f"), user_id, client_ip, module, action, msg]
+
+
+def _from_json(r):
+    return (datetime.strptime(r[0], "%Y-%m-%d %H:%M:%S.%f"), *r[1:])
+
+
+_writer = WeblogWriter()
+atexit.register(_writer.stop)
+
+
+def get_log_metrics():
+    """
+    ログ書き込みの件数 (queued / written / spooled / dropped など) を返す。
+    """
+    return _writer.get_metrics()
+
+
+def flush_logs(timeout=10.0):
+    """
+    キューに残っているログを書き終えるまで待つ。
+    """
+    _writer.flush(timeout)
+
+
 def write_log(module_name, user_id, action_type, message):
     """
     ログを書き込む共通関数
     呼び出し元の修正を不要にするため、関数名と引数は logger.py の形式を維持し、
     中身は正しいDB定義(DBA.weblog)に合わせています。
+
+    DBへの書き込みはバックグラウンドで行うため、この関数はすぐに戻る。
+    日時は呼ばれた時点のDB時刻 (時計キャッシュから計算) を記録する (まとめ書きで時刻がずれないように)。
     """
-    conn = None
-    cursor = None
     try:
+        # IPはリクエスト中にしか取れないので、ここで確定させる
         ip = get_client_ip()
-        conn = get_connection('master')
-        cursor = conn.cursor()
 
-        # ★ここを「B」の正しい定義(DBA.weblog / log_dt)に修正しました
-        # 日時はSQL側で CURRENT_TIMESTAMP を入れればPython側での取得は不要です
-        sql = """
-            INSERT INTO DBA.weblog 
-            (log_dt, user_id, client_ip, module, action, msg)
-            VALUES (CURRENT_TIMESTAMP, ?, ?, ?, ?, ?)
-        """
-        
         # 引数のマッピング (logger.pyの引数 -> Bのテーブル定義)
         # module_name -> module
         # action_type -> action
         # message     -> msg
-        cursor.execute(sql, [user_id, ip, module_name, action_type, message])
-        conn.commit()
-        
+        _writer.write((get_db_clock('master').now(), user_id, ip, module_name, action_type, message))
+
         # 開発用出力
         print(f"[LOG] {module_name} | {user_id} | {action_type} | {message}")
 
     except Exception as e:
         print(f"[Log Write Error] {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
\ No newline at end of file
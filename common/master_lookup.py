@@ -0,0 +1,187 @@
+"""
+common/master_lookup.py
+-----------------------
+入力画面の「店舗CD → 店舗名」「商品CD → 品名・規格・入数…」の問い合わせ結果のプロセス内キャッシュ。
+
+hacfl の単発登録画面は、コードを入力するたびに API を呼び、そのたびに
+master DB へ接続して cusmf04 / comf3 + comf204 を1件ずつ検索していた。
+
+ここでは
+・コードごとの結果を LOOKUP_CACHE_TTL 秒キャッシュする (件数上限 LOOKUP_CACHE_MAX、古く使われていないものから捨てる)
+・マスタに無いコードも「無い」という結果を LOOKUP_NEGATIVE_TTL 秒キャッシュする
+  (登録直後のコードがすぐ見えるよう、見つかった結果より短くする)
+・キャッシュに無いコードは、まとめて IN (...) で1回の接続で引く
+とする。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from .db_connection import get_connection
+from .db_bulk import code_key, fetch_in_chunks
+
+LOOKUP_CACHE_TTL = 600         # 見つかった結果の有効期限(秒)
+LOOKUP_NEGATIVE_TTL = 60       # マスタに無かった結果の有効期限(秒)
+LOOKUP_CACHE_MAX = 5000        # 種類ごとに保存しておく件数の上限
+
+TARGET_DB = "master"
+
+SQL_STORE_NAMES = "SELECT cucd, nmkj FROM DBA.cusmf04 WHERE cucd IN ({placeholders})"
+
+SQL_PRODUCT_INFOS = """
+    SELECT
+        c3.cocd,
+        c3.hnam_k, c3.kika_k, c3.mnam_p,
+        c2.bucd, c2.irsu, c2.btan
+    FROM DBA.comf3 c3
+    LEFT JOIN DBA.comf204 c2 ON c3.cocd = c2.cocd
+    WHERE c3.cocd IN ({placeholders})
+"""
+
+
+def _store_value(row):
+    return (row[1] or "").strip() or None
+
+
+def _product_value(row):
+    return {
+        "name": row[1] or "",
+        "kika": row[2] or "",
+        "maker": row[3] or "",
+        "bucd": row[4] or "",
+        "irsu": row[5] if row[5] is not None else "",
+        "btan": row[6] if row[6] is not None else "",
+    }
+
+
+class MasterLookupCache:
+    """
+    キー: 正規化したコード  値: 検索結果 (マスタに無ければ None)
+      sql      : {placeholders} 付きの SELECT (1列目がコード)
+      to_value : 行 → 検索結果
+    """
+
+    def __init__(self, name, sql, to_value, ttl=LOOKUP_CACHE_TTL,
+                 negative_ttl=LOOKUP_NEGATIVE_TTL, max_entries=LOOKUP_CACHE_MAX):
+        self.name = name
+        self.sql = sql
+        self.to_value = to_value
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: (値, 期限の monotonic 時刻)}
+
+        self.hits = 0
+        self.misses = 0
+        self.db_queries = 0
+
+    def _get_cached(self, keys):
+        """キャッシュにあるものを {key: 値} で返し、無い・期限切れのキーを返す"""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now < entry[1]:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+                    self.hits += 1
+                else:
+                    if entry is not None:
+                        del self._entries[key]
+                    missing.append(key)
+                    self.misses += 1
+        return found, missing
+
+    def _put(self, results):
+        now = time.monotonic()
+        with self._lock:
+            for key, value in results.items():
+                ttl = self.ttl if value is not None else self.negative_ttl
+                self._entries[key] = (value, now + ttl)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup_many(self, codes):
+        """
+        codes をまとめて引き、{入力されたコード: 値 or None} を返す。
+        キャッシュに無いものだけ、1回の接続で IN (...) を使って DB から引く。
+        """
+        keys = {code: code_key(code) for code in codes if code is not None and str(code).strip()}
+        found, missing = self._get_cached(list(dict.fromkeys(keys.values())))
+
+        if missing:
+            with get_connection(TARGET_DB) as conn:
+                cur = conn.cursor()
+                rows = fetch_in_chunks(cur, self.sql, missing)
+            self.db_queries += 1
+
+            loaded = dict.fromkeys(missing)
+            for row in rows:
+                key = code_key(row[0])
+                if key in loaded and loaded[key] is None:
+                    # 複数行ある場合は、従来の fetchone と同じく最初の行を使う
+                    loaded[key] = self.to_value(row)
+            self._put(loaded)
+            found.update(loaded)
+
+        return {code: found.get(key) for code, key in keys.items()}
+
+    def lookup(self, code):
+        """1件だけ引く。無ければ None"""
+        if code is None or not str(code).strip():
+            return None
+        return self.lookup_many([code]).get(code)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def status(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "negative_ttl_seconds": self.negative_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "db_queries": self.db_queries,
+        }
+
+
+_stores = MasterLookupCache("cusmf04", SQL_STORE_NAMES, _store_value)
+_products = MasterLookupCache("comf3", SQL_PRODUCT_INFOS, _product_value)
+
+
+def lookup_store_names(codes):
+    """店舗CD → 店舗名 (無ければ None) の辞書を返す"""
+    return _stores.lookup_many(codes)
+
+
+def lookup_product_infos(codes):
+    """商品CD → 商品情報 (品名, 規格, メーカー, 部門, 入数, B単。無ければ None) の辞書を返す"""
+    return _products.lookup_many(codes)
+
+
+def get_store_name(cucd):
+    return _stores.lookup(cucd)
+
+
+def get_product_info(cocd):
+    return _products.lookup(cocd)
+
+
+def invalidate_master_lookup():
+    """マスタを直した時に呼ぶ。店舗・商品の検索結果を全て捨てる"""
+    _stores.invalidate()
+    _products.invalidate()
+
+
+def get_master_lookup_status():
+    """キャッシュの状態 (件数・ヒット数など) を返す"""
+    return {"stores": _stores.status(), "products": _products.status()}
@@ -0,0 +1,199 @@
+"""
+common/store_master.py
+----------------------
+店舗マスタ (Cusmf04) のプロセス内キャッシュ。
+
+店舗マスタは月に1回変わるかどうかなのに、ログイン画面・自動補充・カート実績の
+Excel出力などで毎回 Cusmf04 + closemf04 を検索していたため、まとめて1回読み込んで使い回す。
+
+・有効期限: STORE_MASTER_TTL 秒 (期限切れ後の最初の呼び出しで読み直す)
+・読み直し中は、他のスレッドは古いデータで即座に返す (DBへ問い合わせるのは1スレッドだけ)
+・初回読み込み中は、他のスレッドはその完了を待つ
+・読み直しに失敗した場合は、古いデータを使い続けて STORE_MASTER_RETRY 秒後に再挑戦する
+・店舗マスタを直した時は refresh_store_master() (POST /tools/store_master/refresh) で即時反映できる
+  (反映されるのは呼ばれたプロセスだけ。他のプロセスは STORE_MASTER_TTL 以内に読み直す)
+"""
+
+import threading
+import time
+
+from .db_connection import get_connection
+from .db_bulk import code_key
+
+STORE_MASTER_TTL = 3600      # キャッシュの有効期限(秒)
+STORE_MASTER_RETRY = 60      # 読み込みに失敗した時、次に試すまでの間隔(秒)
+
+# 閉店店舗も含めて読み込み、closed フラグで区別する
+# (店舗名の取得 get_cucd_name は閉店店舗も対象だったため)
+SQL_LOAD_STORES = """
+    SELECT a.cucd,
+           REPLACE(a.nmkj, 'ジェーソン', '') AS nmkj,
+           CASE WHEN c.cucd IS NULL THEN 0 ELSE 1 END AS closed
+    FROM DBA.cusmf04 a
+    LEFT JOIN (SELECT cucd FROM DBA.closemf04 GROUP BY cucd) c
+           ON c.cucd = a.cucd
+    WHERE a.cukb = '0'
+    ORDER BY a.cucd
+"""
+
+
+def _shop_sort_key(item):
+    code = item[0]
+    return (
+        not code.startswith("B"),               # B店舗を先に
+        int(code) if code.isdigit() else code   # 数字店舗は数値で昇順
+    )
+
+
+class StoreDirectory:
+    """
+    読み込んだ店舗マスタ1世代分。作成後は変更しない (参照側はロック不要)。
+
+    by_code     : {正規化した店舗CD: (店舗CD, 店舗名, 閉店フラグ)}
+    active      : 閉店していない店舗の [(店舗CD, 店舗名)] 店舗CD順 (DBの ORDER BY cucd と同じ)
+    active_shop : 同上を B店舗 → 数字店舗 の順に並べたもの
+    """
+
+    def __init__(self, rows):
+        self.by_code = {}
+        active = []
+        for r in rows:
+            code = str(r[0]).strip()
+            name = r[1] or ""
+            closed = bool(r[2])
+            self.by_code[code_key(code)] = (code, name, closed)
+            if not closed:
+                active.append((code, name))
+
+        self.active = active
+        self.active_shop = sorted(
+            [(code, name.strip()) for code, name in active], key=_shop_sort_key
+        )
+        self.loaded_at = time.time()
+
+    def lookup(self, cucd, include_closed=False):
+        """店舗CDから (店舗CD, 店舗名, 閉店フラグ) を返す。無ければ None"""
+        hit = self.by_code.get(code_key(cucd))
+        if hit is None or (hit[2] and not include_closed):
+            return None
+        return hit
+
+
+class StoreMasterCache:
+    """
+    店舗マスタのキャッシュ本体 (プロセス内で1つ)。
+    """
+
+    def __init__(self, ttl=STORE_MASTER_TTL, retry=STORE_MASTER_RETRY):
+        self.ttl = ttl
+        self.retry = retry
+
+        self._lock = threading.Lock()
+        self._directory = None
+        self._expires = 0.0           # 次に読み直す monotonic 時刻
+
+        self.load_count = 0
+        self.error_count = 0
+        self.last_error = None
+        self.last_load_seconds = None
+
+    def get(self):
+        """
+        現在の店舗マスタ (StoreDirectory) を返す。必要なら読み直す。
+        """
+        directory = self._directory
+        if directory is not None and time.monotonic() < self._expires:
+            return directory
+
+        # 初回は全員が読み込み完了を待つ。2回目以降は読み直し担当の1スレッド以外は古いデータを返す
+        if not self._lock.acquire(blocking=directory is None):
+            return directory
+        try:
+            if self._directory is None or time.monotonic() >= self._expires:
+                self._load()
+            return self._directory
+        finally:
+            self._lock.release()
+
+    def _load(self):
+        started = time.monotonic()
+        try:
+            with get_connection("master") as conn:
+                cur = conn.cursor()
+                cur.execute(SQL_LOAD_STORES)
+                rows = cur.fetchall()
+        except Exception as e:
+            self.error_count += 1
+            self.last_error = str(e)
+            if self._directory is None:
+                # 一度も読めていない場合は、従来どおり呼び出し元へエラーを返す
+                raise
+            print(f"[WARNING] 店舗マスタの読み直しに失敗しました (前回のデータを使用します): {e}")
+            self._expires = time.monotonic() + self.retry
+            return
+
+        self._directory = StoreDirectory(rows)
+        self._expires = time.monotonic() + self.ttl
+        self.load_count += 1
+        self.last_error = None
+        self.last_load_seconds = time.monotonic() - started
+
+    def refresh(self):
+        """
+        ただちにDBから読み直す。読み直した店舗マスタを返す。
+        """
+        with self._lock:
+            self._expires = 0.0
+            self._load()
+            return self._directory
+
+    def invalidate(self):
+        """次の呼び出しで読み直す"""
+        self._expires = 0.0
+
+    def status(self):
+        directory = self._directory
+        return {
+            "loaded": directory is not None,
+            "stores": len(directory.by_code) if directory else 0,
+            "active_stores": len(directory.active) if directory else 0,
+            "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(directory.loaded_at)) if directory else None,
+            "ttl_seconds": self.ttl,
+            "seconds_to_expire": max(0.0, self._expires - time.monotonic()) if directory else None,
+            "load_count": self.load_count,
+            "last_load_seconds": self.last_load_seconds,
+            "error_count": self.error_count,
+            "last_error": self.last_error,
+        }
+
+
+_cache = StoreMasterCache()
+
+
+def get_store_directory():
+    """
+    店舗マスタ (StoreDirectory) を返す。
+    """
+    return _cache.get()
+
+
+def refresh_store_master():
+    """
+    店舗マスタを今すぐ読み直す (マスタ修正後の即時反映用)。
+    """
+    _cache.refresh()
+    return _cache.status()
+
+
+def invalidate_store_master():
+    """
+    次の参照時に店舗マスタを読み直させる。
+    """
+    _cache.invalidate()
+
+
+def get_store_master_status():
+    """
+    キャッシュの状態 (件数・読み込み時刻・期限など) を返す。
+    """
+    return _cache.status()
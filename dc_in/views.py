@@ -1,4 +1,4 @@
-from flask import render_template, request, redirect, url_for, make_response, flash
+from flask import render_template, request, redirect, url_for, make_response, flash, Response, stream_with_context
 import datetime
 import io
 import csv
@@ -19,6 +19,9 @@ from common.auth_util import get_remote_user
 
 TEMP_DATA_STORE = {}
 
+# CSVダウンロードで、まとめて送り出す行数
+CSV_CHUNK_ROWS = 500
+
 # ==========================================
 # ルート定義
 # ==========================================
@@ -92,13 +95,13 @@ def show_confirmation():
     center_groups = {}
 
     # ★修正2: groupbyの前に必ずソートする (センター順)
-    enriched_list.sort(key=lambda x: x['center_name'])
+    enriched_list.sort(key=lambda x: x.center_name)
 
-    for center, items_in_center in groupby(enriched_list, key=lambda x: x['center_name']):
+    for center, items_in_center in groupby(enriched_list, key=lambda x: x.center_name):
         group_list = []
         
         # サブグループ化のキー: (納品日, ベンダーCD, 部門CD)
-        sub_key = lambda x: (x['delivery_date'], x['vendor_code'], x['dept_code'])
+        sub_key = lambda x: (x.delivery_date, x.vendor_code, x.dept_code)
         
         center_items_list = list(items_in_center)
         # グループ内もソート
@@ -111,10 +114,10 @@ def show_confirmation():
             group_obj = {
                 'delivery_date': d_date,
                 'vendor_code': v_code,
-                'vendor_name': first['vendor_name'],
+                'vendor_name': first.vendor_name,
                 'dept_code': dept_code,
-                'dept_name': first['dept_name'],
-                'details': [item['detail_row'] for item in items]
+                'dept_name': first.dept_name,
+                'details': items  # VoucherLine のリスト (金額の書式は画面側で付ける)
             }
             group_list.append(group_obj)
         
@@ -123,13 +126,13 @@ def show_confirmation():
 
     # 全体集計
     global_summary = []
-    sum_key = lambda x: (x['center_name'], x['delivery_date'])
+    sum_key = lambda x: (x.center_name, x.delivery_date)
     enriched_list.sort(key=sum_key)
     
     for (center, d_date), items in groupby(enriched_list, key=sum_key):
         items = list(items)
-        jv_count = sum(item['raw_case'] for item in items if str(item['manufacturer']).startswith('JV'))
-        other_count = sum(item['raw_case'] for item in items if not str(item['manufacturer']).startswith('JV'))
+        jv_count = sum(item.cases for item in items if str(item.manufacturer).startswith('JV'))
+        other_count = sum(item.cases for item in items if not str(item.manufacturer).startswith('JV'))
         
         global_summary.append({
             'center': center,
@@ -164,7 +167,7 @@ def complete_insertion():
             return "セッション有効期限切れ、またはデータが見つかりません。最初からやり直してください。", 400
 
         # 2. 本番テーブル(dcnyu03/04等)へ登録
-        user_id = data_list[0]['user_id'] # CSV内のユーザーID
+        user_id = data_list[0].user_id # CSV内のユーザーID
         
         # ★ここで本登録実行
         result_msg = db_logic.insert_voucher_data(data_list, user_id, import_id)
@@ -236,15 +239,24 @@ def voucher_list():
         filters['delivery_date'] = datetime.date.today().strftime('%Y/%m/%d')
 
 
-    vouchers = db_logic.get_voucher_list(filters, is_export=False)
+    # 1ページ分だけ取得 (after / before はページ送りのカーソル)
+    page = db_logic.get_voucher_page(
+        filters,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        page_size=db_logic.VOUCHER_PAGE_SIZE,
+    )
     
-    # 2. ★追加: 集計データの取得 (右上の合計表示用)
+    # 2. ★追加: 集計データの取得 (右上の合計表示・総件数用)
     summary = db_logic.get_voucher_summary(filters)
 
     opts = db_logic.get_filter_options()
 
     return render_template('dc_in/voucher_list.html',
-        vouchers=vouchers,
+        vouchers=page['vouchers'],
+        next_cursor=page['next_cursor'],
+        prev_cursor=page['prev_cursor'],
+        page_size=db_logic.VOUCHER_PAGE_SIZE,
         current_filters=filters,
         batch_options=opts['batch_options'], 
         centers=opts['centers'],
@@ -271,15 +283,6 @@ def download_csv():
         }
         # (日付デフォルトロジックなど)
 
-    vouchers_list = db_logic.get_voucher_list(filters, is_export=True)
-
-    # ★追加: CSV出力ログ
-    count = len(vouchers_list)
-    write_log('dc_in', current_user_id, 'DOWNLOAD', f'一覧CSV出力: {count}件')
-
-    si = io.StringIO()
-    cw = csv.writer(si)
-    
     header = [
         '取込ID', '伝票番号', '行', 
         'センターCD', '部門CD', '部門名',
@@ -291,38 +294,62 @@ def download_csv():
         '通過FLG', '伝票FLG', 
         '登録者', '登録日', '更新日', '更新時間'
     ]
-    cw.writerow(header)
-
-    for row in vouchers_list:
-        cw.writerow([
-            row.get('batch_id', ''), # import_id -> batch_id
-            row.get('voucher_id', ''),
-            row.get('line_no', ''),
-            row.get('center', ''),      
-            row.get('dept_code', ''),
-            row.get('dept_name', ''),
-            row.get('trans_code', ''),
-            row.get('vendor_code', ''),
-            row.get('vendor', ''),
-            row.get('item_code', ''),
-            row.get('first_p_name', ''),
-            row.get('manufacturer', ''),
-            row.get('order_date', ''),
-            row.get('delivery_date', ''),
-            row.get('order_qty', 0),
-            row.get('cost_price', 0),
-            row.get('total_disc', 0),
-            row.get('fee_md', 0),
-            row.get('fee_dc', 0),
-            row.get('pass_flag', ''),
-            row.get('conf_flag', ''),
-            row.get('operator', ''),
-            row.get('reg_date', ''),
-            row.get('update_date', ''),
-            row.get('update_time', '')
-        ])
 
-    output = make_response(si.getvalue().encode('cp932', 'ignore'))
+    # ★追加: CSV出力ログ (開始はストリーミング前に、件数と完了/中断は出力の終わりに記録する)
+    write_log('dc_in', current_user_id, 'DOWNLOAD', '一覧CSV出力: 開始')
+
+    def generate():
+        # ★全件をメモリに溜めず、CSV_CHUNK_ROWS 行ごとに cp932 へ変換して送り出す
+        count = 0
+        completed = False
+        try:
+            si = io.StringIO()
+            cw = csv.writer(si)
+            cw.writerow(header)
+
+            for row in db_logic.iter_voucher_list(filters, is_export=True):
+                cw.writerow([
+                    row.get('batch_id', ''), # import_id -> batch_id
+                    row.get('voucher_id', ''),
+                    row.get('line_no', ''),
+                    row.get('center', ''),      
+                    row.get('dept_code', ''),
+                    row.get('dept_name', ''),
+                    row.get('trans_code', ''),
+                    row.get('vendor_code', ''),
+                    row.get('vendor', ''),
+                    row.get('item_code', ''),
+                    row.get('first_p_name', ''),
+                    row.get('manufacturer', ''),
+                    row.get('order_date', ''),
+                    row.get('delivery_date', ''),
+                    row.get('order_qty', 0),
+                    row.get('cost_price', 0),
+                    row.get('total_disc', 0),
+                    row.get('fee_md', 0),
+                    row.get('fee_dc', 0),
+                    row.get('pass_flag', ''),
+                    row.get('conf_flag', ''),
+                    row.get('operator', ''),
+                    row.get('reg_date', ''),
+                    row.get('update_date', ''),
+                    row.get('update_time', '')
+                ])
+                count += 1
+
+                if count % CSV_CHUNK_ROWS == 0:
+                    yield si.getvalue().encode('cp932', 'ignore')
+                    si.seek(0)
+                    si.truncate(0)
+
+            yield si.getvalue().encode('cp932', 'ignore')
+            completed = True
+        finally:
+            # クライアントが途中で切断した場合も、そこまでに書き出した件数を残す
+            status = '完了' if completed else '中断'
+            write_log('dc_in', current_user_id, 'DOWNLOAD', f'一覧CSV出力: {count}件 ({status})')
+
+    output = Response(stream_with_context(generate()), mimetype="text/csv")
     output.headers["Content-Disposition"] = "attachment; filename=dc_voucher_list.csv"
     output.headers["Content-type"] = "text/csv"
     return output
@@ -16,6 +16,7 @@ from common.hacfl_db_logic import (
     get_product_info_by_cd,     # (API用) 商品情報取得
     MODE_CONFIG                 # モード定義辞書
 )
+from common.master_lookup import lookup_store_names, lookup_product_infos
 
 # ---------------------------------------------------
 # 1. テンプレートCSVダウンロード機能
@@ -136,23 +137,65 @@ def index():
 # ===================================================
 #  非同期通信用API
 # ===================================================
+# ブラウザ側でも問い合わせ結果を使い回してよい時間(秒)
+LOOKUP_BROWSER_MAX_AGE = 300
+# 1回の一括問い合わせで受け付けるコード数の上限
+LOOKUP_MAX_CODES = 200
+
+
+def _lookup_response(payload, all_found):
+    """
+    ETag・Cache-Control を付けた JSON を返す (同じ内容なら 304)。
+    マスタに無いコードを含む時は、登録後すぐ見えるようブラウザには保存させず毎回確認させる。
+    """
+    resp = jsonify(payload)
+    if all_found:
+        resp.headers["Cache-Control"] = f"private, max-age={LOOKUP_BROWSER_MAX_AGE}"
+    else:
+        resp.headers["Cache-Control"] = "private, no-cache"
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+
 @hacfl_bp.route('/api/get_store_name')
 def api_get_store_name():
     cucd = request.args.get('cucd')
     name = get_store_name_by_cd(cucd)
     if name:
-        return jsonify({'found': True, 'name': name})
+        return _lookup_response({'found': True, 'name': name}, True)
     else:
-        return jsonify({'found': False})
+        return _lookup_response({'found': False}, False)
 
 @hacfl_bp.route('/api/get_product_info')
 def api_get_product_info():
     cocd = request.args.get('cocd')
     info = get_product_info_by_cd(cocd)
     if info:
-        return jsonify({'found': True, 'info': info})
+        return _lookup_response({'found': True, 'info': info}, True)
     else:
-        return jsonify({'found': False})
+        return _lookup_response({'found': False}, False)
+
+@hacfl_bp.route('/api/lookup')
+def api_lookup():
+    """
+    店舗CD・商品CDをまとめて引く。
+      ?cucd=111,112&cocd=12345678,23456789
+    → {"stores": {"111": "店舗名" or null, ...}, "products": {"12345678": {...} or null, ...}}
+    """
+    cucds = [c.strip() for c in request.args.get('cucd', '').split(',') if c.strip()]
+    cocds = [c.strip() for c in request.args.get('cocd', '').split(',') if c.strip()]
+    if len(cucds) + len(cocds) > LOOKUP_MAX_CODES:
+        return jsonify({'error': f'一度に問い合わせできるコードは{LOOKUP_MAX_CODES}件までです'}), 400
+
+    try:
+        stores = lookup_store_names(cucds) if cucds else {}
+        products = lookup_product_infos(cocds) if cocds else {}
+    except Exception as e:
+        print(f"[WARNING] マスタ検索に失敗しました: {e}")
+        return jsonify({'error': 'マスタ検索に失敗しました'}), 500
+
+    all_found = all(v is not None for v in stores.values()) and all(v is not None for v in products.values())
+    return _lookup_response({'stores': stores, 'products': products}, all_found)
 
 @hacfl_bp.route('/api/check_mode_time')
 def api_check_mode_time():
@@ -17,6 +17,8 @@ from tools import tools_bp
 from auth import auth_bp    # 社員番号と店舗CDでログイン認証
 from dc_in import dc_in_bp
 
+from common.db_connection import init_app as init_db_connection
+
 class PrefixMiddleware(object):
     def __init__(self, app, prefix=''):
         self.app = app
@@ -45,6 +47,9 @@ app.secret_key = "secret_key_12345"
 
 app.wsgi_app = PrefixMiddleware(app.wsgi_app, prefix='/flask')
 
+# リクエスト中に共有したDB接続を、リクエスト終了時にプールへ返す
+init_db_connection(app)
+
 # Blueprint登録（URLプレフィックスごとに分ける）
 app.register_blueprint(autosupply_bp, url_prefix='/autosupply_web')
 app.register_blueprint(cart_bp, url_prefix="/cart_stay_register")
@@ -0,0 +1,39 @@
+"""
+tests/conftest.py
+-----------------
+pytest 用の共通部品。
+
+DBは bench/_sqlite_odbc.py の SQLite (メモリ上) に差し替える。
+common 配下のモジュールは import 時に pyodbc を読むので、テストモジュールより先にここで差し込む。
+"""
+
+import os
+import sys
+
+import pytest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+if BENCH_DIR not in sys.path:
+    sys.path.insert(0, BENCH_DIR)
+
+from _sqlite_odbc import install  # noqa: E402
+
+FAKE_ODBC = install(0)
+
+
+@pytest.fixture
+def fake_db():
+    """SQLite に差し替えたDB。テストの後で作ったテーブルを全て消す"""
+    from common.db_connection import close_all_pools
+
+    close_all_pools()
+    FAKE_ODBC.reset_stats()
+    yield FAKE_ODBC
+    close_all_pools()
+    raw = FAKE_ODBC._keeper.raw
+    raw.rollback()
+    for schema in ("main", "DBA"):
+        tables = raw.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'").fetchall()
+        for (name,) in tables:
+            raw.execute(f"DROP TABLE {schema}.{name}")
+    raw.commit()
@@ -0,0 +1,91 @@
+"""
+cart_result の実績表示API (get_data) のテスト (SQLite)
+"""
+
+import json
+from datetime import timedelta
+
+import pytest
+
+from _cart_result_data import fiscal_start, setup_cart_result
+
+YEAR = 2025
+
+
+@pytest.fixture
+def client(fake_db):
+    from flask import Flask
+
+    from cart_result import cart_result_bp
+    from common.cart_stay_cache import get_cart_stay_cache
+    from common.db_connection import init_app
+    from common.store_master import invalidate_store_master
+
+    setup_cart_result(fake_db, YEAR, shops=15, fill_ratio=0.7)
+    # NULL の区分・マスタに無い店舗の行
+    raw = fake_db._keeper.raw
+    raw.execute("UPDATE DBA.CartStayCount SET count = NULL WHERE cucd = 'B01' AND catcd = 2")
+    raw.execute("INSERT INTO DBA.CartStayCount (cucd, idleDate, catcd, count) VALUES ('999', ?, 3, 4)",
+                (fiscal_start(YEAR) + timedelta(days=2),))
+    raw.commit()
+    invalidate_store_master()
+    get_cart_stay_cache().invalidate()
+
+    app = Flask(__name__)
+    app.register_blueprint(cart_result_bp, url_prefix="/cart_result")
+    init_app(app)
+    return app.test_client()
+
+
+def _query(**extra):
+    start = fiscal_start(YEAR)
+    q = {"start_date": str(start), "end_date": str(start + timedelta(days=9)), "disp_type": "total"}
+    q.update(extra)
+    return q
+
+
+def _expected_rows(fake_db, q):
+    """従来の get_data と同じ考え方で、(店舗, 日) ごとの行を CartStayCount から作る"""
+    rows = fake_db._keeper.raw.execute(
+        "SELECT cucd, idleDate, catcd, count FROM DBA.CartStayCount WHERE idleDate BETWEEN ? AND ?",
+        (q["start_date"], q["end_date"]),
+    ).fetchall()
+    recs = {}
+    for cucd, idle_date, catcd, count in rows:
+        rec = recs.setdefault((cucd, str(idle_date)[:10]), {f"cat{c}": 0 for c in range(1, 5)})
+        rec[f"cat{catcd}"] = count or 0
+    out = {}
+    for (cucd, ymd), rec in recs.items():
+        if q["disp_type"] == "total":
+            value = sum(rec.values())
+        else:
+            value = rec[f"cat{q['disp_type']}"]
+        out[(cucd, ymd)] = dict(rec, cucd=cucd, date=ymd, value=value)
+    return out
+
+
+@pytest.mark.parametrize("disp_type", ["total", "2"])
+def test_default_response_keeps_row_shape(client, fake_db, disp_type):
+    q = _query(disp_type=disp_type)
+    resp = client.post("/cart_result/get_data", data=q)
+    assert resp.status_code == 200
+
+    body = json.loads(resp.data)
+    assert list(body) == ["result"]
+    got = {(r["cucd"], r["date"]): r for r in body["result"]}
+    assert len(got) == len(body["result"])
+    assert got == _expected_rows(fake_db, q)
+    assert ("999", str(fiscal_start(YEAR) + timedelta(days=2))) in got
+
+
+def test_columns_format_and_week_unit(client):
+    body = json.loads(client.post("/cart_result/get_data", data=_query(format="columns")).data)
+    assert body["unit"] == "day" and len(body["dates"]) == 10
+    assert body["grand_total"] == sum(body["daily_totals"])
+
+    resp = client.post("/cart_result/get_data", data=_query(unit="week"))
+    assert resp.status_code == 400
+    resp = client.post("/cart_result/get_data", data=_query(unit="week", format="columns"))
+    assert resp.status_code == 200 and json.loads(resp.data)["unit"] == "week"
+
+    assert client.post("/cart_result/get_data", data=_query(format="xml")).status_code == 400
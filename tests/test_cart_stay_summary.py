@@ -0,0 +1,136 @@
+"""
+common/cart_stay_summary.py と、それを読む cart_result のテスト (SQLite)
+"""
+
+from datetime import timedelta
+
+import pytest
+
+from _cart_result_data import fiscal_start, setup_cart_result
+
+YEAR = 2025
+
+
+@pytest.fixture
+def summary_db(fake_db, monkeypatch):
+    """年度分の CartStayCount と、rebuild 済みの集計テーブル"""
+    from common import cart_stay_summary
+
+    setup_cart_result(fake_db, YEAR, shops=20)
+    cart_stay_summary.create_summary_tables()
+    start = fiscal_start(YEAR) - timedelta(days=7)
+    cart_stay_summary.rebuild_summary(start, fiscal_start(YEAR + 1) - timedelta(days=1))
+    monkeypatch.setattr(cart_stay_summary, "SUMMARY_ENABLED", True)
+    return fake_db
+
+
+def _raw_and_summary(fn, *args):
+    from common import cart_stay_summary
+    from common.db_connection import get_connection
+
+    with get_connection("SQLS08-14") as conn:
+        summary = sorted(fn(conn.cursor(), *args))
+        cart_stay_summary.SUMMARY_ENABLED = False
+        try:
+            raw = sorted(fn(conn.cursor(), *args))
+        finally:
+            cart_stay_summary.SUMMARY_ENABLED = True
+    return raw, summary
+
+
+def test_rebuild_matches_raw_totals(summary_db):
+    from common import cart_stay_summary
+
+    start = fiscal_start(YEAR)
+    raw, summary = _raw_and_summary(cart_stay_summary.fetch_daily_totals, start, start + timedelta(days=60))
+    assert raw == summary and len(raw) == 61 * 4
+
+    raw, summary = _raw_and_summary(cart_stay_summary.fetch_week_totals, start, start + timedelta(days=27))
+    assert raw == summary and raw
+
+
+def test_apply_count_change_keeps_summary_in_sync(summary_db):
+    from common import cart_stay_summary
+    from common.db_connection import get_connection
+
+    day = fiscal_start(YEAR) + timedelta(days=10)
+    with get_connection("SQLS08-14") as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT catcd, count FROM CartStayCount WHERE cucd = 'B01' AND idleDate = ?", (day,))
+        old = {int(catcd): count for catcd, count in cur.fetchall()}
+        new = {1: (old.get(1) or 0) + 5, 2: 0, 3: old.get(3), 4: (old.get(4) or 0) + 1}
+
+        cur.execute("DELETE FROM CartStayCount WHERE cucd = 'B01' AND idleDate = ?", (day,))
+        for catcd, count in new.items():
+            cur.execute("INSERT INTO CartStayCount (cucd, idleDate, catcd, count) VALUES ('B01', ?, ?, ?)",
+                        (day, catcd, count))
+        cart_stay_summary.apply_count_change(cur, "B01", day, old, new)
+        # 初めて登録する店舗 (集計の行がまだ無い)
+        cur.execute("INSERT INTO CartStayCount (cucd, idleDate, catcd, count) VALUES ('999', ?, 2, 7)", (day,))
+        cart_stay_summary.apply_count_change(cur, "999", day, {}, {2: 7})
+        conn.commit()
+
+    raw, summary = _raw_and_summary(cart_stay_summary.fetch_daily_totals, day, day)
+    assert raw == summary
+    week_s = fiscal_start(YEAR) + timedelta(days=7)
+    raw, summary = _raw_and_summary(cart_stay_summary.fetch_week_totals, week_s, week_s + timedelta(days=6))
+    assert raw == summary
+    assert any(cucd == "999" for cucd, *rest in summary)
+
+
+def test_export_pivot_reads_previous_week_totals_from_summary(summary_db):
+    from cart_result import db
+    from cart_result.app import load_pivot_for_days
+    from common import cart_stay_summary
+    from common.db_connection import get_connection
+
+    days = db.get_period_calendar(fiscal_start(YEAR), fiscal_start(YEAR) + timedelta(days=13))
+    dates = [d for weekno, d in days]
+    shops = [f"B{i:02d}" for i in range(1, 11)] + ["100", "B78"]
+
+    cart_stay_summary.SUMMARY_ENABLED = False
+    expected = load_pivot_for_days(days)
+    cart_stay_summary.SUMMARY_ENABLED = True
+
+    # 前週分の CartStayCount を消しても、合計は集計テーブルから読むので同じ値になる
+    with get_connection("SQLS08-14") as conn:
+        conn.cursor().execute("DELETE FROM CartStayCount WHERE idleDate < ?", (dates[0],))
+        conn.commit()
+    pivot = load_pivot_for_days(days)
+
+    sel, exp_sel = pivot.select(shops, dates), expected.select(shops, dates)
+    prev = sel.prev_week_dates()
+    assert (pivot.day_totals(prev) == expected.day_totals(prev)).all()
+    for kbn_no in (1, 2, 3, 4, "total"):
+        assert sel.rendered(kbn_no) == exp_sel.rendered(kbn_no)
+        assert sel.summary(kbn_no, pivot.day_totals(prev)) == exp_sel.summary(kbn_no, expected.day_totals(prev))
+
+
+def test_export_version_uses_rgtm_index_and_summary(summary_db):
+    from cart_result import db
+    from common import cart_stay_summary
+    from common.db_connection import get_connection
+
+    start, end = fiscal_start(YEAR), fiscal_start(YEAR + 1) - timedelta(days=1)
+    plan = summary_db._keeper.raw.execute("EXPLAIN QUERY PLAN SELECT MAX(rgtm) FROM DBA.CartStayCount").fetchall()
+    assert "ix_CartStayCount_rgtm" in str(plan)
+
+    version = db.fetch_cart_stay_version(start, end)
+    assert db.fetch_cart_stay_version(start, end) == version
+
+    # 登録画面の修正 (rgtm を更新する)
+    with get_connection("SQLS08-14") as conn:
+        conn.cursor().execute(
+            "UPDATE CartStayCount SET count = count + 1, rgtm = '2025-06-01 10:00:00' "
+            "WHERE cucd = 'B01' AND idleDate = ? AND catcd = 1", (start,))
+        conn.commit()
+    edited = db.fetch_cart_stay_version(start, end)
+    assert edited != version
+
+    # rgtm を付けない書き込みも、rebuild 後は集計テーブルの合計で版が変わる
+    with get_connection("SQLS08-14") as conn:
+        conn.cursor().execute("UPDATE CartStayCount SET count = count + 3 WHERE cucd = 'B02' AND idleDate = ?", (start,))
+        conn.commit()
+    assert db.fetch_cart_stay_version(start, end) == edited
+    cart_stay_summary.rebuild_summary(start, start)
+    assert db.fetch_cart_stay_version(start, end) != edited
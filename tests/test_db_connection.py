@@ -0,0 +1,140 @@
+"""common/db_connection.py (リクエスト内の接続共有) のテスト"""
+
+import pytest
+from flask import Flask
+
+from common.db_connection import get_connection, release_request_connections
+
+
+@pytest.fixture
+def app(fake_db):
+    raw = fake_db._keeper.raw
+    raw.execute("CREATE TABLE DBA.t (a INTEGER)")
+    raw.commit()
+    app = Flask(__name__)
+    return app
+
+
+def _rows(fake_db):
+    return [r[0] for r in fake_db._keeper.raw.execute("SELECT a FROM DBA.t ORDER BY a").fetchall()]
+
+
+def _insert(conn, value):
+    conn.cursor().execute("INSERT INTO DBA.t VALUES (?)", (value,))
+
+
+def test_sequential_users_share_one_connection(app, fake_db):
+    with app.app_context():
+        with get_connection("master") as conn:
+            _insert(conn, 1)
+        with get_connection("master") as conn:
+            _insert(conn, 2)
+        release_request_connections()
+    assert _rows(fake_db) == [1, 2]
+    assert fake_db.stats["connects"] == 1
+
+
+def test_nested_with_does_not_commit_the_callers_work(app, fake_db):
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            with get_connection("master") as conn:
+                _insert(conn, 1)
+                with get_connection("master") as inner:   # キャッシュの読み込みなど
+                    inner.cursor().execute("SELECT 1")
+                raise RuntimeError("boom")
+        release_request_connections()
+    assert _rows(fake_db) == []
+
+
+def test_nested_commit_is_deferred_to_the_owner(app, fake_db):
+    with app.app_context():
+        outer = get_connection("master")
+        _insert(outer, 1)
+
+        inner = get_connection("master")
+        _insert(inner, 2)
+        inner.commit()          # まだ確定しない
+        inner.close()
+
+        outer.rollback()        # owner が取り消せば、入れ子の分も取り消される
+        outer.close()
+        release_request_connections()
+    assert _rows(fake_db) == []
+
+
+def test_nested_commit_is_applied_when_the_owner_just_closes(app, fake_db):
+    with app.app_context():
+        reader = get_connection("master")
+        reader.cursor().execute("SELECT COUNT(*) FROM DBA.t")
+
+        with get_connection("master") as writer:   # delete_work_table などのヘルパー
+            _insert(writer, 1)
+            writer.commit()
+
+        reader.close()
+        release_request_connections()
+    assert _rows(fake_db) == [1]
+
+
+def test_nested_rollback_makes_the_owner_commit_fail(app, fake_db):
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            with get_connection("master") as conn:
+                _insert(conn, 1)
+                inner = get_connection("master")
+                _insert(inner, 2)
+                inner.rollback()
+                inner.close()
+        release_request_connections()
+    assert _rows(fake_db) == []
+
+
+def test_nested_user_cannot_change_autocommit(app):
+    with app.app_context():
+        with get_connection("master"):
+            inner = get_connection("master")
+            inner.autocommit = False   # 同じ値なら何もしない
+            with pytest.raises(RuntimeError):
+                inner.autocommit = True
+            inner.close()
+        release_request_connections()
+
+
+def test_leaked_owner_does_not_lose_later_commits(app, fake_db):
+    with app.app_context():
+        leaked = get_connection("master")        # close し忘れ
+        leaked.cursor().execute("SELECT 1")
+
+        with get_connection("master") as conn:   # 入れ子扱いになる
+            _insert(conn, 1)
+        release_request_connections()            # リクエスト終了時に確定する
+    assert _rows(fake_db) == [1]
+
+
+def test_leaked_owner_is_rolled_back_when_the_request_failed(app, fake_db):
+    with app.app_context():
+        leaked = get_connection("master")
+        with get_connection("master") as conn:
+            _insert(conn, 1)
+        release_request_connections(RuntimeError("request failed"))
+    assert _rows(fake_db) == []
+    del leaked
+
+
+def test_opt_out_gets_its_own_transaction(app, fake_db):
+    with app.app_context():
+        shared = get_connection("master")
+        shared.cursor().execute("SELECT COUNT(*) FROM DBA.t")
+
+        # SQLite は同時に1つしか書けないので、共有側の書き込みより先に確定させる
+        own = get_connection("master", shared=False)
+        _insert(own, 2)
+        own.commit()
+        own.close()
+
+        _insert(shared, 1)
+        shared.rollback()      # 専用接続で確定した分は取り消されない
+        shared.close()
+        release_request_connections()
+    assert _rows(fake_db) == [2]
+    assert fake_db.stats["connects"] == 2
@@ -0,0 +1,183 @@
+"""
+common/db_pool.py のテスト (接続は connect_func をフェイクに差し替える)
+"""
+
+import threading
+import time
+
+import pytest
+
+from common.db_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeRaw:
+    """pyodbc.Connection のうち、プールが使う分だけのフェイク"""
+
+    def __init__(self, factory, number):
+        self.factory = factory
+        self.number = number
+        self.alive = True
+        self.closed = False
+        self.autocommit = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pool = self.factory.pool
+        # 切断はプールのロックの外で行うこと
+        self.factory.closed_under_lock |= pool is not None and pool._cond._is_owned()
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, raw):
+        self.raw = raw
+
+    def execute(self, sql):
+        self.raw.factory.pings += 1
+        if not self.raw.alive:
+            raise ConnectionError("通信リンクエラー")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnect:
+    def __init__(self):
+        self.created = []
+        self.pings = 0
+        self.pool = None
+        self.closed_under_lock = False
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise ConnectionError("接続できません")
+        raw = FakeRaw(self, len(self.created))
+        self.created.append(raw)
+        return raw
+
+
+def make_pool(**options):
+    connect = FakeConnect()
+    pool = ConnectionPool(connect, name="test", **options)
+    connect.pool = pool
+    return pool, connect
+
+
+def test_checkout_reuses_returned_connection():
+    pool, connect = make_pool(max_size=2)
+
+    conn = pool.acquire()
+    first = conn.raw
+    conn.close()
+    with pool.acquire() as again:
+        assert again.raw is first
+
+    snap = pool.snapshot()
+    assert (snap["creations"], snap["reuses"], snap["checkouts"]) == (1, 1, 2)
+    assert snap["idle"] == 1 and snap["in_use"] == 0
+    assert first.rollbacks >= 1          # 返却時に未コミット分を破棄する
+    with pytest.raises(RuntimeError):
+        conn.cursor()                    # 返却済みの接続は使えない
+
+
+def test_dead_connection_is_replaced_after_ping():
+    pool, connect = make_pool(max_size=2, check_after=0)
+
+    conn = pool.acquire()
+    dead = conn.raw
+    conn.close()
+    dead.alive = False
+
+    conn = pool.acquire()
+    assert conn.raw is not dead and dead.closed
+    assert pool.stats["ping_failures"] == 1 and pool.stats["creations"] == 2
+    conn.close()
+    assert not connect.closed_under_lock
+
+
+def test_recent_connection_skips_ping():
+    pool, connect = make_pool(check_after=30)
+    pool.acquire().close()
+    pool.acquire().close()
+    assert connect.pings == 0
+
+
+def test_waits_for_release_then_times_out():
+    pool, connect = make_pool(max_size=1, wait_timeout=2)
+    held = pool.acquire()
+
+    threading.Timer(0.1, held.close).start()
+    started = time.monotonic()
+    conn = pool.acquire()                # 返却されるまで待つ
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats["waits"] == 1
+
+    pool.wait_timeout = 0.05
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats["timeouts"] == 1
+    conn.close()
+
+
+def test_idle_connections_are_evicted_down_to_min_size():
+    pool, connect = make_pool(min_size=1, max_size=3, idle_timeout=0.05)
+    conns = [pool.acquire() for _ in range(3)]
+    for conn in conns:
+        conn.close()
+    assert pool.snapshot()["idle"] == 3
+
+    time.sleep(0.1)
+    pool.acquire().close()               # 貸出・返却のついでに破棄する
+
+    snap = pool.snapshot()
+    assert snap["evictions"] == 2 and snap["idle"] == 1
+    assert sum(raw.closed for raw in connect.created) == 2
+    assert not connect.closed_under_lock
+
+
+def test_fill_creates_min_size_connections():
+    pool, connect = make_pool(min_size=2, max_size=5)
+    pool.fill()
+    assert pool.snapshot()["idle"] == 2 and len(connect.created) == 2
+
+    pool.fill()                          # 既に min_size あれば何もしない
+    assert len(connect.created) == 2
+
+    with pool.acquire():
+        pass
+    assert pool.stats["creations"] == 2 and pool.stats["reuses"] == 1
+
+
+def test_fill_failure_is_deferred_to_acquire(capsys):
+    pool, connect = make_pool(min_size=1)
+    connect.fail = True
+    pool.fill()
+    assert "事前接続に失敗" in capsys.readouterr().out
+
+    with pytest.raises(ConnectionError):
+        pool.acquire()
+    connect.fail = False
+    pool.acquire().close()
+    assert pool.snapshot()["idle"] == 1
+
+
+def test_broken_release_discards_connection():
+    pool, connect = make_pool()
+    conn = pool.acquire()
+    raw = conn.raw
+    conn.discard()
+    assert raw.closed and pool.stats["discards"] == 1
+    assert pool.snapshot()["in_use"] == 0
@@ -0,0 +1,128 @@
+"""common/logger.py (WeblogWriter) のテスト"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from common import logger
+
+WEBLOG_DDL = """
+    CREATE TABLE DBA.weblog (log_dt TIMESTAMP, user_id TEXT, client_ip TEXT, module TEXT,
+                             action TEXT, msg TEXT CHECK (length(msg) <= 20))
+"""
+
+
+@pytest.fixture
+def weblog(fake_db, tmp_path):
+    raw = fake_db._keeper.raw
+    raw.execute(WEBLOG_DDL)
+    raw.commit()
+    paths = {"spool": str(tmp_path / "spool.jsonl"), "reject": str(tmp_path / "rejected.jsonl")}
+    yield raw, paths
+
+
+def _writer(paths, **kwargs):
+    return logger.WeblogWriter(spool_path=paths["spool"], reject_path=paths["reject"],
+                               flush_interval=0.1, **kwargs)
+
+
+def _row(i, msg="ok"):
+    return (datetime(2025, 4, 1, 9, 0, 0, i), "u1", "127.0.0.1", "test", "action", f"{msg}{i}")
+
+
+def _write_spool(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(logger._to_json(r), ensure_ascii=False) + "\n")
+
+
+def _count(raw):
+    return raw.execute("SELECT COUNT(*) FROM DBA.weblog").fetchone()[0]
+
+
+def test_flush_waits_until_rows_are_written(weblog):
+    raw, paths = weblog
+    w = _writer(paths)
+    for i in range(5):
+        w.write(_row(i))
+    w.flush(timeout=5)
+    try:
+        assert _count(raw) == 5
+        assert w.get_metrics()["written"] == 5
+    finally:
+        w.stop()
+
+
+def test_bad_row_is_rejected_without_blocking_the_batch(weblog):
+    raw, paths = weblog
+    w = _writer(paths)
+    w.write(_row(1))
+    w.write(_row(2, msg="x" * 30))
+    w.write(_row(3))
+    w.flush(timeout=5)
+    try:
+        assert _count(raw) == 2
+        metrics = w.get_metrics()
+        assert metrics["rejected"] == 1 and metrics["spooled"] == 0
+        with open(paths["reject"], encoding="utf-8") as f:
+            assert len(f.readlines()) == 1
+    finally:
+        w.stop()
+
+
+def test_two_writers_sharing_a_spool_replay_each_row_once(weblog):
+    raw, paths = weblog
+    rows = [_row(i) for i in range(500)]
+    _write_spool(paths["spool"], rows)
+
+    writers = [_writer(paths, batch_size=50) for _ in range(2)]
+    errors = []
+
+    def replay(w):
+        try:
+            w._replay()
+        except Exception as e:  # ワーカースレッドなら止まってしまう例外
+            errors.append(e)
+
+    threads = [threading.Thread(target=replay, args=(w,)) for w in writers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert _count(raw) == 500
+    assert sum(w.get_metrics()["replayed"] for w in writers) == 500
+    assert os.listdir(os.path.dirname(paths["spool"])) == []
+
+
+def test_replay_skips_files_claimed_by_another_writer(weblog):
+    raw, paths = weblog
+    other = _writer(paths)
+    mine = _writer(paths)
+
+    _write_spool(paths["spool"], [_row(i) for i in range(3)])
+    assert other._claim(paths["spool"])
+
+    mine._replay()
+    assert _count(raw) == 0
+
+    other._replay()
+    assert _count(raw) == 3
+
+
+def test_orphaned_replay_file_is_taken_over(weblog, monkeypatch):
+    raw, paths = weblog
+    dead = _writer(paths)
+    _write_spool(paths["spool"], [_row(i) for i in range(3)])
+    assert dead._claim(paths["spool"])
+    orphan = dead._replay_files()[0]
+    old = os.path.getmtime(orphan) - logger.LOG_ORPHAN_REPLAY_AGE - 1
+    os.utime(orphan, (old, old))
+
+    _writer(paths)._replay()
+    assert _count(raw) == 3
+    assert not os.path.exists(orphan)
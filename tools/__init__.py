@@ -56,4 +56,69 @@ def module_list():
         html += f"<tr><td><b>{m['name']}</b></td><td>{m['version']}</td><td>{m['author']}</td><td>{m['desc']}</td></tr>"
     
     html += "</table>"
-    return html
\ No newline at end of file
+    return html
+
+@tools_bp.route('/runtime_status')
+def runtime_status():
+    """DB接続プール・ログ書き込み・DB時計の状態をJSONで返す (運用確認用)"""
+    from flask import jsonify
+    from common.db_connection import get_pool_stats
+    from common.db_clock import get_clock_status
+    from common.logger import get_log_metrics
+    from common.store_master import get_store_master_status
+    from cart_result.fiscal_calendar import get_fiscal_calendar_status
+    from common.cart_stay_cache import get_cart_stay_cache_status
+    from cart_result.export_jobs import get_export_job_status
+    from common.dc_in_db_logic import get_sequence_lock_stats
+    from common.hacfl_validation import get_master_codes_status
+    from common.master_lookup import get_master_lookup_status
+
+    return jsonify({
+        "db_pools": get_pool_stats(),
+        "weblog": get_log_metrics(),
+        "db_clocks": get_clock_status(),
+        "store_master": get_store_master_status(),
+        "fiscal_calendar": get_fiscal_calendar_status(),
+        "cart_stay_results": get_cart_stay_cache_status(),
+        "cart_result_exports": get_export_job_status(),
+        "dc_in_sequence_lock": get_sequence_lock_stats(),
+        "hacfl_master_codes": get_master_codes_status(),
+        "master_lookup": get_master_lookup_status(),
+    })
+
+@tools_bp.route('/store_master/refresh', methods=['POST'])
+def store_master_refresh():
+    """
+    店舗マスタのキャッシュを今すぐ読み直す (Cusmf04 / closemf04 修正後の即時反映用)
+    hacfl のマスタ存在チェック (cusmf04 / comf1) と、店舗名・商品情報の検索結果のキャッシュも捨てる
+    読み直すのはこのリクエストを受けたプロセスだけ。他のワーカープロセスは STORE_MASTER_TTL 秒以内に読み直す
+    """
+    from flask import jsonify
+    from common.store_master import refresh_store_master, STORE_MASTER_TTL
+    from common.hacfl_validation import invalidate_master_codes
+    from common.master_lookup import invalidate_master_lookup
+
+    invalidate_master_codes()
+    invalidate_master_lookup()
+    try:
+        return jsonify({
+            "ok": True,
+            "status": refresh_store_master(),
+            "note": f"このプロセス (pid {os.getpid()}) だけ読み直しました。"
+                    f"他のワーカープロセスは最大 {STORE_MASTER_TTL} 秒後に反映されます。",
+        })
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+@tools_bp.route('/fiscal_calendar/invalidate', methods=['POST'])
+def fiscal_calendar_invalidate():
+    """
+    年度カレンダー (weekno2) のキャッシュを捨てる。year=2025 を渡すとその年だけ
+    キャッシュを変更するので POST のみ (リンクの先読みやクローラーで消されないように)
+    """
+    from flask import jsonify, request
+    from cart_result.fiscal_calendar import invalidate_fiscal_calendar, get_fiscal_calendar_status
+
+    year = request.values.get("year", type=int)
+    invalidate_fiscal_calendar(year)
+    return jsonify({"ok": True, "status": get_fiscal_calendar_status()})